@@ -0,0 +1,169 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class Rejected(Exception):
+    # Raised instead of admitting a request; retry_after is a whole number of seconds
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBuckets:
+    """Per-key token buckets: rate tokens a second, holding at most burst.
+
+    Keys are kept for the least recently seen max_keys callers; a key that
+    is dropped simply starts again with a full bucket.
+    """
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self._rate = rate
+        self._burst = burst
+        self._max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def take(self, key):
+        """Take a token for key; returns 0 if one was available, else seconds until one is."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self._burst, now))
+            tokens = min(self._burst, tokens + (now - updated) * self._rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                self.limited += 1
+                wait = (1 - tokens) / self._rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def stats(self):
+        with self._lock:
+            return {'keys': len(self._buckets), 'limited': self.limited}
+
+
+class _Gate:
+    # Bookkeeping shared by the thread and asyncio gates
+
+    def __init__(self, max_concurrent, max_queue, max_wait):
+        self._max_concurrent = max_concurrent
+        self._max_queue = max_queue
+        self._max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._avg_hold = None
+
+    def _reject(self, reason):
+        self.rejected += 1
+        # Roughly when a slot frees up for a caller at the back of the queue
+        hold = self._avg_hold if self._avg_hold is not None else self._max_wait
+        return Rejected(reason, hold * (self.waiting + 1) / self._max_concurrent)
+
+    def _admit(self):
+        self.active += 1
+        self.admitted += 1
+        return time.monotonic()
+
+    def _leave(self, started):
+        self.active -= 1
+        held = time.monotonic() - started
+        self._avg_hold = held if self._avg_hold is None else 0.9 * self._avg_hold + 0.1 * held
+
+    def _stats(self):
+        return {
+            'active': self.active,
+            'waiting': self.waiting,
+            'max_concurrent': self._max_concurrent,
+            'max_queue': self._max_queue,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'avg_hold_seconds': round(self._avg_hold or 0.0, 3),
+        }
+
+
+class AdmissionGate(_Gate):
+    """Lets at most max_concurrent callers in at once.
+
+    Up to max_queue more wait, each for at most max_wait seconds; anyone
+    beyond that, or still waiting at the deadline, gets Rejected. acquire()
+    returns a ticket to hand back to release().
+    """
+
+    def __init__(self, max_concurrent=8, max_queue=16, max_wait=2.0):
+        super().__init__(max_concurrent, max_queue, max_wait)
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            if self.active < self._max_concurrent and not self.waiting:
+                return self._admit()
+            if self.waiting >= self._max_queue:
+                raise self._reject('queue full')
+            deadline = time.monotonic() + self._max_wait
+            self.waiting += 1
+            try:
+                while self.active >= self._max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._reject('timed out waiting for a slot')
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            return self._admit()
+
+    def release(self, ticket):
+        with self._cond:
+            self._leave(ticket)
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return self._stats()
+
+
+class AsyncAdmissionGate(_Gate):
+    # AdmissionGate for coroutines on one event loop
+
+    def __init__(self, max_concurrent=8, max_queue=16, max_wait=2.0):
+        super().__init__(max_concurrent, max_queue, max_wait)
+        self._cond = None
+
+    async def acquire(self):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            if self.active < self._max_concurrent and not self.waiting:
+                return self._admit()
+            if self.waiting >= self._max_queue:
+                raise self._reject('queue full')
+            deadline = time.monotonic() + self._max_wait
+            self.waiting += 1
+            try:
+                while self.active >= self._max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._reject('timed out waiting for a slot')
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self.waiting -= 1
+            return self._admit()
+
+    async def release(self, ticket):
+        async with self._cond:
+            self._leave(ticket)
+            self._cond.notify()
+
+    def stats(self):
+        return self._stats()
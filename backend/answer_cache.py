@@ -0,0 +1,166 @@
+import random
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_WHITESPACE = re.compile(r'\s+')
+
+# Prompts that mention the user, concrete numbers or contact details are never cached or served
+_PERSONAL = re.compile(
+    r"\b(i|i'm|im|i've|ive|i'd|me|my|mine|myself|we|our|us)\b"
+    r"|\d+\s*(mg|kg|lbs?|pounds?|g|cal|kcal|steps?|oz|ml|units?|years?|yrs?)\b"
+    r"|[\w.+-]+@[\w-]+\.[\w.]+"
+    r"|\+?\d[\d\s().-]{7,}\d",
+    re.IGNORECASE,
+)
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize(prompt):
+    text = _PUNCTUATION.sub(' ', prompt.lower().replace('-', ''))
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def is_personal(prompt):
+    return bool(_PERSONAL.search(prompt))
+
+
+class AnswerCache:
+    """Near-duplicate cache of Gemini answers to generic questions.
+
+    Prompts are normalized and fingerprinted with MinHash over character
+    shingles; locality-sensitive banding finds candidates, which must then
+    clear a Jaccard similarity threshold. Entries expire after ttl seconds
+    and the least recently used are evicted past max_entries. Prompts that
+    look personal are skipped in both directions.
+    """
+
+    def __init__(self, max_entries=1000, ttl=24 * 3600, threshold=0.85, shingle_size=4,
+                 num_perm=64, bands=16, min_length=12, seed=1):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._threshold = threshold
+        self._shingle_size = shingle_size
+        self._bands = bands
+        self._rows = num_perm // bands
+        self._min_length = min_length
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._exact = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+        self._avg_latency = None
+
+    def _signature(self, text):
+        size = self._shingle_size
+        shingles = {zlib.crc32(text[i:i + size].encode()) for i in range(max(1, len(text) - size + 1))}
+        return tuple(min((a * h + b) % _PRIME & _MAX_HASH for h in shingles) for a, b in self._perms)
+
+    def _band_keys(self, signature):
+        rows = self._rows
+        return [(band, signature[band * rows:(band + 1) * rows]) for band in range(self._bands)]
+
+    def _similarity(self, left, right):
+        return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+    def _cacheable(self, prompt):
+        text = normalize(prompt)
+        if len(text) < self._min_length or is_personal(prompt):
+            return None
+        return text
+
+    def get(self, prompt):
+        """Return a cached answer for prompt or a near-duplicate of it, else None."""
+        text = self._cacheable(prompt)
+        if text is None:
+            with self._lock:
+                self.skipped += 1
+            return None
+        signature = self._signature(text)
+        now = time.monotonic()
+        with self._lock:
+            entry_id = self._exact.get(text)
+            if entry_id is None:
+                best, best_score = None, self._threshold
+                candidates = set()
+                for key in self._band_keys(signature):
+                    candidates.update(self._buckets.get(key, ()))
+                for candidate in candidates:
+                    score = self._similarity(signature, self._entries[candidate][1])
+                    if score >= best_score:
+                        best, best_score = candidate, score
+                entry_id = best
+            entry = self._entries.get(entry_id) if entry_id is not None else None
+            if entry is not None and entry[3] <= now:
+                self._remove(entry_id)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            if self._avg_latency is not None:
+                self.saved_seconds += self._avg_latency
+            return entry[2]
+
+    def observe_latency(self, seconds):
+        # Running average of Gemini round trips, credited to saved_seconds on every hit
+        with self._lock:
+            self._avg_latency = seconds if self._avg_latency is None else 0.9 * self._avg_latency + 0.1 * seconds
+
+    def put(self, prompt, answer):
+        text = self._cacheable(prompt)
+        if text is None or not answer:
+            return
+        signature = self._signature(text)
+        with self._lock:
+            if text in self._exact:
+                self._remove(self._exact[text])
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (text, signature, answer, time.monotonic() + self._ttl)
+            self._exact[text] = entry_id
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self._max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        text, signature = entry[0], entry[1]
+        if self._exact.get(text) == entry_id:
+            del self._exact[text]
+        for key in self._band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'skipped': self.skipped,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'saved_seconds': round(self.saved_seconds, 3),
+            }
@@ -1,55 +1,445 @@
 import os
+import atexit
+import json
+import time
+import threading
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta, timezone
 from dotenv import load_dotenv
-import google.generativeai as genai
 import logging
-from flask import Flask, request, jsonify
+from contextvars import copy_context
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify
 from flask_cors import CORS
-from supabase import create_client, Client
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+from clients import LazyClient, validate_config
+from chat_sessions import ChatSessionPool
+from chat_context import ChatContext
+from outbox import WriteOutbox
+from pagination import date_range, date_range_args, fetch_page, order_arg, page_args, page_query, select_columns
+from response_cache import ResponseCache
+from singleflight import SingleFlight
+from encoding import FastJSONProvider, compress_response, etag_variants
+from bulk import NDJSON_MIMETYPES, parse_ndjson, prepare, summarize, insert_in_chunks
+from weekly_scores import SOURCE_FIELDS, WeeklyTotals, week_start
+from series import METRICS, series, series_args
+from gamification import TABLE_STREAKS, ProgressEngine
+from food_analysis import PROMPT as FOOD_PROMPT, FoodAnalysisCache, decode_image, parse_analysis, prepare_image
+from answer_cache import AnswerCache
+from admission import AdmissionGate, Rejected, TokenBuckets
+from schemas import InvalidRow, load_schemas
+from idempotency import (IdempotencyStore, InProgress, KeyReused, MAX_KEY_LENGTH, fingerprint, should_store)
+from resilience import CallGuard, CircuitBreaker, CircuitOpen
+from metrics import (FOOD_ANALYSES, FOOD_IMAGE_BYTES, FOOD_MODEL_SECONDS, Gauge, TracedModel, TracedSupabase,
+                     observe_request, registry, start_request)
+from json_logging import configure_logging, dropped as dropped_log_records
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
-
-# Configure the Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
-
-# Initialize the chat model
-try:
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    chat = model.start_chat(history=[])
-    logger.info("Successfully initialized Gemini chat")
-except Exception as e:
-    logger.error(f"Error initializing Gemini chat: {str(e)}")
-    raise
-
-SUPABASE_URL = os.getenv('EXPO_PUBLIC_SUPABASE_URL')
-SUPABASE_ANON_KEY = os.getenv('EXPO_PUBLIC_SUPABASE_ANON_KEY')
-if not SUPABASE_URL or not SUPABASE_ANON_KEY:
-    raise ValueError("Supabase credentials not found in environment variables")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-
-app = Flask(__name__)
-CORS(app)
-
-# Data storage
-goals = []
-coach_data = []
-journey_data = []
-progress_data = []
-weight_data = []  # Store weight entries as a list
-shots_data = {}
-steps_data = []  # Store steps data as a list
-
-@app.route('/gemini-chat', methods=['POST'])
+# JSON log lines written off the request path; LOG_LEVEL, LOG_MAX_CHARS and LOG_DEBUG_SAMPLE_RATE tune it
+configure_logging()
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+
+# The Gemini and Supabase SDKs are slow to import, so both are loaded and
+# configured on first use rather than when this module is imported
+def _create_model():
+    import google.generativeai as genai
+    try:
+        genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+        model = TracedModel(genai.GenerativeModel(GEMINI_MODEL))
+        logger.info("Successfully initialized Gemini chat")
+        return model
+    except Exception as e:
+        logger.error(f"Error initializing Gemini chat: {str(e)}")
+        raise
+
+def _create_supabase():
+    from supabase import create_client
+    return TracedSupabase(create_client(os.getenv('EXPO_PUBLIC_SUPABASE_URL'),
+                                        os.getenv('EXPO_PUBLIC_SUPABASE_ANON_KEY')))
+
+model = LazyClient(_create_model)
+supabase = LazyClient(_create_supabase)
+
+# Per-user chat sessions, hydrated from chat_history on first use
+CHAT_POOL_MAX_SESSIONS = int(os.getenv('CHAT_POOL_MAX_SESSIONS', '500'))
+CHAT_POOL_MAX_BYTES = int(os.getenv('CHAT_POOL_MAX_BYTES', str(32 * 1024 * 1024)))
+CHAT_HISTORY_HYDRATE_LIMIT = int(os.getenv('CHAT_HISTORY_HYDRATE_LIMIT', '50'))
+
+def load_chat_history(user_id):
+    # Most recent turns only, returned oldest first
+    res = supabase.table('chat_history').select('message, is_user').eq('user_id', user_id) \
+        .order('timestamp', desc=True).limit(CHAT_HISTORY_HYDRATE_LIMIT).execute()
+    return list(reversed(res.data or []))
+
+# Each turn sends the recent messages verbatim within a token budget; older ones are
+# folded into a rolling per-user summary in the background
+CHAT_CONTEXT_BUDGET = int(os.getenv('CHAT_CONTEXT_BUDGET', '3000'))
+CHAT_SUMMARY_TOKENS = int(os.getenv('CHAT_SUMMARY_TOKENS', '500'))
+
+# Gemini calls get GEMINI_TIMEOUT seconds per attempt, and transient errors are retried up to
+# GEMINI_RETRIES times after a jittered backoff. With GEMINI_HEDGE_PERCENTILE set (e.g. 95), a
+# duplicate request is sent once the first is slower than that percentile of recent calls and the
+# first reply wins. GEMINI_BREAKER_FAILURES failures in a row stop calls for GEMINI_BREAKER_RESET seconds.
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', '30'))
+GEMINI_HEDGE_PERCENTILE = float(os.getenv('GEMINI_HEDGE_PERCENTILE')) if os.getenv('GEMINI_HEDGE_PERCENTILE') else None
+
+GEMINI_GUARD_OPTIONS = {
+    'timeout': GEMINI_TIMEOUT,
+    'retries': int(os.getenv('GEMINI_RETRIES', '2')),
+    'hedge_percentile': GEMINI_HEDGE_PERCENTILE,
+}
+
+gemini_breaker = CircuitBreaker(failure_threshold=int(os.getenv('GEMINI_BREAKER_FAILURES', '5')),
+                                reset_timeout=float(os.getenv('GEMINI_BREAKER_RESET', '30')))
+gemini = CallGuard(gemini_breaker, ThreadPoolExecutor(max_workers=int(os.getenv('GEMINI_MAX_WORKERS', '32')),
+                                                      thread_name_prefix='gemini'), **GEMINI_GUARD_OPTIONS)
+
+def _summarize(prompt):
+    return model.generate_content(prompt, request_options={'timeout': GEMINI_TIMEOUT}).text
+
+chat_context = ChatContext(_summarize, ThreadPoolExecutor(max_workers=2, thread_name_prefix='chat-summary'),
+                           budget=CHAT_CONTEXT_BUDGET, summary_tokens=CHAT_SUMMARY_TOKENS)
+
+chat_sessions = ChatSessionPool(model, loader=load_chat_history,
+                                max_sessions=CHAT_POOL_MAX_SESSIONS,
+                                max_bytes=CHAT_POOL_MAX_BYTES,
+                                context=chat_context)
+
+# Answers to generic first-turn coaching questions, shared across users
+answer_cache = AnswerCache(max_entries=int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '1000')),
+                           ttl=float(os.getenv('ANSWER_CACHE_TTL', str(24 * 3600))),
+                           threshold=float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.85')))
+
+# Admission control for /gemini-chat. Chat requests hold a worker thread for the whole Gemini
+# round trip, so at most CHAT_MAX_CONCURRENT run at once and CHAT_MAX_QUEUE more may wait up to
+# CHAT_QUEUE_TIMEOUT seconds; keep the sum below the worker's thread count so CRUD routes always
+# have threads left. Each user (or client address) also gets CHAT_RATE_PER_MINUTE requests,
+# with bursts of up to CHAT_BURST.
+chat_gate = AdmissionGate(max_concurrent=int(os.getenv('CHAT_MAX_CONCURRENT', '8')),
+                          max_queue=int(os.getenv('CHAT_MAX_QUEUE', '16')),
+                          max_wait=float(os.getenv('CHAT_QUEUE_TIMEOUT', '2')))
+chat_buckets = TokenBuckets(rate=float(os.getenv('CHAT_RATE_PER_MINUTE', '20')) / 60,
+                            burst=float(os.getenv('CHAT_BURST', '5')))
+
+def _admit_chat(key):
+    wait = chat_buckets.take(key)
+    if wait:
+        raise Rejected('rate limited', wait)
+    return chat_gate.acquire()
+
+def _chat_rejected(e):
+    logger.warning("Rejected chat request: %s", e, extra={'retry_after': e.retry_after})
+    return jsonify({'error': f'Coach is busy ({e}), try again shortly', 'retry_after': e.retry_after}), \
+        429, {'Retry-After': str(e.retry_after)}
+
+# Optional write-behind mode: log inserts are journaled locally and flushed to Supabase in batches
+WRITE_BEHIND = os.getenv('WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+outbox = None  # started by create_app() when WRITE_BEHIND is set
+
+def _start_outbox():
+    global outbox
+    if outbox is None:
+        outbox = WriteOutbox(supabase, path=os.getenv('WRITE_BEHIND_JOURNAL', 'outbox.sqlite3'),
+                             batch_size=int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '100')),
+                             flush_interval=float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '0.5'))).start()
+        atexit.register(outbox.close)
+    return outbox
+
+def _insert_rows(table, rows):
+    # Returns the inserted rows; in write-behind mode they are acknowledged once journaled
+    if outbox is not None:
+        return [outbox.enqueue(table, row) for row in rows]
+    return supabase.table(table).insert(rows, default_to_null=False).execute().data
+
+def _insert_row(table, row):
+    return _insert_rows(table, [row])[0]
+
+# Writes are checked against the columns in supabase_schema.sql before they are sent, so bad
+# payloads fail here instead of after a round trip and unknown columns are dropped
+SCHEMA_PATH = os.getenv('SCHEMA_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                                                    'supabase_schema.sql'))
+ROW_TEXT_MAX_CHARS = int(os.getenv('ROW_TEXT_MAX_CHARS', '5000'))
+
+def _load_table_schemas():
+    try:
+        return load_schemas(SCHEMA_PATH, text_max_chars=ROW_TEXT_MAX_CHARS)
+    except OSError as e:
+        logger.warning(f"Writes are not validated, schema file unavailable: {str(e)}")
+        return {}
+
+table_schemas = _load_table_schemas()
+
+def valid_row(table, data):
+    # Row to insert; tables the schema file doesn't describe are written as given
+    schema = table_schemas.get(table)
+    return schema.row(data) if schema is not None else data
+
+def valid_changes(table, data):
+    schema = table_schemas.get(table)
+    if schema is not None:
+        return schema.changes(data)
+    return {k: v for k, v in data.items() if k != 'user_id'}
+
+def known_columns(table):
+    # Columns a fields= projection may name; None (unchecked) for tables the schema file doesn't describe
+    schema = table_schemas.get(table)
+    return schema.columns if schema is not None else None
+
+def _invalid_row(e):
+    return jsonify({'error': str(e), 'fields': e.errors}), 400
+
+# Running weekly totals behind /scores/weekly, updated as meals, steps and daily logs are written
+weekly_totals = WeeklyTotals(supabase)
+weekly_totals_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='weekly-totals')
+
+def _record_weekly(table, rows, sign=1):
+    # Applied off the request path in write order; /scores/weekly/rebuild repairs any drift
+    def apply():
+        try:
+            weekly_totals.record(table, rows, sign)
+        except Exception as e:
+            logger.error(f"Error updating weekly totals from {table}: {str(e)}")
+    weekly_totals_executor.submit(apply)
+
+# Streaks and achievement unlocks, kept per user and updated as logs are written
+progress = ProgressEngine(supabase, on_change=lambda table, user_id: response_cache.invalidate(table, user_id),
+                          max_users=int(os.getenv('GAMIFICATION_CACHE_USERS', '10000')))
+progress_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gamification')
+
+def _record_progress(table, rows):
+    # Applied off the request path in write order; /achievements/rebuild repairs any drift
+    def apply():
+        try:
+            progress.record(table, rows)
+        except Exception as e:
+            logger.error(f"Error updating streaks and achievements from {table}: {str(e)}")
+    progress_executor.submit(apply)
+
+api = Blueprint('api', __name__)
+
+# Per-route latency and sizes for /metrics, and a Server-Timing header showing the
+# Supabase and Gemini time behind each response. Registered first so it runs after
+# the other hooks and sees the body as sent.
+@api.before_app_request
+def start_timing():
+    g.request_started = start_request()
+
+@api.after_app_request
+def record_timing(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    # A streamed body is timed and sized up to its headers only
+    size = None if response.is_streamed else response.content_length
+    response.headers['Server-Timing'] = observe_request(request.method, route, response.status_code, started,
+                                                        request.content_length, size)
+    return response
+
+# Negotiated gzip/brotli compression for JSON bodies above a size threshold
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))
+
+@api.after_app_request
+def compress(response):
+    return compress_response(response, request.accept_encodings, COMPRESS_MIN_BYTES, COMPRESS_LEVEL)
+
+# Identical GETs that arrive while one is already running share its response
+read_flights = SingleFlight()
+
+def coalesced(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.args.get('user_id'), request.path, tuple(sorted(request.args.items(multi=True))))
+        def run():
+            response = current_app.make_response(view(*args, **kwargs))
+            return response.status_code, list(response.headers.items()), response.get_data()
+        # Each caller gets its own Response, since after-request hooks modify it in place
+        status, headers, body = read_flights.do(key, run)
+        return Response(body, status=status, headers=headers)
+    return wrapper
+
+def _request_user_id():
+    data = request.get_json(silent=True)
+    return request.args.get('user_id') or (data.get('user_id') if isinstance(data, dict) else None)
+
+@api.after_app_request
+def forget_flights(response):
+    # Reads issued after a write must not join a read that started before it
+    if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        read_flights.forget(_request_user_id())
+    return response
+
+# --- Idempotency-Key on writes: a retried request gets the first response instead of running again ---
+idempotency = IdempotencyStore(max_entries=int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '5000')),
+                               ttl=float(os.getenv('IDEMPOTENCY_TTL', '86400')),
+                               max_wait=float(os.getenv('IDEMPOTENCY_MAX_WAIT', '60')))
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+def _stored_headers(response):
+    # Length and timing are set again for the replay
+    return [(name, value) for name, value in response.headers.items()
+            if name not in ('Content-Length', 'Server-Timing')]
+
+def _replay(stored):
+    response = Response(stored.body, status=stored.status, headers=stored.headers)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+@api.before_app_request
+def replay_idempotent():
+    key = request.headers.get('Idempotency-Key')
+    if not key or request.method not in WRITE_METHODS:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        return jsonify({'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'}), 400
+    # Keys are per user, so two users can't collide on one
+    key = (_request_user_id() or request.remote_addr, key)
+    try:
+        stored = idempotency.begin(key, fingerprint(request.method, request.full_path, request.get_data()))
+    except KeyReused:
+        return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+    except InProgress:
+        return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409, {'Retry-After': '1'}
+    if stored is not None:
+        return _replay(stored)
+    g.idempotency_key = key
+    return None
+
+def _recorded_stream(key, response):
+    status, headers, chunks = response.status_code, _stored_headers(response), response.response
+    def stream():
+        body, finished = [], False
+        try:
+            for chunk in chunks:
+                body.append(chunk.encode() if isinstance(chunk, str) else chunk)
+                yield chunk
+            finished = True
+        finally:
+            # A chat stream that ended in an error event is released, so the retry asks Gemini again
+            if finished and not (body and body[-1].startswith(b'event: error')):
+                idempotency.complete(key, status, headers, b''.join(body))
+            else:
+                idempotency.release(key)
+            if hasattr(chunks, 'close'):
+                chunks.close()
+    return stream()
+
+@api.after_app_request
+def store_idempotent(response):
+    key = g.pop('idempotency_key', None)
+    if key is None:
+        return response
+    if not should_store(response.status_code):
+        idempotency.release(key)
+    elif response.is_streamed:
+        # Stored once the whole stream has been sent
+        response.response = _recorded_stream(key, response)
+    else:
+        idempotency.complete(key, response.status_code, _stored_headers(response), response.get_data())
+    return response
+
+@api.teardown_app_request
+def release_idempotent(error):
+    # The request failed before its response could be stored
+    key = g.pop('idempotency_key', None)
+    if key is not None:
+        idempotency.release(key)
+
+# Read-through cache for the per-user GET routes clients poll far more often than they change
+response_cache = ResponseCache(max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '2048')),
+                               ttl=float(os.getenv('RESPONSE_CACHE_TTL', '30')))
+
+def cached_read(table):
+    # Serve a GET view from response_cache and answer If-None-Match with 304
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id = request.args.get('user_id')
+            if not user_id:
+                return view(*args, **kwargs)
+            params = tuple(sorted((k, v) for k, v in request.args.items(multi=True) if k != 'user_id'))
+            entry = response_cache.get(table, user_id, params)
+            if entry is None:
+                generation = response_cache.generation(table, user_id)
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = response_cache.set(table, user_id, params, response.get_data(), generation)
+            # Compressed responses carry an encoding-suffixed ETag; any variant of this body matches
+            matched = next((etag for etag in etag_variants(entry.etag) if request.if_none_match.contains(etag)), None)
+            if matched:
+                response = Response(status=304)
+                response.set_etag(matched)
+                return response
+            response = Response(entry.body, mimetype='application/json')
+            response.set_etag(entry.etag)
+            return response
+        return wrapper
+    return decorator
+
+# --- Bulk uploads (offline sync) for the log routes ---
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '100'))
+BULK_MAX_ENTRIES = int(os.getenv('BULK_MAX_ENTRIES', '5000'))
+
+def _bulk_entries():
+    # A JSON array or NDJSON body; None for a regular single-entry request
+    if request.mimetype in NDJSON_MIMETYPES:
+        return parse_ndjson(request.get_data(as_text=True))
+    data = request.get_json(silent=True)
+    return data if isinstance(data, list) else None
+
+def _bulk_insert(table, key, entries):
+    if len(entries) > BULK_MAX_ENTRIES:
+        return jsonify({'error': f'at most {BULK_MAX_ENTRIES} entries per request'}), 400
+
+    # Validate every entry locally, then insert the valid ones in chunks
+    outcomes, rows, positions = prepare(entries, request.args.get('user_id'), table_schemas.get(table))
+    for index, outcome in zip(positions, insert_in_chunks(lambda chunk: _insert_rows(table, chunk), rows, BULK_CHUNK_SIZE)):
+        outcomes[index] = outcome
+    inserted = [outcome for outcome in outcomes if isinstance(outcome, dict)]
+    if table in SOURCE_FIELDS:
+        _record_weekly(table, inserted)
+    if table in TABLE_STREAKS:
+        _record_progress(table, inserted)
+
+    body, status = summarize(outcomes, key)
+    if body['failed']:
+        logger.error(f"Bulk insert into {table}: {body['failed']} of {len(outcomes)} entries failed")
+    return jsonify(body), status
+
+@api.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({
+        'response_cache': response_cache.stats(),
+        'chat_sessions': chat_sessions.stats(),
+        'chat_context': chat_context.stats(),
+        'answer_cache': answer_cache.stats(),
+        'single_flight': read_flights.stats(),
+        'chat_admission': {**chat_gate.stats(), **chat_buckets.stats()},
+        'gemini': gemini.stats(),
+        'idempotency': idempotency.stats(),
+        'gamification': progress.stats(),
+        'food_analysis': food_cache.stats()
+    }), 200
+
+_CIRCUIT_STATES = (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN)
+
+registry.add(Gauge('gemini_circuit_state', 'Gemini circuit breaker state; 1 for the current one.', ('state',),
+                   lambda: {(state,): int(gemini_breaker.state == state) for state in _CIRCUIT_STATES}))
+registry.add(Gauge('chat_requests', 'Coach chat requests being answered or queued.', ('phase',),
+                   lambda: {('active',): chat_gate.active, ('waiting',): chat_gate.waiting}))
+registry.add(Gauge('log_records_dropped', 'Log records dropped because the log queue was full.', (),
+                   lambda: {(): dropped_log_records()}))
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api.route('/gemini-chat', methods=['POST'])
 def gemini_chat():
     try:
         data = request.get_json(force=True)
@@ -58,264 +448,486 @@ def gemini_chat():
 
         user_message = data['message']
         user_id = data.get('user_id')  # Optionally pass user_id from frontend
-        logger.info(f"Processing message: {user_message}")
+        logger.info("Processing chat message", extra={'user_id': user_id, 'message_chars': len(user_message)})
+        logger.debug("Chat message: %s", user_message, extra={'user_id': user_id})
+
+        try:
+            ticket = _admit_chat(user_id or request.remote_addr)
+        except Rejected as e:
+            return _chat_rejected(e)
 
-        # Store user message in Supabase
-        if user_id:
-            supabase.table('chat_history').insert({
-                'user_id': user_id,
-                'message': user_message,
-                'is_user': True
-            }).execute()
+        if _wants_event_stream():
+            response = Response(_stream_chat_reply(user_id, user_message), mimetype='text/event-stream',
+                                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+            # The slot is held until the stream has been sent or the client goes away
+            response.call_on_close(lambda: chat_gate.release(ticket))
+            return response
 
         try:
-            response = chat.send_message(user_message)
+            if not user_id:
+                # Anonymous requests get a one-off session with no shared history
+                return _send_chat_message(model.start_chat(history=[]), None, user_message)
+
+            # The session is hydrated before the new message is stored so it isn't replayed twice
+            with chat_sessions.session(user_id) as chat:
+                return _send_chat_message(chat, user_id, user_message)
+        finally:
+            chat_gate.release(ticket)
+    except Exception as e:
+        logger.error(f"Error in gemini_chat: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def _store_chat_message(user_id, message, is_user):
+    row = {
+        'user_id': user_id,
+        'message': message,
+        'is_user': is_user
+    }
+    if outbox is not None:
+        # Stamp now so history order doesn't depend on when the batch is flushed
+        row['timestamp'] = datetime.now(timezone.utc).isoformat()
+    _insert_row('chat_history', row)
+
+def _append_turn(chat, user_message, ai_reply):
+    chat.history = [*chat.history, {'role': 'user', 'parts': [user_message]},
+                    {'role': 'model', 'parts': [ai_reply]}]
+
+def _cached_answer(chat, user_message):
+    # Shared answers only stand in for a first turn; mid-conversation questions depend on context
+    if chat.history:
+        return None
+    answer = answer_cache.get(user_message)
+    if answer is not None:
+        # Keep the session in step with what the user was shown
+        _append_turn(chat, user_message, answer)
+    return answer
+
+def _gemini_contents(chat, user_message):
+    # Calls go through generate_content rather than chat.send_message, so a retried or
+    # hedged attempt never leaves a half-finished turn in the session
+    return [*chat.history, {'role': 'user', 'parts': [user_message]}]
+
+def _gemini_unavailable(e):
+    logger.warning("Gemini circuit open, retry in %ss", e.retry_after)
+    return jsonify({'error': 'Coach is temporarily unavailable, try again shortly', 'retry_after': e.retry_after}), \
+        503, {'Retry-After': str(e.retry_after)}
+
+def _remember_answer(fresh, user_message, ai_reply, started):
+    answer_cache.observe_latency(time.perf_counter() - started)
+    # Only answers given without prior context are generic enough to share
+    if fresh:
+        answer_cache.put(user_message, ai_reply)
+
+def _send_chat_message(chat, user_id, user_message):
+    # Store user message in Supabase
+    if user_id:
+        _store_chat_message(user_id, user_message, True)
+
+    try:
+        ai_reply = _cached_answer(chat, user_message)
+        if ai_reply is None:
+            fresh = not chat.history
+            contents = _gemini_contents(chat, user_message)
+            started = time.perf_counter()
+            response = gemini.call(lambda timeout: model.generate_content(
+                contents, request_options={'timeout': timeout}))
             ai_reply = response.text if hasattr(response, 'text') else ''
-            logger.info(f"Generated response: {ai_reply}")
+            _append_turn(chat, user_message, ai_reply)
+            _remember_answer(fresh, user_message, ai_reply, started)
+        logger.info("Generated response", extra={'user_id': user_id, 'reply_chars': len(ai_reply)})
 
-            # Store AI response in Supabase
-            if user_id and ai_reply:
-                supabase.table('chat_history').insert({
-                    'user_id': user_id,
-                    'message': ai_reply,
-                    'is_user': False
-                }).execute()
+        # Store AI response in Supabase
+        if user_id and ai_reply:
+            _store_chat_message(user_id, ai_reply, False)
 
-            return jsonify({'content': ai_reply}), 200
-        except Exception as e:
-            logger.error(f"Error generating response: {str(e)}")
-            return jsonify({'error': str(e)}), 500
+        return jsonify({'content': ai_reply}), 200
+    except CircuitOpen as e:
+        return _gemini_unavailable(e)
     except Exception as e:
-        logger.error(f"Error in gemini_chat: {str(e)}")
+        logger.error(f"Error generating response: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/gemini-chat/history', methods=['GET'])
+# --- Server-Sent Events streaming for /gemini-chat ---
+def _wants_event_stream():
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def _sse(payload, event=None):
+    body = f"data: {json.dumps(payload)}\n\n"
+    return f"event: {event}\n{body}" if event else body
+
+def _stream_chat_reply(user_id, user_message):
+    # Runs after the view has returned, so the session is held for the life of the stream
+    if not user_id:
+        yield from _stream_chat_message(model.start_chat(history=[]), None, user_message)
+        return
+    try:
+        with chat_sessions.session(user_id) as chat:
+            yield from _stream_chat_message(chat, user_id, user_message)
+    except Exception as e:
+        logger.error(f"Error in gemini_chat stream: {str(e)}")
+        yield _sse({'error': str(e)}, event='error')
+
+def _stream_chat_message(chat, user_id, user_message):
+    if user_id:
+        _store_chat_message(user_id, user_message, True)
+
+    chunks = []
+    try:
+        cached = _cached_answer(chat, user_message)
+        if cached is not None:
+            chunks.append(cached)
+            yield _sse({'delta': cached})
+        else:
+            fresh = not chat.history
+            contents = _gemini_contents(chat, user_message)
+            started = time.perf_counter()
+            for chunk in gemini.stream(lambda timeout: model.generate_content(
+                    contents, stream=True, request_options={'timeout': timeout})):
+                text = getattr(chunk, 'text', '')
+                if text:
+                    chunks.append(text)
+                    yield _sse({'delta': text})
+            _append_turn(chat, user_message, ''.join(chunks))
+            _remember_answer(fresh, user_message, ''.join(chunks), started)
+    except CircuitOpen as e:
+        logger.warning("Gemini circuit open, retry in %ss", e.retry_after)
+        yield _sse({'error': 'Coach is temporarily unavailable, try again shortly',
+                    'retry_after': e.retry_after}, event='error')
+        return
+    except Exception as e:
+        logger.error(f"Error streaming response: {str(e)}")
+        yield _sse({'error': str(e)}, event='error')
+        return
+
+    # Persist the assembled reply once the stream has closed
+    ai_reply = ''.join(chunks)
+    logger.info("Generated response", extra={'user_id': user_id, 'reply_chars': len(ai_reply)})
+    if user_id and ai_reply:
+        _store_chat_message(user_id, ai_reply, False)
+    yield _sse({'content': ai_reply}, event='done')
+
+@api.route('/gemini-chat/history', methods=['GET'])
+@coalesced
 def get_chat_history():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
+    try:
+        limit, after = page_args(request.args, 'timestamp')
+        desc = order_arg(request.args)
+        columns = select_columns(request.args, 'id', 'timestamp', known=known_columns('chat_history'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
         # Retrieve chat history for the user, ordered by timestamp
-        res = supabase.table('chat_history').select('*').eq('user_id', user_id).order('timestamp', desc=False).execute()
-        return jsonify({'history': res.data}), 200
+        query = supabase.table('chat_history').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(query, limit, after, 'timestamp', desc)
+        return jsonify({'history': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving chat history: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # --- Supabase CRUD for goals ---
-@app.route('/goals', methods=['GET'])
+def goal_row(data):
+    row = {
+        'user_id': data['user_id'],
+        'title': data['title'],
+        'description': data.get('description'),
+        'category': data.get('category', 'other'),
+        'target_date': data.get('targetDate'),
+        'is_completed': data.get('isCompleted', False),
+        'progress': data.get('progress', 0)
+    }
+    # Leave created out when not given so the column default stamps it; a null would sort after every page
+    if data.get('created'):
+        row['created'] = data['created']
+    return row
+
+@api.route('/goals', methods=['GET'])
+@cached_read('goals')
+@coalesced
 def get_goals():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('goals').select('*').eq('user_id', user_id).order('created', desc=False).execute()
-        return jsonify({'goals': res.data}), 200
+        limit, after = page_args(request.args, 'created')
+        columns = select_columns(request.args, 'id', 'created', known=known_columns('goals'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = supabase.table('goals').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(query, limit, after, 'created')
+        return jsonify({'goals': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving goals: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/goals', methods=['POST'])
+@api.route('/goals', methods=['POST'])
 def add_goal():
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id or not data.get('title'):
         return jsonify({'error': 'user_id and title required'}), 400
     try:
-        goal = {
-            'user_id': user_id,
-            'title': data['title'],
-            'description': data.get('description'),
-            'category': data.get('category', 'other'),
-            'target_date': data.get('targetDate'),
-            'is_completed': data.get('isCompleted', False),
-            'progress': data.get('progress', 0),
-            'created': data.get('created')
-        }
-        res = supabase.table('goals').insert(goal).execute()
+        res = supabase.table('goals').insert(valid_row('goals', goal_row(data))).execute()
+        response_cache.invalidate('goals', user_id)
         return jsonify({'message': 'Goal added successfully!', 'goal': res.data[0]}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error adding goal: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/goals/<goal_id>', methods=['PUT'])
+@api.route('/goals/<goal_id>', methods=['PUT'])
 def update_goal(goal_id):
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        update_data = {k: v for k, v in data.items() if k != 'user_id'}
+        update_data = valid_changes('goals', data)
         res = supabase.table('goals').update(update_data).eq('id', goal_id).eq('user_id', user_id).execute()
+        response_cache.invalidate('goals', user_id)
         return jsonify({'message': 'Goal updated!', 'goal': res.data[0]}), 200
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error updating goal: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/goals/<goal_id>', methods=['DELETE'])
+@api.route('/goals/<goal_id>', methods=['DELETE'])
 def delete_goal(goal_id):
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
         supabase.table('goals').delete().eq('id', goal_id).eq('user_id', user_id).execute()
+        response_cache.invalidate('goals', user_id)
         return jsonify({'message': 'Goal deleted!'}), 200
     except Exception as e:
         logger.error(f"Error deleting goal: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # --- Supabase CRUD for progress (weight logs, steps, etc.) ---
-@app.route('/progress', methods=['GET'])
+def progress_row(data):
+    return {
+        'user_id': data['user_id'],
+        'date': data['date'],
+        'weight': data.get('weight'),
+        'steps': data.get('steps'),
+        'nutrition': data.get('nutrition')
+    }
+
+@api.route('/progress', methods=['GET'])
+@coalesced
 def get_progress():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('progress').select('*').eq('user_id', user_id).order('date', desc=False).execute()
-        return jsonify({'progress': res.data}), 200
+        limit, after = page_args(request.args, 'date')
+        first, last = date_range_args(request.args)
+        desc = order_arg(request.args)
+        columns = select_columns(request.args, 'id', 'date', known=known_columns('progress'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = supabase.table('progress').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(date_range(query, 'date', first, last), limit, after, 'date', desc)
+        return jsonify({'progress': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving progress: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/progress', methods=['POST'])
+@api.route('/progress', methods=['POST'])
 def add_progress():
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id or not data.get('date'):
         return jsonify({'error': 'user_id and date required'}), 400
     try:
-        entry = {
-            'user_id': user_id,
-            'date': data['date'],
-            'weight': data.get('weight'),
-            'steps': data.get('steps'),
-            'nutrition': data.get('nutrition')
-        }
-        res = supabase.table('progress').insert(entry).execute()
+        res = supabase.table('progress').insert(progress_row(data)).execute()
         return jsonify({'message': 'Progress added!', 'entry': res.data[0]}), 201
     except Exception as e:
         logger.error(f"Error adding progress: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # --- Supabase CRUD for achievements ---
-@app.route('/achievements', methods=['GET'])
+def achievement_row(data):
+    return {
+        'user_id': data['user_id'],
+        'achievement_code': data.get('achievement_code'),
+        'title': data['name'],
+        'category': data.get('category'),
+        'description': data.get('description'),
+        'icon': data.get('icon'),
+        'is_unlocked': data.get('is_unlocked', False),
+        'points': data.get('points', 0),
+        'unlocked_at': data.get('date_unlocked')
+    }
+
+@api.route('/achievements', methods=['GET'])
+@cached_read('achievements')
+@coalesced
 def get_achievements():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('achievements').select('*').eq('user_id', user_id).execute()
-        return jsonify({'achievements': res.data}), 200
+        limit, after = page_args(request.args)
+        columns = select_columns(request.args, 'id', known=known_columns('achievements'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = supabase.table('achievements').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(query, limit, after)
+        return jsonify({'achievements': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving achievements: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/achievements', methods=['POST'])
+@api.route('/achievements', methods=['POST'])
 def add_achievement():
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id or not data.get('name'):
         return jsonify({'error': 'user_id and name required'}), 400
     try:
-        achievement = {
-            'user_id': user_id,
-            'name': data['name'],
-            'category': data.get('category'),
-            'description': data.get('description'),
-            'is_unlocked': data.get('is_unlocked', False),
-            'points': data.get('points', 0),
-            'date_unlocked': data.get('date_unlocked')
-        }
-        res = supabase.table('achievements').insert(achievement).execute()
+        res = supabase.table('achievements').insert(valid_row('achievements', achievement_row(data))).execute()
+        response_cache.invalidate('achievements', user_id)
         return jsonify({'message': 'Achievement added!', 'achievement': res.data[0]}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error adding achievement: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/achievements/<achievement_id>', methods=['PUT'])
+@api.route('/achievements/<achievement_id>', methods=['PUT'])
 def update_achievement(achievement_id):
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        update_data = {k: v for k, v in data.items() if k != 'user_id'}
+        update_data = valid_changes('achievements', data)
         res = supabase.table('achievements').update(update_data).eq('id', achievement_id).eq('user_id', user_id).execute()
+        response_cache.invalidate('achievements', user_id)
         return jsonify({'message': 'Achievement updated!', 'achievement': res.data[0]}), 200
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error updating achievement: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@api.route('/achievements/rebuild', methods=['POST'])
+def rebuild_achievements():
+    data = request.get_json()
+    user_id = data.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    try:
+        # Run behind queued updates so they aren't applied on top of the rebuilt state
+        unlocked = progress_executor.submit(progress.rebuild, user_id).result()
+        return jsonify({'message': 'Streaks and achievements rebuilt!', 'unlocked': unlocked}), 200
+    except Exception as e:
+        logger.error(f"Error rebuilding streaks and achievements: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 # --- Supabase CRUD for challenges ---
-@app.route('/challenges', methods=['GET'])
+@api.route('/challenges', methods=['GET'])
+@coalesced
 def get_challenges():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('challenges').select('*').eq('user_id', user_id).execute()
-        return jsonify({'challenges': res.data}), 200
+        limit, after = page_args(request.args)
+        columns = select_columns(request.args, 'id', known=known_columns('challenges'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = supabase.table('challenges').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(query, limit, after)
+        return jsonify({'challenges': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving challenges: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/challenges/<challenge_id>', methods=['PUT'])
+@api.route('/challenges/<challenge_id>', methods=['PUT'])
 def update_challenge(challenge_id):
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        update_data = {k: v for k, v in data.items() if k != 'user_id'}
+        update_data = valid_changes('challenges', data)
         res = supabase.table('challenges').update(update_data).eq('id', challenge_id).eq('user_id', user_id).execute()
         return jsonify({'message': 'Challenge updated!', 'challenge': res.data[0]}), 200
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error updating challenge: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # --- Supabase CRUD for shots ---
-@app.route('/shots', methods=['GET'])
+@api.route('/shots', methods=['GET'])
+@coalesced
 def get_shots():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('shots').select('*').eq('user_id', user_id).execute()
-        return jsonify({'shots': res.data}), 200
+        limit, after = page_args(request.args, 'date')
+        first, last = date_range_args(request.args)
+        desc = order_arg(request.args)
+        columns = select_columns(request.args, 'id', 'date', known=known_columns('shots'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = supabase.table('shots').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(date_range(query, 'date', first, last), limit, after, 'date', desc)
+        return jsonify({'shots': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving shots: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/shots', methods=['POST'])
+@api.route('/shots', methods=['POST'])
 def add_shot():
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id or not data.get('date'):
         return jsonify({'error': 'user_id and date required'}), 400
     try:
-        shot = {k: v for k, v in data.items() if k != 'user_id'}
-        shot['user_id'] = user_id
+        shot = valid_row('shots', data)
         res = supabase.table('shots').insert(shot).execute()
+        _record_progress('shots', res.data)
         return jsonify({'message': 'Shot added!', 'shot': res.data[0]}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error adding shot: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/shots/<shot_id>', methods=['PUT'])
+@api.route('/shots/<shot_id>', methods=['PUT'])
 def update_shot(shot_id):
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        update_data = {k: v for k, v in data.items() if k != 'user_id'}
+        update_data = valid_changes('shots', data)
         res = supabase.table('shots').update(update_data).eq('id', shot_id).eq('user_id', user_id).execute()
         return jsonify({'message': 'Shot updated!', 'shot': res.data[0]}), 200
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error updating shot: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/shots/<shot_id>', methods=['DELETE'])
+@api.route('/shots/<shot_id>', methods=['DELETE'])
 def delete_shot(shot_id):
     user_id = request.args.get('user_id')
     if not user_id:
@@ -328,48 +940,64 @@ def delete_shot(shot_id):
         return jsonify({'error': str(e)}), 500
 
 # --- Supabase CRUD for weight logs ---
-@app.route('/weight-logs', methods=['GET'])
+@api.route('/weight-logs', methods=['GET'])
+@coalesced
 def get_weight_logs():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('weight_logs').select('*').eq('user_id', user_id).execute()
-        return jsonify({'weight_logs': res.data}), 200
+        limit, after = page_args(request.args, 'date')
+        first, last = date_range_args(request.args)
+        desc = order_arg(request.args)
+        columns = select_columns(request.args, 'id', 'date', known=known_columns('weight_logs'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = supabase.table('weight_logs').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(date_range(query, 'date', first, last), limit, after, 'date', desc)
+        return jsonify({'weight_logs': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving weight logs: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/weight-logs', methods=['POST'])
+@api.route('/weight-logs', methods=['POST'])
 def add_weight_log():
+    entries = _bulk_entries()
+    if entries is not None:
+        return _bulk_insert('weight_logs', 'weight_log', entries)
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id or not data.get('date'):
         return jsonify({'error': 'user_id and date required'}), 400
     try:
-        log = {k: v for k, v in data.items() if k != 'user_id'}
-        log['user_id'] = user_id
-        res = supabase.table('weight_logs').insert(log).execute()
-        return jsonify({'message': 'Weight log added!', 'weight_log': res.data[0]}), 201
+        log = valid_row('weight_logs', data)
+        log = _insert_row('weight_logs', log)
+        _record_progress('weight_logs', [log])
+        return jsonify({'message': 'Weight log added!', 'weight_log': log}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error adding weight log: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/weight-logs/<log_id>', methods=['PUT'])
+@api.route('/weight-logs/<log_id>', methods=['PUT'])
 def update_weight_log(log_id):
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        update_data = {k: v for k, v in data.items() if k != 'user_id'}
+        update_data = valid_changes('weight_logs', data)
         res = supabase.table('weight_logs').update(update_data).eq('id', log_id).eq('user_id', user_id).execute()
         return jsonify({'message': 'Weight log updated!', 'weight_log': res.data[0]}), 200
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error updating weight log: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/weight-logs/<log_id>', methods=['DELETE'])
+@api.route('/weight-logs/<log_id>', methods=['DELETE'])
 def delete_weight_log(log_id):
     user_id = request.args.get('user_id')
     if not user_id:
@@ -382,48 +1010,60 @@ def delete_weight_log(log_id):
         return jsonify({'error': str(e)}), 500
 
 # --- Supabase CRUD for side effects ---
-@app.route('/side-effects', methods=['GET'])
+@api.route('/side-effects', methods=['GET'])
+@coalesced
 def get_side_effects():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('side_effects').select('*').eq('user_id', user_id).execute()
-        return jsonify({'side_effects': res.data}), 200
+        limit, after = page_args(request.args, 'date')
+        first, last = date_range_args(request.args)
+        desc = order_arg(request.args)
+        columns = select_columns(request.args, 'id', 'date', known=known_columns('side_effects'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = supabase.table('side_effects').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(date_range(query, 'date', first, last), limit, after, 'date', desc)
+        return jsonify({'side_effects': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving side effects: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/side-effects', methods=['POST'])
+@api.route('/side-effects', methods=['POST'])
 def add_side_effect():
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id or not data.get('date'):
         return jsonify({'error': 'user_id and date required'}), 400
     try:
-        effect = {k: v for k, v in data.items() if k != 'user_id'}
-        effect['user_id'] = user_id
+        effect = valid_row('side_effects', data)
         res = supabase.table('side_effects').insert(effect).execute()
         return jsonify({'message': 'Side effect added!', 'side_effect': res.data[0]}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error adding side effect: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/side-effects/<effect_id>', methods=['PUT'])
+@api.route('/side-effects/<effect_id>', methods=['PUT'])
 def update_side_effect(effect_id):
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        update_data = {k: v for k, v in data.items() if k != 'user_id'}
+        update_data = valid_changes('side_effects', data)
         res = supabase.table('side_effects').update(update_data).eq('id', effect_id).eq('user_id', user_id).execute()
         return jsonify({'message': 'Side effect updated!', 'side_effect': res.data[0]}), 200
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error updating side effect: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/side-effects/<effect_id>', methods=['DELETE'])
+@api.route('/side-effects/<effect_id>', methods=['DELETE'])
 def delete_side_effect(effect_id):
     user_id = request.args.get('user_id')
     if not user_id:
@@ -435,74 +1075,172 @@ def delete_side_effect(effect_id):
         logger.error(f"Error deleting side effect: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# --- Meal photo analysis: photos are downscaled before upload and results cached by perceptual hash ---
+FOOD_IMAGE_MAX_BYTES = int(os.getenv('FOOD_IMAGE_MAX_BYTES', str(20 * 1024 * 1024)))
+FOOD_IMAGE_MAX_SIDE = int(os.getenv('FOOD_IMAGE_MAX_SIDE', '768'))
+food_cache = FoodAnalysisCache(max_entries=int(os.getenv('FOOD_CACHE_MAX_ENTRIES', '2000')),
+                               ttl=float(os.getenv('FOOD_CACHE_TTL', str(7 * 24 * 3600))),
+                               max_distance=int(os.getenv('FOOD_CACHE_MAX_DISTANCE', '4')))
+
+def food_contents(image):
+    return {'role': 'user', 'parts': [FOOD_PROMPT, {'mime_type': image.mime_type, 'data': image.data}]}
+
+def observe_food_upload(received, image):
+    food_cache.observe_upload(received, len(image.data))
+    FOOD_IMAGE_BYTES.inc('received', value=received)
+    FOOD_IMAGE_BYTES.inc('uploaded', value=len(image.data))
+
+def observe_food_model(started):
+    elapsed = time.perf_counter() - started
+    food_cache.observe_latency(elapsed)
+    FOOD_MODEL_SECONDS.observe(elapsed)
+
+def food_unavailable(e):
+    return {'error': 'Food analysis is temporarily unavailable, try again shortly', 'retry_after': e.retry_after}, \
+        503, {'Retry-After': str(e.retry_after)}
+
+@api.route('/analyze-food', methods=['POST'])
+def analyze_food():
+    data = request.get_json(silent=True) or {}
+    image_base64 = data.get('imageBase64')
+    if not image_base64:
+        return jsonify({'error': 'Image data is required'}), 400
+    # Four base64 characters per three bytes
+    if isinstance(image_base64, str) and len(image_base64) > FOOD_IMAGE_MAX_BYTES * 4 // 3 + 64:
+        return jsonify({'error': 'Image is too large'}), 413
+    user_id = data.get('userId') or data.get('user_id')
+    try:
+        raw = decode_image(image_base64)
+        image = prepare_image(raw, FOOD_IMAGE_MAX_SIDE)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    analysis = food_cache.get(user_id, image.key)
+    if analysis is not None:
+        FOOD_ANALYSES.inc('cache')
+        return jsonify({'analysis': analysis, 'cached': True}), 200
+
+    try:
+        observe_food_upload(len(raw), image)
+        contents = food_contents(image)
+        started = time.perf_counter()
+        response = gemini.call(lambda timeout: model.generate_content(
+            contents, request_options={'timeout': timeout}))
+        observe_food_model(started)
+        text = response.text if hasattr(response, 'text') else ''
+    except CircuitOpen as e:
+        body, status, headers = food_unavailable(e)
+        return jsonify(body), status, headers
+    except Exception as e:
+        logger.error(f"Error analyzing food image: {str(e)}")
+        return jsonify({'error': 'Failed to analyze food image', 'details': str(e)}), 500
+
+    try:
+        analysis = parse_analysis(text)
+    except ValueError as e:
+        logger.error("Failed to parse Gemini food analysis", extra={'user_id': user_id, 'reply_chars': len(text)})
+        return jsonify({'error': 'Failed to analyze food image. Please try again.', 'details': str(e)}), 500
+    FOOD_ANALYSES.inc('model')
+    food_cache.put(user_id, image.key, analysis)
+    return jsonify({'analysis': analysis, 'cached': False}), 200
+
 # --- Supabase CRUD for meals ---
-@app.route('/meals', methods=['GET'])
+@api.route('/meals', methods=['GET'])
+@coalesced
 def get_meals():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('meals').select('*').eq('user_id', user_id).execute()
-        return jsonify({'meals': res.data}), 200
+        limit, after = page_args(request.args, 'date')
+        first, last = date_range_args(request.args)
+        desc = order_arg(request.args)
+        columns = select_columns(request.args, 'id', 'date', known=known_columns('meals'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = supabase.table('meals').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(date_range(query, 'date', first, last), limit, after, 'date', desc)
+        return jsonify({'meals': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving meals: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/meals', methods=['POST'])
+@api.route('/meals', methods=['POST'])
 def add_meal():
+    entries = _bulk_entries()
+    if entries is not None:
+        return _bulk_insert('meals', 'meal', entries)
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id or not data.get('date'):
         return jsonify({'error': 'user_id and date required'}), 400
     try:
-        meal = {k: v for k, v in data.items() if k != 'user_id'}
-        meal['user_id'] = user_id
-        res = supabase.table('meals').insert(meal).execute()
-        return jsonify({'message': 'Meal added!', 'meal': res.data[0]}), 201
+        meal = valid_row('meals', data)
+        meal = _insert_row('meals', meal)
+        _record_weekly('meals', [meal])
+        return jsonify({'message': 'Meal added!', 'meal': meal}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error adding meal: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/meals/<meal_id>', methods=['PUT'])
+@api.route('/meals/<meal_id>', methods=['PUT'])
 def update_meal(meal_id):
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        update_data = {k: v for k, v in data.items() if k != 'user_id'}
+        update_data = valid_changes('meals', data)
+        # The row as it was comes off the weekly totals and the edited row goes on
+        before = supabase.table('meals').select('*').eq('id', meal_id).eq('user_id', user_id).execute().data
         res = supabase.table('meals').update(update_data).eq('id', meal_id).eq('user_id', user_id).execute()
+        if res.data:
+            _record_weekly('meals', before, sign=-1)
+            _record_weekly('meals', res.data)
         return jsonify({'message': 'Meal updated!', 'meal': res.data[0]}), 200
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error updating meal: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/meals/<meal_id>', methods=['DELETE'])
+@api.route('/meals/<meal_id>', methods=['DELETE'])
 def delete_meal(meal_id):
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        supabase.table('meals').delete().eq('id', meal_id).eq('user_id', user_id).execute()
+        res = supabase.table('meals').delete().eq('id', meal_id).eq('user_id', user_id).execute()
+        _record_weekly('meals', res.data, sign=-1)
         return jsonify({'message': 'Meal deleted!'}), 200
     except Exception as e:
         logger.error(f"Error deleting meal: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # --- Supabase CRUD for saved meals ---
-@app.route('/saved-meals', methods=['GET'])
+@api.route('/saved-meals', methods=['GET'])
+@coalesced
 def get_saved_meals():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('saved_meals').select('*').eq('user_id', user_id).execute()
-        return jsonify({'saved_meals': res.data}), 200
+        limit, after = page_args(request.args)
+        columns = select_columns(request.args, 'id', known=known_columns('saved_meals'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = supabase.table('saved_meals').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(query, limit, after)
+        return jsonify({'saved_meals': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving saved meals: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/saved-meals', methods=['POST'])
+@api.route('/saved-meals', methods=['POST'])
 def add_saved_meal():
     data = request.get_json()
     user_id = data.get('user_id')
@@ -517,7 +1255,7 @@ def add_saved_meal():
         logger.error(f"Error adding saved meal: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/saved-meals/<saved_meal_id>', methods=['DELETE'])
+@api.route('/saved-meals/<saved_meal_id>', methods=['DELETE'])
 def delete_saved_meal(saved_meal_id):
     user_id = request.args.get('user_id')
     if not user_id:
@@ -530,204 +1268,480 @@ def delete_saved_meal(saved_meal_id):
         return jsonify({'error': str(e)}), 500
 
 # --- Supabase CRUD for water logs ---
-@app.route('/water-logs', methods=['GET'])
+@api.route('/water-logs', methods=['GET'])
+@coalesced
 def get_water_logs():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('water_logs').select('*').eq('user_id', user_id).execute()
-        return jsonify({'water_logs': res.data}), 200
+        limit, after = page_args(request.args, 'date')
+        first, last = date_range_args(request.args)
+        desc = order_arg(request.args)
+        columns = select_columns(request.args, 'id', 'date', known=known_columns('water_logs'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = supabase.table('water_logs').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(date_range(query, 'date', first, last), limit, after, 'date', desc)
+        return jsonify({'water_logs': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving water logs: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/water-logs', methods=['POST'])
+@api.route('/water-logs', methods=['POST'])
 def add_water_log():
+    entries = _bulk_entries()
+    if entries is not None:
+        return _bulk_insert('water_logs', 'water_log', entries)
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id or not data.get('date'):
         return jsonify({'error': 'user_id and date required'}), 400
     try:
-        log = {k: v for k, v in data.items() if k != 'user_id'}
-        log['user_id'] = user_id
-        res = supabase.table('water_logs').insert(log).execute()
-        return jsonify({'message': 'Water log added!', 'water_log': res.data[0]}), 201
+        log = valid_row('water_logs', data)
+        log = _insert_row('water_logs', log)
+        _record_progress('water_logs', [log])
+        return jsonify({'message': 'Water log added!', 'water_log': log}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error adding water log: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # --- Supabase CRUD for step logs ---
-@app.route('/step-logs', methods=['GET'])
+@api.route('/step-logs', methods=['GET'])
+@coalesced
 def get_step_logs():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('step_logs').select('*').eq('user_id', user_id).execute()
-        return jsonify({'step_logs': res.data}), 200
+        limit, after = page_args(request.args, 'date')
+        first, last = date_range_args(request.args)
+        desc = order_arg(request.args)
+        columns = select_columns(request.args, 'id', 'date', known=known_columns('step_logs'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = supabase.table('step_logs').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(date_range(query, 'date', first, last), limit, after, 'date', desc)
+        return jsonify({'step_logs': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving step logs: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/step-logs', methods=['POST'])
+@api.route('/step-logs', methods=['POST'])
 def add_step_log():
+    entries = _bulk_entries()
+    if entries is not None:
+        return _bulk_insert('step_logs', 'step_log', entries)
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id or not data.get('date'):
         return jsonify({'error': 'user_id and date required'}), 400
     try:
-        log = {k: v for k, v in data.items() if k != 'user_id'}
-        log['user_id'] = user_id
-        res = supabase.table('step_logs').insert(log).execute()
-        return jsonify({'message': 'Step log added!', 'step_log': res.data[0]}), 201
+        log = valid_row('step_logs', data)
+        log = _insert_row('step_logs', log)
+        _record_weekly('step_logs', [log])
+        _record_progress('step_logs', [log])
+        return jsonify({'message': 'Step log added!', 'step_log': log}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error adding step log: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # --- Supabase CRUD for daily logs ---
-@app.route('/daily-logs', methods=['GET'])
+@api.route('/daily-logs', methods=['GET'])
+@coalesced
 def get_daily_logs():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('daily_logs').select('*').eq('user_id', user_id).execute()
-        return jsonify({'daily_logs': res.data}), 200
+        limit, after = page_args(request.args, 'date')
+        first, last = date_range_args(request.args)
+        desc = order_arg(request.args)
+        columns = select_columns(request.args, 'id', 'date', known=known_columns('daily_logs'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = supabase.table('daily_logs').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(date_range(query, 'date', first, last), limit, after, 'date', desc)
+        return jsonify({'daily_logs': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving daily logs: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/daily-logs', methods=['POST'])
+@api.route('/daily-logs', methods=['POST'])
 def add_daily_log():
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id or not data.get('date'):
         return jsonify({'error': 'user_id and date required'}), 400
     try:
-        log = {k: v for k, v in data.items() if k != 'user_id'}
-        log['user_id'] = user_id
+        log = valid_row('daily_logs', data)
         res = supabase.table('daily_logs').insert(log).execute()
+        _record_weekly('daily_logs', res.data)
+        _record_progress('daily_logs', res.data)
         return jsonify({'message': 'Daily log added!', 'daily_log': res.data[0]}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error adding daily log: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # --- Supabase CRUD for journey stages ---
-@app.route('/journey-stages', methods=['GET'])
+@api.route('/journey-stages', methods=['GET'])
+@cached_read('journey_stages')
+@coalesced
 def get_journey_stages():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('journey_stages').select('*').eq('user_id', user_id).execute()
-        return jsonify({'journey_stages': res.data}), 200
+        limit, after = page_args(request.args)
+        columns = select_columns(request.args, 'id', known=known_columns('journey_stages'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = supabase.table('journey_stages').select(columns).eq('user_id', user_id)
+        rows, next_cursor = fetch_page(query, limit, after)
+        return jsonify({'journey_stages': rows, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"Error retrieving journey stages: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/journey-stages', methods=['POST'])
+@api.route('/journey-stages', methods=['POST'])
 def add_journey_stage():
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id or not data.get('title'):
         return jsonify({'error': 'user_id and title required'}), 400
     try:
-        stage = {k: v for k, v in data.items() if k != 'user_id'}
-        stage['user_id'] = user_id
+        stage = valid_row('journey_stages', data)
         res = supabase.table('journey_stages').insert(stage).execute()
+        response_cache.invalidate('journey_stages', user_id)
         return jsonify({'message': 'Journey stage added!', 'journey_stage': res.data[0]}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error adding journey stage: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/journey-stages/<stage_id>', methods=['PUT'])
+@api.route('/journey-stages/<stage_id>', methods=['PUT'])
 def update_journey_stage(stage_id):
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        update_data = {k: v for k, v in data.items() if k != 'user_id'}
+        update_data = valid_changes('journey_stages', data)
         res = supabase.table('journey_stages').update(update_data).eq('id', stage_id).eq('user_id', user_id).execute()
+        response_cache.invalidate('journey_stages', user_id)
         return jsonify({'message': 'Journey stage updated!', 'journey_stage': res.data[0]}), 200
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error updating journey stage: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # --- Supabase CRUD for users (profile) ---
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
+@cached_read('users')
+@coalesced
 def get_user():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('users').select('*').eq('id', user_id).single().execute()
+        columns = select_columns(request.args, known=known_columns('users'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        res = supabase.table('users').select(columns).eq('id', user_id).single().execute()
         return jsonify({'user': res.data}), 200
     except Exception as e:
         logger.error(f"Error retrieving user: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/users', methods=['POST'])
+@api.route('/users', methods=['POST'])
 def add_user():
     data = request.get_json()
     if not data.get('id') or not data.get('name'):
         return jsonify({'error': 'id and name required'}), 400
     try:
-        res = supabase.table('users').insert(data).execute()
+        res = supabase.table('users').insert(valid_row('users', data)).execute()
+        response_cache.invalidate('users', data['id'])
         return jsonify({'message': 'User added!', 'user': res.data[0]}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error adding user: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/users/<user_id>', methods=['PUT'])
+@api.route('/users/<user_id>', methods=['PUT'])
 def update_user(user_id):
     data = request.get_json()
     try:
-        res = supabase.table('users').update(data).eq('id', user_id).execute()
+        res = supabase.table('users').update(valid_changes('users', data)).eq('id', user_id).execute()
+        response_cache.invalidate('users', user_id)
         return jsonify({'message': 'User updated!', 'user': res.data[0]}), 200
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error updating user: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # --- Supabase CRUD for streaks ---
-@app.route('/streaks', methods=['GET'])
+@api.route('/streaks', methods=['GET'])
+@cached_read('streaks')
+@coalesced
 def get_streaks():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('streaks').select('*').eq('user_id', user_id).single().execute()
+        columns = select_columns(request.args, known=known_columns('streaks'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        res = supabase.table('streaks').select(columns).eq('user_id', user_id).single().execute()
         return jsonify({'streaks': res.data}), 200
     except Exception as e:
         logger.error(f"Error retrieving streaks: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/streaks', methods=['POST'])
+@api.route('/streaks', methods=['POST'])
 def add_streaks():
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('streaks').insert(data).execute()
+        res = supabase.table('streaks').insert(valid_row('streaks', data)).execute()
+        response_cache.invalidate('streaks', user_id)
         return jsonify({'message': 'Streaks added!', 'streaks': res.data[0]}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error adding streaks: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/streaks/<streak_id>', methods=['PUT'])
+@api.route('/streaks/<streak_id>', methods=['PUT'])
 def update_streaks(streak_id):
     data = request.get_json()
     user_id = data.get('user_id')
     if not user_id:
         return jsonify({'error': 'user_id required'}), 400
     try:
-        res = supabase.table('streaks').update(data).eq('id', streak_id).eq('user_id', user_id).execute()
+        res = supabase.table('streaks').update(valid_changes('streaks', data)).eq('id', streak_id).eq('user_id', user_id).execute()
+        response_cache.invalidate('streaks', user_id)
         return jsonify({'message': 'Streaks updated!', 'streaks': res.data[0]}), 200
+    except InvalidRow as e:
+        return _invalid_row(e)
     except Exception as e:
         logger.error(f"Error updating streaks: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# --- Weekly scores (fruits/veg, protein and steps against weekly targets) ---
+WEEKLY_SCORES_MAX_WEEKS = int(os.getenv('WEEKLY_SCORES_MAX_WEEKS', '104'))
+
+@api.route('/scores/weekly', methods=['GET'])
+@coalesced
+def get_weekly_scores():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    try:
+        today = date.today().isoformat()
+        first = week_start(request.args.get('from') or request.args.get('week') or today)
+        last = week_start(request.args.get('to') or request.args.get('week') or today)
+    except ValueError:
+        return jsonify({'error': 'dates must be YYYY-MM-DD'}), 400
+    if last < first:
+        return jsonify({'error': 'from must not be after to'}), 400
+    if (last - first).days // 7 + 1 > WEEKLY_SCORES_MAX_WEEKS:
+        return jsonify({'error': f'at most {WEEKLY_SCORES_MAX_WEEKS} weeks per request'}), 400
+    try:
+        return jsonify({'scores': weekly_totals.weeks(user_id, first, last)}), 200
+    except Exception as e:
+        logger.error(f"Error retrieving weekly scores: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/scores/weekly/rebuild', methods=['POST'])
+def rebuild_weekly_scores():
+    data = request.get_json()
+    user_id = data.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    try:
+        # Let queued increments land first so they aren't applied on top of the rebuilt totals
+        weekly_totals_executor.submit(lambda: None).result()
+        weeks = weekly_totals.rebuild(user_id)
+        return jsonify({'message': 'Weekly scores rebuilt!', 'weeks': weeks}), 200
+    except Exception as e:
+        logger.error(f"Error rebuilding weekly scores: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# --- Chart series: weight and steps bucketed and downsampled to a fixed number of points ---
+SERIES_PAGE_SIZE = int(os.getenv('SERIES_PAGE_SIZE', '1000'))
+
+def _series_rows(table, column, user_id, first, last):
+    # Every row in the range, a page at a time since PostgREST caps the rows in one response
+    rows, after = [], None
+    while True:
+        query = supabase.table(table).select(f'id,date,{column}').eq('user_id', user_id)
+        page = page_query(date_range(query, 'date', first, last), SERIES_PAGE_SIZE, after, 'date').execute().data or []
+        rows.extend(page[:SERIES_PAGE_SIZE])
+        if len(page) <= SERIES_PAGE_SIZE:
+            return rows
+        after = [rows[-1]['date'], rows[-1]['id']]
+
+@api.route('/series/<metric>', methods=['GET'])
+@coalesced
+def get_series(metric):
+    if metric not in METRICS:
+        return jsonify({'error': f"unknown series: {metric}"}), 404
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    try:
+        first, last, bucket, points = series_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    table, column, value = METRICS[metric]
+    try:
+        rows = _series_rows(table, column, user_id, first, last)
+        result, buckets = series(rows, column, bucket, points, value)
+        return jsonify({'series': result, 'metric': metric, 'bucket': bucket, 'value': value,
+                        'buckets': buckets, 'rows': len(rows)}), 200
+    except Exception as e:
+        logger.error(f"Error retrieving {metric} series: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# --- Aggregated dashboard: one request fans out to all the tables the home/progress screens need ---
+DASHBOARD_DEFAULT_DAYS = int(os.getenv('DASHBOARD_DEFAULT_DAYS', '30'))
+DASHBOARD_TIMEOUT = float(os.getenv('DASHBOARD_TIMEOUT', '10'))
+# Bounds on what one dashboard request reads: the window in days, and the newest rows kept per log table
+DASHBOARD_MAX_DAYS = int(os.getenv('DASHBOARD_MAX_DAYS', '365'))
+DASHBOARD_MAX_ROWS = int(os.getenv('DASHBOARD_MAX_ROWS', '1000'))
+dashboard_executor = ThreadPoolExecutor(max_workers=int(os.getenv('DASHBOARD_MAX_WORKERS', '8')),
+                                        thread_name_prefix='dashboard')
+
+def _dashboard_single(table, column):
+    def fetch(user_id, since):
+        res = supabase.table(table).select('*').eq(column, user_id).limit(1).execute()
+        return res.data[0] if res.data else None
+    return fetch
+
+def _dashboard_recent(table):
+    def fetch(user_id, since):
+        # Newest first so the cap drops the oldest rows, then returned oldest first
+        res = supabase.table(table).select('*').eq('user_id', user_id).gte('date', since) \
+            .order('date', desc=True).order('id', desc=True).limit(DASHBOARD_MAX_ROWS).execute()
+        return list(reversed(res.data or []))
+    return fetch
+
+def dashboard_since(args):
+    # First day of the dashboard window from the days arg; raises ValueError on bad input
+    try:
+        days = int(args.get('days', DASHBOARD_DEFAULT_DAYS))
+    except ValueError:
+        raise ValueError('days must be an integer')
+    if days > DASHBOARD_MAX_DAYS:
+        raise ValueError(f'days must be at most {DASHBOARD_MAX_DAYS}')
+    return (date.today() - timedelta(days=max(days, 1) - 1)).isoformat()
+
+DASHBOARD_SECTIONS = {
+    'user': _dashboard_single('users', 'id'),
+    'streaks': _dashboard_single('streaks', 'user_id'),
+    'weight_logs': _dashboard_recent('weight_logs'),
+    'step_logs': _dashboard_recent('step_logs'),
+    'water_logs': _dashboard_recent('water_logs'),
+    'meals': _dashboard_recent('meals'),
+    'daily_logs': _dashboard_recent('daily_logs'),
+    'shots': _dashboard_recent('shots'),
+}
+
+@api.route('/dashboard', methods=['GET'])
+@coalesced
+def get_dashboard():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    sections = request.args.get('sections')
+    sections = [name.strip() for name in sections.split(',') if name.strip()] if sections else list(DASHBOARD_SECTIONS)
+    unknown = [name for name in sections if name not in DASHBOARD_SECTIONS]
+    if unknown:
+        return jsonify({'error': f"unknown sections: {', '.join(unknown)}"}), 400
+    try:
+        since = dashboard_since(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Every section runs concurrently, so latency tracks the slowest query rather than the sum
+    futures = {name: dashboard_executor.submit(copy_context().run, DASHBOARD_SECTIONS[name], user_id, since)
+               for name in sections}
+    wait(futures.values(), timeout=DASHBOARD_TIMEOUT)
+    dashboard, errors = {}, {}
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            errors[name] = 'timed out'
+        elif future.exception() is not None:
+            errors[name] = str(future.exception())
+        else:
+            dashboard[name] = future.result()
+    for name, error in errors.items():
+        logger.error(f"Error retrieving dashboard section {name}: {error}")
+    return jsonify({'dashboard': dashboard, 'since': since, 'errors': errors}), 200
+
+def warm_up():
+    # Build the Supabase and Gemini clients ahead of the first request that needs them
+    started = time.perf_counter()
+    supabase.get()
+    model.get()
+    logger.info("Warm-up finished in %.3fs", time.perf_counter() - started)
+
+def create_app(warm=None):
+    """Build the Flask app; clients are created lazily and shared by the worker.
+
+    Configuration is checked up front without touching the network. Pass
+    warm=True (or set WARM_UP=1) to build the clients in the background so
+    the first chat or CRUD request doesn't pay for it.
+    """
+    problems = validate_config(os.environ)
+    if problems:
+        raise ValueError('; '.join(problems))
+
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    CORS(app)
+    app.register_blueprint(api)
+
+    if WRITE_BEHIND:
+        _start_outbox()
+    if warm is None:
+        warm = os.getenv('WARM_UP', '').lower() in ('1', 'true', 'yes')
+    if warm:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    return app
+
+# `app` for entry points that expect a module-level WSGI app (gunicorn app:app, flask run). It is
+# built on first access, so importing this module still doesn't check configuration or start anything.
+_app = None
+_app_lock = threading.Lock()
+
+def __getattr__(name):
+    global _app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _app_lock:
+        if _app is None:
+            _app = create_app()
+    return _app
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0')
+    create_app().run(debug=True, host='0.0.0.0')
@@ -0,0 +1,897 @@
+"""Async serving mode: the routes and response shapes of app.py on Quart.
+
+Supabase is called through its async client and Gemini through its async
+API, so a worker keeps hundreds of requests in flight while they wait on
+the network instead of holding a thread for each. Supabase requests share
+one pooled keep-alive httpx client per worker; Gemini shares its gRPC
+channel.
+
+    hypercorn 'asgi:create_app()' --bind 0.0.0.0:5000
+
+The response cache, read coalescing, write-behind outbox and compression
+of the sync app are not used here; put a compressing proxy in front if
+needed.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import date
+
+import httpx
+
+# h2 (httpx[http2]) is optional; without it Supabase is reached over HTTP/1.1
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+from quart import Blueprint, Quart, Response, g, request, jsonify
+from quart.wrappers.response import IterableBody
+from quart_cors import cors
+
+from app import (logger, model, answer_cache, chat_context, chat_buckets, gemini_breaker, goal_row, progress_row,
+                 achievement_row, CHAT_POOL_MAX_SESSIONS, CHAT_HISTORY_HYDRATE_LIMIT, BULK_CHUNK_SIZE,
+                 BULK_MAX_ENTRIES, WEEKLY_SCORES_MAX_WEEKS, DASHBOARD_MAX_ROWS, DASHBOARD_TIMEOUT,
+                 GEMINI_GUARD_OPTIONS, SERIES_PAGE_SIZE, WRITE_METHODS, FOOD_IMAGE_MAX_BYTES, FOOD_IMAGE_MAX_SIDE,
+                 dashboard_since, food_cache, food_contents, food_unavailable, observe_food_model,
+                 observe_food_upload, known_columns, table_schemas, valid_changes, valid_row)
+from clients import LazyClient, validate_config
+from admission import AsyncAdmissionGate, Rejected
+from schemas import InvalidRow
+from idempotency import AsyncIdempotencyStore, InProgress, KeyReused, MAX_KEY_LENGTH, fingerprint, should_store
+from resilience import AsyncCallGuard, CircuitOpen
+from metrics import FOOD_ANALYSES, Gauge, TracedSupabase, observe_request, registry, start_request
+from chat_context import Conversation
+from chat_sessions import history_from_rows
+from pagination import date_range, date_range_args, order_arg, page_args, page_query, page_rows, select_columns
+from encoding import FastJSONProvider
+from bulk import NDJSON_MIMETYPES, parse_ndjson, prepare, summarize, insert_in_chunks_async
+from weekly_scores import SOURCE_FIELDS, increments, weekly_scores, rebuilt_totals, week_start
+from series import METRICS, series, series_args
+from gamification import TABLE_STREAKS, AsyncProgressEngine
+from food_analysis import decode_image, parse_analysis, prepare_image
+
+# Connection pool shared by every Supabase request in the worker. HTTP/2 multiplexes the
+# in-flight requests over a few connections; httpx's HTTP/1.1 pool slows down sharply with
+# hundreds of connections. SUPABASE_H2C=1 speaks HTTP/2 to plain-http endpoints that support it.
+# Both need the h2 package.
+ASYNC_MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', '100'))
+ASYNC_MAX_KEEPALIVE = int(os.getenv('ASYNC_MAX_KEEPALIVE', '50'))
+ASYNC_HTTP_TIMEOUT = float(os.getenv('ASYNC_HTTP_TIMEOUT', '30'))
+SUPABASE_H2C = os.getenv('SUPABASE_H2C', '').lower() in ('1', 'true', 'yes')
+
+supabase = None  # AsyncClient, connected when the server starts
+_http = None
+
+async def connect():
+    global supabase, _http
+    http2 = h2 is not None
+    if not http2:
+        logger.warning("h2 is not installed; Supabase requests use HTTP/1.1")
+    from supabase import AsyncClientOptions, acreate_client
+    _http = httpx.AsyncClient(limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS,
+                                                  max_keepalive_connections=ASYNC_MAX_KEEPALIVE),
+                              timeout=ASYNC_HTTP_TIMEOUT, http1=not (SUPABASE_H2C and http2), http2=http2,
+                              follow_redirects=True)
+    supabase = TracedSupabase(await acreate_client(os.getenv('EXPO_PUBLIC_SUPABASE_URL'),
+                                                   os.getenv('EXPO_PUBLIC_SUPABASE_ANON_KEY'),
+                                                   AsyncClientOptions(httpx_client=_http)))
+    # Importing and configuring the Gemini SDK blocks, so do it off the event loop
+    await asyncio.to_thread(model.get)
+
+async def disconnect():
+    if _http is not None:
+        await _http.aclose()
+
+# Fire-and-forget work (weekly totals) is kept referenced until it finishes
+_background = set()
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+async def _record_weekly(table, rows, sign=1):
+    try:
+        for params in increments(table, rows, sign):
+            await supabase.rpc('increment_weekly_totals', params).execute()
+    except Exception as e:
+        logger.error(f"Error updating weekly totals from {table}: {str(e)}")
+
+# Streaks and achievements, as in the sync app; updates are applied one at a time in write order
+progress = AsyncProgressEngine(LazyClient(lambda: supabase),
+                               max_users=int(os.getenv('GAMIFICATION_CACHE_USERS', '10000')))
+_progress_lock = None
+
+def _progress_turn():
+    global _progress_lock
+    if _progress_lock is None:
+        _progress_lock = asyncio.Lock()
+    return _progress_lock
+
+async def _record_progress(table, rows):
+    try:
+        async with _progress_turn():
+            await progress.record(table, rows)
+    except Exception as e:
+        logger.error(f"Error updating streaks and achievements from {table}: {str(e)}")
+
+api = Blueprint('api', __name__)
+
+# Request timing and Server-Timing, as in the sync app
+@api.before_app_request
+async def start_timing():
+    g.request_started = start_request()
+
+@api.after_app_request
+async def record_timing(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    response.headers['Server-Timing'] = observe_request(request.method, route, response.status_code, started,
+                                                        request.content_length, response.content_length)
+    return response
+
+# Idempotency-Key on writes, as in the sync app
+idempotency = AsyncIdempotencyStore(max_entries=int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '5000')),
+                                    ttl=float(os.getenv('IDEMPOTENCY_TTL', '86400')),
+                                    max_wait=float(os.getenv('IDEMPOTENCY_MAX_WAIT', '60')))
+
+def _stored_headers(response):
+    return [(name, value) for name, value in response.headers.items()
+            if name not in ('Content-Length', 'Server-Timing')]
+
+@api.before_app_request
+async def replay_idempotent():
+    key = request.headers.get('Idempotency-Key')
+    if not key or request.method not in WRITE_METHODS:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        return jsonify({'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'}), 400
+    body = await request.get_data()
+    data = await request.get_json(silent=True)
+    user_id = request.args.get('user_id') or (data.get('user_id') if isinstance(data, dict) else None)
+    key = (user_id or request.remote_addr, key)
+    try:
+        stored = await idempotency.begin(key, fingerprint(request.method, request.full_path, body))
+    except KeyReused:
+        return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+    except InProgress:
+        return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409, {'Retry-After': '1'}
+    if stored is not None:
+        response = Response(stored.body, status=stored.status, headers=stored.headers)
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+    g.idempotency_key = key
+    return None
+
+async def _recorded_stream(key, status, headers, chunks):
+    body, finished = [], False
+    try:
+        async with chunks as iterator:
+            async for chunk in iterator:
+                body.append(chunk.encode() if isinstance(chunk, str) else chunk)
+                yield chunk
+        finished = True
+    finally:
+        if finished and not (body and body[-1].startswith(b'event: error')):
+            idempotency.complete(key, status, headers, b''.join(body))
+        else:
+            idempotency.release(key)
+
+@api.after_app_request
+async def store_idempotent(response):
+    key = g.pop('idempotency_key', None)
+    if key is None:
+        return response
+    if not should_store(response.status_code):
+        idempotency.release(key)
+    elif isinstance(response.response, IterableBody):
+        response.response = IterableBody(_recorded_stream(key, response.status_code, _stored_headers(response),
+                                                          response.response))
+    else:
+        idempotency.complete(key, response.status_code, _stored_headers(response), await response.get_data())
+    return response
+
+@api.teardown_app_request
+async def release_idempotent(error):
+    key = g.pop('idempotency_key', None)
+    if key is not None:
+        idempotency.release(key)
+
+@api.route('/metrics', methods=['GET'])
+async def get_metrics():
+    return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# --- Chat ---
+class Conversations:
+    """Per-user chat conversations for the event loop, least recently used evicted first.
+
+    A user's turns run one at a time under an asyncio lock; the first turn
+    hydrates the conversation from chat_history. Entries with a turn running
+    or waiting are never evicted, so a user can't end up with two locks.
+    """
+
+    def __init__(self, max_users=500):
+        self._max_users = max_users
+        self._entries = OrderedDict()  # user_id -> [lock, conversation, turns holding or awaiting the lock]
+
+    @asynccontextmanager
+    async def hold(self, user_id):
+        if not user_id:
+            # Anonymous requests get a one-off conversation with no shared history
+            yield None
+            return
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = [asyncio.Lock(), None, 0]
+        else:
+            self._entries.move_to_end(user_id)
+        entry[2] += 1
+        try:
+            self._evict()
+            async with entry[0]:
+                if entry[1] is None:
+                    conversation = Conversation()
+                    chat_context.extend(conversation, history_from_rows(await _load_chat_history(user_id)))
+                    entry[1] = conversation
+                yield entry[1]
+        finally:
+            entry[2] -= 1
+            self._evict()
+
+    def _evict(self):
+        # The pool may run over max_users while the entries past it are in use
+        excess = len(self._entries) - self._max_users
+        if excess > 0:
+            for user_id in [user_id for user_id, entry in self._entries.items() if not entry[2]][:excess]:
+                del self._entries[user_id]
+
+    def __len__(self):
+        return len(self._entries)
+
+conversations = Conversations(max_users=CHAT_POOL_MAX_SESSIONS)
+
+# Same limits as the sync app; an async worker has no thread pool to protect, but Gemini
+# quota and memory still bound how many chats should run at once
+chat_gate = AsyncAdmissionGate(max_concurrent=int(os.getenv('CHAT_MAX_CONCURRENT', '8')),
+                               max_queue=int(os.getenv('CHAT_MAX_QUEUE', '16')),
+                               max_wait=float(os.getenv('CHAT_QUEUE_TIMEOUT', '2')))
+
+async def _admit_chat(key):
+    wait = chat_buckets.take(key)
+    if wait:
+        raise Rejected('rate limited', wait)
+    return await chat_gate.acquire()
+
+def _chat_rejected(e):
+    logger.warning("Rejected chat request: %s", e, extra={'retry_after': e.retry_after})
+    return jsonify({'error': f'Coach is busy ({e}), try again shortly', 'retry_after': e.retry_after}), \
+        429, {'Retry-After': str(e.retry_after)}
+
+# Same deadlines, retries, hedging and breaker as the sync app; losing hedges are cancelled
+gemini = AsyncCallGuard(gemini_breaker, **GEMINI_GUARD_OPTIONS)
+
+registry.add(Gauge('chat_requests', 'Coach chat requests being answered or queued.', ('phase',),
+                   lambda: {('active',): chat_gate.active, ('waiting',): chat_gate.waiting}))
+
+def _gemini_unavailable(e):
+    logger.warning("Gemini circuit open, retry in %ss", e.retry_after)
+    return jsonify({'error': 'Coach is temporarily unavailable, try again shortly', 'retry_after': e.retry_after}), \
+        503, {'Retry-After': str(e.retry_after)}
+
+async def _load_chat_history(user_id):
+    try:
+        res = await supabase.table('chat_history').select('message, is_user').eq('user_id', user_id) \
+            .order('timestamp', desc=True).limit(CHAT_HISTORY_HYDRATE_LIMIT).execute()
+        return list(reversed(res.data or []))
+    except Exception as e:
+        logger.error(f"Error hydrating chat session for {user_id}: {str(e)}")
+        return []
+
+async def _store_chat_message(user_id, message, is_user):
+    await supabase.table('chat_history').insert({
+        'user_id': user_id,
+        'message': message,
+        'is_user': is_user
+    }).execute()
+
+def _record_turn(conversation, user_message, ai_reply):
+    if conversation is not None:
+        chat_context.extend(conversation, [{'role': 'user', 'parts': [user_message]},
+                                           {'role': 'model', 'parts': [ai_reply]}])
+
+def _remember_answer(fresh, user_message, ai_reply, started):
+    answer_cache.observe_latency(time.perf_counter() - started)
+    # Only answers given without prior context are generic enough to share
+    if fresh:
+        answer_cache.put(user_message, ai_reply)
+
+@api.route('/cache/stats', methods=['GET'])
+async def get_cache_stats():
+    return jsonify({
+        'chat_context': chat_context.stats(),
+        'conversations': len(conversations),
+        'answer_cache': answer_cache.stats(),
+        'chat_admission': {**chat_gate.stats(), **chat_buckets.stats()},
+        'gemini': gemini.stats(),
+        'idempotency': idempotency.stats(),
+        'gamification': progress.stats(),
+        'food_analysis': food_cache.stats()
+    }), 200
+
+@api.route('/gemini-chat', methods=['POST'])
+async def gemini_chat():
+    try:
+        data = await request.get_json(force=True)
+        if not data or 'message' not in data:
+            return jsonify({'error': 'No message provided'}), 400
+
+        user_message = data['message']
+        user_id = data.get('user_id')
+        logger.info("Processing chat message", extra={'user_id': user_id, 'message_chars': len(user_message)})
+        logger.debug("Chat message: %s", user_message, extra={'user_id': user_id})
+
+        try:
+            ticket = await _admit_chat(user_id or request.remote_addr)
+        except Rejected as e:
+            return _chat_rejected(e)
+
+        if _wants_event_stream():
+            return Response(_stream_chat_reply(user_id, user_message, ticket), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+        try:
+            async with conversations.hold(user_id) as conversation:
+                return await _send_chat_message(conversation, user_id, user_message)
+        finally:
+            await chat_gate.release(ticket)
+    except Exception as e:
+        logger.error(f"Error in gemini_chat: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+async def _send_chat_message(conversation, user_id, user_message):
+    if user_id:
+        await _store_chat_message(user_id, user_message, True)
+
+    try:
+        history = chat_context.history(conversation) if conversation is not None else []
+        # Shared answers only stand in for a first turn; mid-conversation questions depend on context
+        ai_reply = None if history else answer_cache.get(user_message)
+        if ai_reply is None:
+            started = time.perf_counter()
+            contents = [*history, {'role': 'user', 'parts': [user_message]}]
+            response = await gemini.call(lambda timeout: model.generate_content_async(
+                contents, request_options={'timeout': timeout}))
+            ai_reply = response.text if hasattr(response, 'text') else ''
+            _remember_answer(not history, user_message, ai_reply, started)
+        _record_turn(conversation, user_message, ai_reply)
+        logger.info("Generated response", extra={'user_id': user_id, 'reply_chars': len(ai_reply)})
+
+        if user_id and ai_reply:
+            await _store_chat_message(user_id, ai_reply, False)
+
+        return jsonify({'content': ai_reply}), 200
+    except CircuitOpen as e:
+        return _gemini_unavailable(e)
+    except Exception as e:
+        logger.error(f"Error generating response: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# --- Server-Sent Events streaming for /gemini-chat ---
+def _wants_event_stream():
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def _sse(payload, event=None):
+    body = f"data: {json.dumps(payload)}\n\n"
+    return f"event: {event}\n{body}" if event else body
+
+async def _stream_chat_reply(user_id, user_message, ticket):
+    try:
+        async with conversations.hold(user_id) as conversation:
+            async for event in _stream_chat_message(conversation, user_id, user_message):
+                yield event
+    except Exception as e:
+        logger.error(f"Error in gemini_chat stream: {str(e)}")
+        yield _sse({'error': str(e)}, event='error')
+    finally:
+        await chat_gate.release(ticket)
+
+async def _stream_chat_message(conversation, user_id, user_message):
+    if user_id:
+        await _store_chat_message(user_id, user_message, True)
+
+    chunks = []
+    try:
+        history = chat_context.history(conversation) if conversation is not None else []
+        cached = None if history else answer_cache.get(user_message)
+        if cached is not None:
+            chunks.append(cached)
+            yield _sse({'delta': cached})
+        else:
+            started = time.perf_counter()
+            contents = [*history, {'role': 'user', 'parts': [user_message]}]
+            async for chunk in gemini.stream(lambda timeout: model.generate_content_async(
+                    contents, stream=True, request_options={'timeout': timeout})):
+                text = getattr(chunk, 'text', '')
+                if text:
+                    chunks.append(text)
+                    yield _sse({'delta': text})
+            _remember_answer(not history, user_message, ''.join(chunks), started)
+    except CircuitOpen as e:
+        logger.warning("Gemini circuit open, retry in %ss", e.retry_after)
+        yield _sse({'error': 'Coach is temporarily unavailable, try again shortly',
+                    'retry_after': e.retry_after}, event='error')
+        return
+    except Exception as e:
+        logger.error(f"Error streaming response: {str(e)}")
+        yield _sse({'error': str(e)}, event='error')
+        return
+
+    ai_reply = ''.join(chunks)
+    _record_turn(conversation, user_message, ai_reply)
+    logger.info("Generated response", extra={'user_id': user_id, 'reply_chars': len(ai_reply)})
+    if user_id and ai_reply:
+        await _store_chat_message(user_id, ai_reply, False)
+    yield _sse({'content': ai_reply}, event='done')
+
+# --- Meal photo analysis ---
+def _prepare_food_image(image_base64):
+    raw = decode_image(image_base64)
+    return raw, prepare_image(raw, FOOD_IMAGE_MAX_SIDE)
+
+@api.route('/analyze-food', methods=['POST'])
+async def analyze_food():
+    data = await request.get_json(silent=True) or {}
+    image_base64 = data.get('imageBase64')
+    if not image_base64:
+        return jsonify({'error': 'Image data is required'}), 400
+    if isinstance(image_base64, str) and len(image_base64) > FOOD_IMAGE_MAX_BYTES * 4 // 3 + 64:
+        return jsonify({'error': 'Image is too large'}), 413
+    user_id = data.get('userId') or data.get('user_id')
+    try:
+        # Decoding and resizing a photo is CPU work, so it runs off the event loop
+        raw, image = await asyncio.to_thread(_prepare_food_image, image_base64)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    analysis = food_cache.get(user_id, image.key)
+    if analysis is not None:
+        FOOD_ANALYSES.inc('cache')
+        return jsonify({'analysis': analysis, 'cached': True}), 200
+
+    try:
+        observe_food_upload(len(raw), image)
+        contents = food_contents(image)
+        started = time.perf_counter()
+        response = await gemini.call(lambda timeout: model.generate_content_async(
+            contents, request_options={'timeout': timeout}))
+        observe_food_model(started)
+        text = response.text if hasattr(response, 'text') else ''
+    except CircuitOpen as e:
+        body, status, headers = food_unavailable(e)
+        return jsonify(body), status, headers
+    except Exception as e:
+        logger.error(f"Error analyzing food image: {str(e)}")
+        return jsonify({'error': 'Failed to analyze food image', 'details': str(e)}), 500
+
+    try:
+        analysis = parse_analysis(text)
+    except ValueError as e:
+        logger.error("Failed to parse Gemini food analysis", extra={'user_id': user_id, 'reply_chars': len(text)})
+        return jsonify({'error': 'Failed to analyze food image. Please try again.', 'details': str(e)}), 500
+    FOOD_ANALYSES.inc('model')
+    food_cache.put(user_id, image.key, analysis)
+    return jsonify({'analysis': analysis, 'cached': False}), 200
+
+# --- Supabase CRUD, one set of handlers per table ---
+def _user_row(data):
+    row = {k: v for k, v in data.items() if k != 'user_id'}
+    row['user_id'] = data['user_id']
+    return row
+
+def _invalid_row(e):
+    return jsonify({'error': str(e), 'fields': e.errors}), 400
+
+def _list_view(table, key, sort_column=None):
+    async def view():
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'user_id required'}), 400
+        try:
+            limit, after = page_args(request.args, sort_column)
+            # Tables listed by date take a from/to range; those and chat history take an order
+            dated = sort_column == 'date'
+            first, last = date_range_args(request.args) if dated else (None, None)
+            desc = order_arg(request.args) if sort_column in ('date', 'timestamp') else False
+            columns = select_columns(request.args, 'id', *([sort_column] if sort_column else []),
+                                     known=known_columns(table))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        try:
+            query = date_range(supabase.table(table).select(columns).eq('user_id', user_id), 'date', first, last)
+            res = await page_query(query, limit, after, sort_column, desc).execute()
+            rows, next_cursor = page_rows(res.data, limit, sort_column)
+            return jsonify({key: rows, 'next_cursor': next_cursor}), 200
+        except Exception as e:
+            logger.error(f"Error retrieving {table}: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+    return view
+
+async def _bulk_insert(table, key, entries):
+    if len(entries) > BULK_MAX_ENTRIES:
+        return jsonify({'error': f'at most {BULK_MAX_ENTRIES} entries per request'}), 400
+
+    outcomes, rows, positions = prepare(entries, request.args.get('user_id'), table_schemas.get(table))
+    async def insert_many(chunk):
+        return (await supabase.table(table).insert(chunk, default_to_null=False).execute()).data
+    for index, outcome in zip(positions, await insert_in_chunks_async(insert_many, rows, BULK_CHUNK_SIZE)):
+        outcomes[index] = outcome
+    if table in SOURCE_FIELDS:
+        _spawn(_record_weekly(table, [outcome for outcome in outcomes if isinstance(outcome, dict)]))
+    if table in TABLE_STREAKS:
+        _spawn(_record_progress(table, [outcome for outcome in outcomes if isinstance(outcome, dict)]))
+
+    body, status = summarize(outcomes, key)
+    if body['failed']:
+        logger.error(f"Bulk insert into {table}: {body['failed']} of {len(outcomes)} entries failed")
+    return jsonify(body), status
+
+async def _bulk_entries():
+    if request.mimetype in NDJSON_MIMETYPES:
+        return parse_ndjson(await request.get_data(as_text=True))
+    data = await request.get_json(silent=True)
+    return data if isinstance(data, list) else None
+
+def _create_view(table, key, label, required, build, bulk, added):
+    async def view():
+        if bulk:
+            entries = await _bulk_entries()
+            if entries is not None:
+                return await _bulk_insert(table, key, entries)
+        data = await request.get_json()
+        if not data.get('user_id') or not data.get(required):
+            return jsonify({'error': f'user_id and {required} required'}), 400
+        try:
+            res = await supabase.table(table).insert(valid_row(table, build(data))).execute()
+            if table in SOURCE_FIELDS:
+                _spawn(_record_weekly(table, res.data))
+            if table in TABLE_STREAKS:
+                _spawn(_record_progress(table, res.data))
+            return jsonify({'message': added or f'{label} added!', key: res.data[0]}), 201
+        except InvalidRow as e:
+            return _invalid_row(e)
+        except Exception as e:
+            logger.error(f"Error adding {key}: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+    return view
+
+def _update_view(table, key, label):
+    async def view(row_id):
+        data = await request.get_json()
+        user_id = data.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'user_id required'}), 400
+        try:
+            update_data = valid_changes(table, data)
+            before = None
+            if table in SOURCE_FIELDS:
+                # The row as it was comes off the weekly totals and the edited row goes on
+                before = (await supabase.table(table).select('*').eq('id', row_id).eq('user_id', user_id)
+                          .execute()).data
+            res = await supabase.table(table).update(update_data).eq('id', row_id).eq('user_id', user_id).execute()
+            if before and res.data:
+                _spawn(_record_weekly(table, before, sign=-1))
+                _spawn(_record_weekly(table, res.data))
+            return jsonify({'message': f'{label} updated!', key: res.data[0]}), 200
+        except InvalidRow as e:
+            return _invalid_row(e)
+        except Exception as e:
+            logger.error(f"Error updating {key}: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+    return view
+
+def _delete_view(table, key, label):
+    async def view(row_id):
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'user_id required'}), 400
+        try:
+            res = await supabase.table(table).delete().eq('id', row_id).eq('user_id', user_id).execute()
+            if table in SOURCE_FIELDS:
+                _spawn(_record_weekly(table, res.data, sign=-1))
+            return jsonify({'message': f'{label} deleted!'}), 200
+        except Exception as e:
+            logger.error(f"Error deleting {key}: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+    return view
+
+def _resource(path, table, key, label, sort_column=None, methods=('list', 'create'), required='date',
+              build=_user_row, bulk=False, added=None):
+    if 'list' in methods:
+        api.add_url_rule(path, f'list_{table}', _list_view(table, table, sort_column), methods=['GET'])
+    if 'create' in methods:
+        api.add_url_rule(path, f'create_{table}', _create_view(table, key, label, required, build, bulk, added),
+                         methods=['POST'])
+    if 'update' in methods:
+        api.add_url_rule(f'{path}/<row_id>', f'update_{table}', _update_view(table, key, label), methods=['PUT'])
+    if 'delete' in methods:
+        api.add_url_rule(f'{path}/<row_id>', f'delete_{table}', _delete_view(table, key, label), methods=['DELETE'])
+
+ALL = ('list', 'create', 'update', 'delete')
+
+api.add_url_rule('/gemini-chat/history', 'list_chat_history',
+                 _list_view('chat_history', 'history', 'timestamp'), methods=['GET'])
+_resource('/goals', 'goals', 'goal', 'Goal', 'created', ALL, required='title', build=goal_row,
+          added='Goal added successfully!')
+_resource('/progress', 'progress', 'entry', 'Progress', 'date', build=progress_row)
+_resource('/achievements', 'achievements', 'achievement', 'Achievement', None, ('list', 'create', 'update'),
+          required='name', build=achievement_row)
+_resource('/challenges', 'challenges', 'challenge', 'Challenge', None, ('list', 'update'))
+_resource('/shots', 'shots', 'shot', 'Shot', 'date', ALL)
+_resource('/weight-logs', 'weight_logs', 'weight_log', 'Weight log', 'date', ALL, bulk=True)
+_resource('/side-effects', 'side_effects', 'side_effect', 'Side effect', 'date', ALL)
+_resource('/meals', 'meals', 'meal', 'Meal', 'date', ALL, bulk=True)
+_resource('/saved-meals', 'saved_meals', 'saved_meal', 'Saved meal', None, ('list', 'create', 'delete'),
+          required='meal_id', build=lambda data: {'user_id': data['user_id'], 'meal_id': data['meal_id']})
+_resource('/water-logs', 'water_logs', 'water_log', 'Water log', 'date', bulk=True)
+_resource('/step-logs', 'step_logs', 'step_log', 'Step log', 'date', bulk=True)
+_resource('/daily-logs', 'daily_logs', 'daily_log', 'Daily log', 'date')
+_resource('/journey-stages', 'journey_stages', 'journey_stage', 'Journey stage', None,
+          ('list', 'create', 'update'), required='title')
+
+# --- Supabase CRUD for users (profile) and streaks, one row per user ---
+@api.route('/users', methods=['GET'])
+async def get_user():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    try:
+        columns = select_columns(request.args, known=known_columns('users'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        res = await supabase.table('users').select(columns).eq('id', user_id).single().execute()
+        return jsonify({'user': res.data}), 200
+    except Exception as e:
+        logger.error(f"Error retrieving user: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/users', methods=['POST'])
+async def add_user():
+    data = await request.get_json()
+    if not data.get('id') or not data.get('name'):
+        return jsonify({'error': 'id and name required'}), 400
+    try:
+        res = await supabase.table('users').insert(valid_row('users', data)).execute()
+        return jsonify({'message': 'User added!', 'user': res.data[0]}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
+    except Exception as e:
+        logger.error(f"Error adding user: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/users/<user_id>', methods=['PUT'])
+async def update_user(user_id):
+    data = await request.get_json()
+    try:
+        res = await supabase.table('users').update(valid_changes('users', data)).eq('id', user_id).execute()
+        return jsonify({'message': 'User updated!', 'user': res.data[0]}), 200
+    except InvalidRow as e:
+        return _invalid_row(e)
+    except Exception as e:
+        logger.error(f"Error updating user: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/streaks', methods=['GET'])
+async def get_streaks():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    try:
+        columns = select_columns(request.args, known=known_columns('streaks'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        res = await supabase.table('streaks').select(columns).eq('user_id', user_id).single().execute()
+        return jsonify({'streaks': res.data}), 200
+    except Exception as e:
+        logger.error(f"Error retrieving streaks: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/streaks', methods=['POST'])
+async def add_streaks():
+    data = await request.get_json()
+    if not data.get('user_id'):
+        return jsonify({'error': 'user_id required'}), 400
+    try:
+        res = await supabase.table('streaks').insert(valid_row('streaks', data)).execute()
+        return jsonify({'message': 'Streaks added!', 'streaks': res.data[0]}), 201
+    except InvalidRow as e:
+        return _invalid_row(e)
+    except Exception as e:
+        logger.error(f"Error adding streaks: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/streaks/<streak_id>', methods=['PUT'])
+async def update_streaks(streak_id):
+    data = await request.get_json()
+    user_id = data.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    try:
+        res = await supabase.table('streaks').update(valid_changes('streaks', data)).eq('id', streak_id).eq('user_id', user_id).execute()
+        return jsonify({'message': 'Streaks updated!', 'streaks': res.data[0]}), 200
+    except InvalidRow as e:
+        return _invalid_row(e)
+    except Exception as e:
+        logger.error(f"Error updating streaks: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# --- Weekly scores ---
+@api.route('/scores/weekly', methods=['GET'])
+async def get_weekly_scores():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    try:
+        today = date.today().isoformat()
+        first = week_start(request.args.get('from') or request.args.get('week') or today)
+        last = week_start(request.args.get('to') or request.args.get('week') or today)
+    except ValueError:
+        return jsonify({'error': 'dates must be YYYY-MM-DD'}), 400
+    if last < first:
+        return jsonify({'error': 'from must not be after to'}), 400
+    if (last - first).days // 7 + 1 > WEEKLY_SCORES_MAX_WEEKS:
+        return jsonify({'error': f'at most {WEEKLY_SCORES_MAX_WEEKS} weeks per request'}), 400
+    try:
+        res = await supabase.table('weekly_totals').select('*').eq('user_id', user_id) \
+            .gte('week_start', first.isoformat()).lte('week_start', last.isoformat()).execute()
+        return jsonify({'scores': weekly_scores(first, last, res.data)}), 200
+    except Exception as e:
+        logger.error(f"Error retrieving weekly scores: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/achievements/rebuild', methods=['POST'])
+async def rebuild_achievements():
+    data = await request.get_json()
+    user_id = data.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    try:
+        await asyncio.gather(*_background)
+        async with _progress_turn():
+            unlocked = await progress.rebuild(user_id)
+        return jsonify({'message': 'Streaks and achievements rebuilt!', 'unlocked': unlocked}), 200
+    except Exception as e:
+        logger.error(f"Error rebuilding streaks and achievements: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/scores/weekly/rebuild', methods=['POST'])
+async def rebuild_weekly_scores():
+    data = await request.get_json()
+    user_id = data.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    try:
+        # Let pending increments land first so they aren't applied on top of the rebuilt totals
+        await asyncio.gather(*_background)
+        tables = list(SOURCE_FIELDS)
+        results = await asyncio.gather(*(supabase.table(table).select('*').eq('user_id', user_id).execute()
+                                         for table in tables))
+        totals = rebuilt_totals(user_id, {table: res.data for table, res in zip(tables, results)})
+        await supabase.table('weekly_totals').delete().eq('user_id', user_id).execute()
+        if totals:
+            await supabase.table('weekly_totals').insert(totals).execute()
+        return jsonify({'message': 'Weekly scores rebuilt!', 'weeks': len(totals)}), 200
+    except Exception as e:
+        logger.error(f"Error rebuilding weekly scores: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# --- Chart series ---
+async def _series_rows(table, column, user_id, first, last):
+    rows, after = [], None
+    while True:
+        query = supabase.table(table).select(f'id,date,{column}').eq('user_id', user_id)
+        page = (await page_query(date_range(query, 'date', first, last), SERIES_PAGE_SIZE, after,
+                                 'date').execute()).data or []
+        rows.extend(page[:SERIES_PAGE_SIZE])
+        if len(page) <= SERIES_PAGE_SIZE:
+            return rows
+        after = [rows[-1]['date'], rows[-1]['id']]
+
+@api.route('/series/<metric>', methods=['GET'])
+async def get_series(metric):
+    if metric not in METRICS:
+        return jsonify({'error': f"unknown series: {metric}"}), 404
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    try:
+        first, last, bucket, points = series_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    table, column, value = METRICS[metric]
+    try:
+        rows = await _series_rows(table, column, user_id, first, last)
+        result, buckets = series(rows, column, bucket, points, value)
+        return jsonify({'series': result, 'metric': metric, 'bucket': bucket, 'value': value,
+                        'buckets': buckets, 'rows': len(rows)}), 200
+    except Exception as e:
+        logger.error(f"Error retrieving {metric} series: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# --- Aggregated dashboard ---
+def _dashboard_single(table, column):
+    async def fetch(user_id, since):
+        res = await supabase.table(table).select('*').eq(column, user_id).limit(1).execute()
+        return res.data[0] if res.data else None
+    return fetch
+
+def _dashboard_recent(table):
+    async def fetch(user_id, since):
+        res = await supabase.table(table).select('*').eq('user_id', user_id).gte('date', since) \
+            .order('date', desc=True).order('id', desc=True).limit(DASHBOARD_MAX_ROWS).execute()
+        return list(reversed(res.data or []))
+    return fetch
+
+DASHBOARD_SECTIONS = {
+    'user': _dashboard_single('users', 'id'),
+    'streaks': _dashboard_single('streaks', 'user_id'),
+    'weight_logs': _dashboard_recent('weight_logs'),
+    'step_logs': _dashboard_recent('step_logs'),
+    'water_logs': _dashboard_recent('water_logs'),
+    'meals': _dashboard_recent('meals'),
+    'daily_logs': _dashboard_recent('daily_logs'),
+    'shots': _dashboard_recent('shots'),
+}
+
+@api.route('/dashboard', methods=['GET'])
+async def get_dashboard():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    sections = request.args.get('sections')
+    sections = [name.strip() for name in sections.split(',') if name.strip()] if sections else list(DASHBOARD_SECTIONS)
+    unknown = [name for name in sections if name not in DASHBOARD_SECTIONS]
+    if unknown:
+        return jsonify({'error': f"unknown sections: {', '.join(unknown)}"}), 400
+    try:
+        since = dashboard_since(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    tasks = {name: asyncio.create_task(DASHBOARD_SECTIONS[name](user_id, since)) for name in sections}
+    await asyncio.wait(tasks.values(), timeout=DASHBOARD_TIMEOUT)
+    dashboard, errors = {}, {}
+    for name, task in tasks.items():
+        if not task.done():
+            task.cancel()
+            errors[name] = 'timed out'
+        elif task.exception() is not None:
+            errors[name] = str(task.exception())
+        else:
+            dashboard[name] = task.result()
+    for name, error in errors.items():
+        logger.error(f"Error retrieving dashboard section {name}: {error}")
+    return jsonify({'dashboard': dashboard, 'since': since, 'errors': errors}), 200
+
+def create_app():
+    """Build the Quart app; the async clients connect when the server starts serving."""
+    problems = validate_config(os.environ)
+    if problems:
+        raise ValueError('; '.join(problems))
+
+    app = Quart(__name__)
+    app.json = FastJSONProvider(app)
+    app = cors(app)
+    app.register_blueprint(api)
+    app.before_serving(connect)
+    app.after_serving(disconnect)
+    return app
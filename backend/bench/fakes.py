@@ -0,0 +1,454 @@
+"""Local stand-ins for Supabase and Gemini, for benchmarks.
+
+FakeSupabase answers the subset of the supabase-py query builder the
+backend uses from an in-memory SQLite database, one table per Supabase
+table with each row kept as a JSON document. FakeGemini replies with
+canned text after a configurable delay. Both can add latency with jitter
+and are safe to share between request threads.
+"""
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+from weekly_scores import TOTAL_COLUMNS
+
+_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+_OPERATORS = {'eq': '=', 'neq': '!=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+# Column defaults the real schema fills in on insert
+_DEFAULTS = {
+    'chat_history': {'is_user': lambda: True, 'timestamp': lambda: datetime.now(timezone.utc).isoformat()},
+    'goals': {'created': lambda: datetime.now(timezone.utc).isoformat()},
+    'users': {'created_at': lambda: datetime.now(timezone.utc).isoformat()},
+}
+
+# Tables keyed by something other than a generated id
+_NO_ID = {'weekly_totals'}
+
+
+class FakeAPIError(Exception):
+    # Shaped like postgrest's APIError: a message plus a Postgres error code
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+def _column(name):
+    if not _NAME.match(name):
+        raise FakeAPIError(f'unsupported column {name!r}', 'PGRST100')
+    return f"json_extract(doc, '$.{name}')"
+
+
+def _split(text):
+    # Split a PostgREST filter list on top-level commas, leaving quoted values and and(...) whole
+    items, depth, quoted, start, index = [], 0, False, 0, 0
+    while index < len(text):
+        char = text[index]
+        if quoted:
+            if char == '\\':
+                index += 1
+            elif char == '"':
+                quoted = False
+        elif char == '"':
+            quoted = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and not depth:
+            items.append(text[start:index])
+            start = index + 1
+        index += 1
+    items.append(text[start:])
+    return [item.strip() for item in items if item.strip()]
+
+
+def _unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', value[1:-1])
+    return value
+
+
+def _parse_filters(text, joiner):
+    # 'a.gt.1,and(a.eq.1,id.gt.x)' -> SQL and parameters
+    clauses, params = [], []
+    for item in _split(text):
+        group = re.match(r'^(and|or)\((.*)\)$', item)
+        if group:
+            clause, values = _parse_filters(group.group(2), ' AND ' if group.group(1) == 'and' else ' OR ')
+        else:
+            column, op, value = re.match(r'^([^.]+)\.((?:not\.)?[a-z]+)\.(.*)$', item, re.S).groups()
+            if op in ('is', 'not.is') and value == 'null':
+                clause, values = f"{_column(column)} IS {'NOT ' if op == 'not.is' else ''}NULL", []
+            elif op not in _OPERATORS:
+                raise FakeAPIError(f'unsupported operator {op!r}', 'PGRST100')
+            else:
+                clause, values = f'{_column(column)} {_OPERATORS[op]} ?', [_unquote(value)]
+        clauses.append(f'({clause})')
+        params.extend(values)
+    return joiner.join(clauses), params
+
+
+class _Result:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Query:
+    def __init__(self, client, table):
+        if not _NAME.match(table):
+            raise FakeAPIError(f'unsupported table {table!r}', 'PGRST100')
+        self._client = client
+        self._table = table
+        self._action = 'select'
+        self._columns = None
+        self._payload = None
+        self._ignore_duplicates = False
+        self._where = []
+        self._params = []
+        self._order = []
+        self._limit = None
+        self._single = False
+
+    def select(self, columns='*', count=None):
+        columns = [column.strip() for column in columns.split(',') if column.strip()]
+        self._columns = None if columns == ['*'] else columns
+        return self
+
+    def insert(self, rows, default_to_null=True, **kwargs):
+        self._action, self._payload = 'insert', rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict='id', ignore_duplicates=False, default_to_null=True, **kwargs):
+        self.insert(rows)
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values):
+        self._action, self._payload = 'update', values
+        return self
+
+    def delete(self):
+        self._action = 'delete'
+        return self
+
+    def _filter(self, op, column, value):
+        self._where.append(f'{_column(column)} {_OPERATORS[op]} ?')
+        self._params.append(value)
+        return self
+
+    def eq(self, column, value):
+        return self._filter('eq', column, value)
+
+    def neq(self, column, value):
+        return self._filter('neq', column, value)
+
+    def gt(self, column, value):
+        return self._filter('gt', column, value)
+
+    def gte(self, column, value):
+        return self._filter('gte', column, value)
+
+    def lt(self, column, value):
+        return self._filter('lt', column, value)
+
+    def lte(self, column, value):
+        return self._filter('lte', column, value)
+
+    def in_(self, column, values):
+        values = list(values)
+        self._where.append(f"{_column(column)} IN ({', '.join('?' * len(values)) or 'NULL'})")
+        self._params.extend(values)
+        return self
+
+    def or_(self, filters):
+        clause, params = _parse_filters(filters, ' OR ')
+        self._where.append(f'({clause})')
+        self._params.extend(params)
+        return self
+
+    def order(self, column, desc=False, nullsfirst=None):
+        # Postgres puts nulls last ascending and first descending unless told otherwise
+        nulls = 'FIRST' if (desc if nullsfirst is None else nullsfirst) else 'LAST'
+        self._order.append(f"{_column(column)} {'DESC' if desc else 'ASC'} NULLS {nulls}")
+        return self
+
+    def limit(self, count):
+        self._limit = int(count)
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def execute(self):
+        self._client.delay()
+        with self._client.lock:
+            self._client.ensure_table(self._table)
+            rows = getattr(self, f'_{self._action}')()
+        if self._columns is not None:
+            rows = [{column: row.get(column) for column in self._columns} for row in rows]
+        if self._single:
+            if len(rows) != 1:
+                raise FakeAPIError('JSON object requested, multiple (or no) rows returned', 'PGRST116')
+            return _Result(rows[0])
+        return _Result(rows)
+
+    def _matching(self):
+        sql = f'SELECT rowid, doc FROM "{self._table}"'
+        if self._where:
+            sql += ' WHERE ' + ' AND '.join(self._where)
+        if self._order:
+            sql += ' ORDER BY ' + ', '.join(self._order)
+        if self._limit is not None:
+            sql += f' LIMIT {self._limit}'
+        return [(rowid, json.loads(doc)) for rowid, doc in self._client.db.execute(sql, self._params)]
+
+    def _select(self):
+        return [row for _, row in self._matching()]
+
+    def _insert(self):
+        inserted = []
+        for row in self._payload:
+            row = dict(row)
+            for column, default in _DEFAULTS.get(self._table, {}).items():
+                row.setdefault(column, default())
+            if self._table not in _NO_ID:
+                row.setdefault('id', str(uuid.uuid4()))
+            try:
+                self._client.db.execute(f'INSERT INTO "{self._table}" (id, doc) VALUES (?, ?)',
+                                        (row.get('id'), json.dumps(row)))
+            except sqlite3.IntegrityError:
+                if self._ignore_duplicates:
+                    continue
+                raise FakeAPIError('duplicate key value violates unique constraint', '23505')
+            inserted.append(row)
+        return inserted
+
+    def _update(self):
+        updated = []
+        for rowid, row in self._matching():
+            row.update(self._payload)
+            self._client.db.execute(f'UPDATE "{self._table}" SET doc = ? WHERE rowid = ?', (json.dumps(row), rowid))
+            updated.append(row)
+        return updated
+
+    def _delete(self):
+        deleted = self._matching()
+        self._client.db.executemany(f'DELETE FROM "{self._table}" WHERE rowid = ?', [(rowid,) for rowid, _ in deleted])
+        return [row for _, row in deleted]
+
+
+class _Rpc:
+    def __init__(self, client, name, params):
+        self._client = client
+        self._name = name
+        self._params = params
+
+    def execute(self):
+        if self._name != 'increment_weekly_totals':
+            raise FakeAPIError(f'function {self._name} does not exist', 'PGRST202')
+        self._client.delay()
+        params = self._params
+        with self._client.lock:
+            self._client.ensure_table('weekly_totals')
+            query = _Query(self._client, 'weekly_totals').eq('user_id', params['p_user_id']) \
+                .eq('week_start', params['p_week_start'])
+            existing = query._matching()
+            row = existing[0][1] if existing else {
+                'user_id': params['p_user_id'], 'week_start': params['p_week_start'],
+                **dict.fromkeys(TOTAL_COLUMNS, 0.0)}
+            for column in TOTAL_COLUMNS:
+                row[column] += float(params['p_deltas'].get(column, 0))
+            if existing:
+                self._client.db.execute('UPDATE weekly_totals SET doc = ? WHERE rowid = ?',
+                                        (json.dumps(row), existing[0][0]))
+            else:
+                self._client.db.execute('INSERT INTO weekly_totals (doc) VALUES (?)', (json.dumps(row),))
+        return _Result(None)
+
+
+class _Latency:
+    # Seeded delays of latency seconds, give or take jitter (a fraction of it)
+    def __init__(self, latency, jitter, seed):
+        self._latency = latency
+        self._jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next(self):
+        if not self._latency:
+            return 0.0
+        with self._lock:
+            spread = self._rng.uniform(-self._jitter, self._jitter)
+        return max(0.0, self._latency * (1 + spread))
+
+
+class FakeSupabase:
+    """Supabase client stand-in over an in-memory SQLite database.
+
+    Every execute() or rpc() waits latency seconds (give or take jitter,
+    a fraction of latency) before running, like a round trip to the API.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=0):
+        self.db = sqlite3.connect(':memory:', check_same_thread=False)
+        self.lock = threading.Lock()
+        self._latency = _Latency(latency, jitter, seed)
+        self._tables = set()
+        self.calls = 0
+
+    def delay(self):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self._latency.next())
+
+    def ensure_table(self, name):
+        if name in self._tables:
+            return
+        self.db.execute(f'CREATE TABLE IF NOT EXISTS "{name}" (id TEXT UNIQUE, doc TEXT NOT NULL)')
+        self.db.execute(f'CREATE INDEX IF NOT EXISTS "{name}_user" ON "{name}" (json_extract(doc, \'$.user_id\'))')
+        self._tables.add(name)
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params):
+        return _Rpc(self, name, params)
+
+    def load(self, table, rows):
+        """Insert rows directly, without latency; for seeding."""
+        with self.lock:
+            self.ensure_table(table)
+            query = _Query(self, table).insert(rows)
+            query._insert()
+            self.db.commit()
+
+
+class FakeGeminiError(Exception):
+    # Shaped like google.api_core's ServiceUnavailable
+    code = 503
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeChat:
+    # Enough of ChatSession for the backend: a settable history and send_message
+    def __init__(self, model, history):
+        self._model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream=False, **kwargs):
+        self.history.append({'role': 'user', 'parts': [content]})
+        response = self._model.generate_content(self.history, stream=stream)
+        if stream:
+            return response
+        self.history.append({'role': 'model', 'parts': [response.text]})
+        return response
+
+
+class FakeGemini:
+    """GenerativeModel stand-in with canned replies of reply_words words.
+
+    A reply arrives after latency seconds (give or take jitter); streamed
+    replies spread that delay over their chunks, so the first one comes
+    early. failure_rate of calls raise a 503-style error instead.
+    """
+
+    def __init__(self, latency=1.0, jitter=0.0, reply_words=120, chunk_words=12, failure_rate=0.0, seed=0):
+        self._latency = _Latency(latency, jitter, seed)
+        self._reply_words = reply_words
+        self._chunk_words = chunk_words
+        self._failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def start_chat(self, history=None):
+        return _FakeChat(self, history)
+
+    def _reply(self, contents):
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < self._failure_rate
+        if failed:
+            raise FakeGeminiError('503 The model is overloaded. Please try again later.')
+        if isinstance(contents, list):
+            contents = contents[-1]
+        prompt = contents['parts'][0] if isinstance(contents, dict) else str(contents)
+        filler = ('Small consistent steps add up: keep protein high, stay hydrated and '
+                  'note how you feel after each dose. ').split()
+        words = f'About "{prompt[:60]}":'.split()
+        while len(words) < self._reply_words:
+            words.extend(filler)
+        return words[:self._reply_words]
+
+    def generate_content(self, contents, stream=False, request_options=None, **kwargs):
+        delay = self._latency.next()
+        if not stream:
+            time.sleep(delay)
+            return _Chunk(' '.join(self._reply(contents)))
+        words = self._reply(contents)
+        chunks = [' '.join(words[i:i + self._chunk_words]) + ' '
+                  for i in range(0, len(words), self._chunk_words)]
+        return self._stream(chunks, delay / len(chunks))
+
+    def _stream(self, chunks, pause):
+        for chunk in chunks:
+            time.sleep(pause)
+            yield _Chunk(chunk)
+
+
+CHAT_LINES = [
+    ('What should I eat to keep my protein up on shot days?', 'Aim for a protein source at every meal.'),
+    ('I feel nauseous after my dose, is that normal?', 'Nausea is common early on; eat smaller meals.'),
+    ('How much water should I be drinking?', 'Around two litres a day is a good target.'),
+]
+
+
+def seed(client, users, days, rng, today=None):
+    """Load users users' worth of logs covering the last days days into a FakeSupabase."""
+    today = today or date.today()
+    user_ids = [f'bench-user-{index}' for index in range(users)]
+    tables = {name: [] for name in ('users', 'weight_logs', 'step_logs', 'water_logs', 'meals',
+                                    'daily_logs', 'shots', 'side_effects', 'chat_history')}
+    for user_id in user_ids:
+        weight = rng.uniform(80, 120)
+        tables['users'].append({'id': user_id, 'name': user_id, 'start_weight': round(weight, 1),
+                                'goal_weight': round(weight * 0.85, 1)})
+        for offset in range(days, 0, -1):
+            day = (today - timedelta(days=offset)).isoformat()
+            weight -= rng.uniform(-0.1, 0.25)
+            tables['weight_logs'].append({'user_id': user_id, 'date': day, 'weight': round(weight, 1)})
+            tables['step_logs'].append({'user_id': user_id, 'date': day, 'count': rng.randrange(2000, 14000)})
+            tables['water_logs'].append({'user_id': user_id, 'date': day, 'amount': rng.choice([250, 500, 750])})
+            for name in ('Breakfast', 'Dinner'):
+                tables['meals'].append({'user_id': user_id, 'date': day, 'name': name,
+                                        'calories': rng.randrange(300, 800), 'protein': rng.randrange(10, 50)})
+            tables['daily_logs'].append({'user_id': user_id, 'date': day, 'protein_grams': rng.randrange(40, 120),
+                                         'fruits_veggies': rng.randrange(0, 6), 'steps': rng.randrange(2000, 14000)})
+            if offset % 7 == 0:
+                tables['shots'].append({'user_id': user_id, 'date': day, 'type': 'semaglutide', 'dose': 0.5})
+                tables['side_effects'].append({'user_id': user_id, 'date': day, 'type': 'nausea',
+                                               'severity': rng.randrange(1, 4)})
+        started = datetime.now(timezone.utc) - timedelta(days=days)
+        for index, (question, answer) in enumerate(CHAT_LINES * 3):
+            stamp = (started + timedelta(hours=index)).isoformat()
+            tables['chat_history'].append({'user_id': user_id, 'message': question, 'is_user': True,
+                                           'timestamp': stamp})
+            tables['chat_history'].append({'user_id': user_id, 'message': answer, 'is_user': False,
+                                           'timestamp': stamp})
+    for table, rows in tables.items():
+        client.load(table, rows)
+    return user_ids
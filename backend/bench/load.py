@@ -0,0 +1,307 @@
+"""Load-test the Flask backend against local Supabase and Gemini stand-ins.
+
+The app runs in a child process wired to bench.fakes: a SQLite-backed
+Supabase seeded with --users users' logs and chat history, and a Gemini
+that replies after --gemini-latency seconds. A seeded mix of chat,
+logging and read requests is sent at --concurrency for --duration
+seconds. Per-endpoint throughput, status counts and latency percentiles,
+plus the server's memory, are written as JSON; --baseline compares the
+run with an earlier result file.
+
+    python -m bench.load --mix mixed --concurrency 32 --duration 20 --output run.json
+    python -m bench.load --env WRITE_BEHIND=1 --baseline run.json --output write-behind.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import httpx
+
+from bench.throughput import BACKEND_DIR, free_port, wait_ready
+
+CHAT_MESSAGES = [
+    # Generic first questions, which the answer cache can share between users
+    'What are GLP-1 medications?',
+    'How do I deal with nausea?',
+    # Follow-ups that depend on the user's own history
+    'I had my third shot yesterday and feel tired today, what can I do?',
+    'My weight has stalled for two weeks even though I am eating less. Any ideas?',
+    'Can you suggest a high protein lunch under 500 calories?',
+    'I keep forgetting to drink water, how can I build the habit?',
+]
+
+
+def _day(rng):
+    return (date.today() - timedelta(days=rng.randrange(0, 14))).isoformat()
+
+
+def _chat(rng, user):
+    return {'user_id': user, 'message': rng.choice(CHAT_MESSAGES)}
+
+
+# Request mixes: (weight, method, path, body builder); {user} is filled in per request
+MIXES = {
+    'mixed': [
+        (10, 'POST', '/gemini-chat', _chat),
+        (10, 'POST', '/weight-logs', lambda rng, user: {'user_id': user, 'date': _day(rng),
+                                                         'weight': round(rng.uniform(70, 110), 1)}),
+        (8, 'POST', '/water-logs', lambda rng, user: {'user_id': user, 'date': _day(rng), 'amount': 250}),
+        (6, 'POST', '/meals', lambda rng, user: {'user_id': user, 'date': _day(rng), 'name': 'Lunch',
+                                                  'calories': rng.randrange(300, 800), 'protein': 30}),
+        (4, 'POST', '/step-logs', lambda rng, user: {'user_id': user, 'date': _day(rng),
+                                                      'count': rng.randrange(1000, 12000)}),
+        (20, 'GET', '/dashboard?user_id={user}', None),
+        (14, 'GET', '/weight-logs?user_id={user}&limit=30', None),
+        (8, 'GET', '/meals?user_id={user}&limit=20', None),
+        (8, 'GET', '/gemini-chat/history?user_id={user}&limit=50', None),
+        (6, 'GET', '/scores/weekly?user_id={user}', None),
+        (6, 'GET', '/users?user_id={user}', None),
+    ],
+    'chat': [
+        (80, 'POST', '/gemini-chat', _chat),
+        (20, 'GET', '/gemini-chat/history?user_id={user}&limit=50', None),
+    ],
+    'logging': [
+        (30, 'POST', '/weight-logs', lambda rng, user: {'user_id': user, 'date': _day(rng), 'weight': 90.5}),
+        (30, 'POST', '/water-logs', lambda rng, user: {'user_id': user, 'date': _day(rng), 'amount': 500}),
+        (20, 'POST', '/meals', lambda rng, user: {'user_id': user, 'date': _day(rng), 'name': 'Snack',
+                                                   'calories': 200, 'protein': 10}),
+        (20, 'POST', '/step-logs', lambda rng, user: {'user_id': user, 'date': _day(rng), 'count': 4000}),
+    ],
+    'reads': [
+        (40, 'GET', '/dashboard?user_id={user}', None),
+        (30, 'GET', '/weight-logs?user_id={user}&limit=30', None),
+        (15, 'GET', '/step-logs?user_id={user}&limit=30', None),
+        (15, 'GET', '/scores/weekly?user_id={user}', None),
+    ],
+}
+
+SERVER = '''
+import logging, random, sys
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer
+import app as backend
+from bench.fakes import FakeGemini, FakeSupabase, seed
+from metrics import TracedModel, TracedSupabase
+
+port, threads, users, days, seed_value = map(int, sys.argv[1:6])
+supabase_latency, gemini_latency, jitter, failure_rate = map(float, sys.argv[6:10])
+
+class PooledServer(BaseWSGIServer):
+    # A fixed number of request threads, like gunicorn's gthread worker
+    pool = ThreadPoolExecutor(threads)
+    request_queue_size = 2048
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+database = FakeSupabase(latency=supabase_latency, jitter=jitter, seed=seed_value)
+seed(database, users, days, random.Random(seed_value))
+# Hand the stand-ins to the lazy clients so nothing real is ever built
+backend.supabase._client = TracedSupabase(database)
+backend.model._client = TracedModel(FakeGemini(latency=gemini_latency, jitter=jitter, failure_rate=failure_rate,
+                                               seed=seed_value))
+flask_app = backend.create_app(warm=False)
+logging.disable(logging.CRITICAL)
+print("ready", flush=True)
+PooledServer("127.0.0.1", port, flask_app).serve_forever()
+'''
+
+
+def pick(mix, rng, users):
+    total = sum(weight for weight, *_ in mix)
+    point = rng.uniform(0, total)
+    for weight, method, path, body in mix:
+        point -= weight
+        if point <= 0:
+            break
+    user = f'bench-user-{rng.randrange(users)}'
+    return method, path.format(user=user), body(rng, user) if body else None
+
+
+def endpoint(method, path):
+    return f"{method} {path.split('?')[0]}"
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'requests_per_s': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(quantiles[49] * 1000, 1) if latencies else None,
+        'p95_ms': round(quantiles[94] * 1000, 1) if latencies else None,
+        'p99_ms': round(quantiles[98] * 1000, 1) if latencies else None,
+        'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+    }
+
+
+async def load(base_url, mix, concurrency, duration, users, seed):
+    samples = {}  # endpoint -> [latencies, {status: count}, transport errors, response bytes]
+    deadline = time.monotonic() + duration
+
+    async def worker(index):
+        # Each simulated client has its own seeded sequence and keep-alive connection
+        rng = random.Random(seed * 100003 + index)
+        async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+            while time.monotonic() < deadline:
+                method, path, body = pick(mix, rng, users)
+                entry = samples.setdefault(endpoint(method, path), [[], {}, 0, 0])
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    status = str(response.status_code)
+                    entry[1][status] = entry[1].get(status, 0) + 1
+                    entry[3] += len(response.content)
+                except httpx.HTTPError:
+                    entry[2] += 1
+                entry[0].append(time.perf_counter() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    elapsed = time.monotonic() - started
+
+    endpoints = {}
+    for name, (latencies, statuses, transport_errors, size) in sorted(samples.items()):
+        errors = transport_errors + sum(count for status, count in statuses.items() if int(status) >= 500)
+        endpoints[name] = {
+            **summarize(latencies, elapsed),
+            'errors': errors,
+            'error_rate': round(errors / len(latencies), 4) if latencies else 0.0,
+            'statuses': statuses,
+            'avg_response_bytes': round(size / len(latencies)) if latencies else 0,
+        }
+    overall = summarize([latency for latencies, *_ in samples.values() for latency in latencies], elapsed)
+    overall['errors'] = sum(entry['errors'] for entry in endpoints.values())
+    return {'elapsed_s': round(elapsed, 2), 'overall': overall, 'endpoints': endpoints}
+
+
+def memory(pid):
+    # Resident and peak resident set of a process, from /proc (Linux only)
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            fields = dict(line.split(':', 1) for line in status)
+    except OSError:
+        return None
+    return {
+        'rss_mb': round(int(fields['VmRSS'].split()[0]) / 1024, 1),
+        'peak_rss_mb': round(int(fields['VmHWM'].split()[0]) / 1024, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, baseline):
+    """Per-endpoint change in throughput and p95 from baseline to result, as printable lines."""
+    lines = [f"{'endpoint':32} {'req/s':>16} {'p95 ms':>18}"]
+    rows = [('overall', result['overall'], baseline.get('overall', {}))]
+    rows += [(name, stats, baseline.get('endpoints', {}).get(name, {})) for name, stats in result['endpoints'].items()]
+    for name, stats, before in rows:
+        def change(key):
+            old, new = before.get(key), stats.get(key)
+            if not old or new is None:
+                return f'{new}'
+            return f'{new} ({(new - old) / old:+.0%})'
+        lines.append(f'{name:32} {change("requests_per_s"):>16} {change("p95_ms"):>18}')
+    return lines
+
+
+def run(args):
+    port = free_port()
+    env = {
+        **os.environ,
+        'GEMINI_API_KEY': 'placeholder',
+        'EXPO_PUBLIC_SUPABASE_URL': 'http://127.0.0.1:9',
+        'EXPO_PUBLIC_SUPABASE_ANON_KEY': 'placeholder.placeholder.placeholder',
+        # Benchmark users send far more chat than the per-user limit allows
+        'CHAT_RATE_PER_MINUTE': '100000',
+        'CHAT_BURST': '100000',
+        **dict(setting.split('=', 1) for setting in args.env),
+    }
+    server = subprocess.Popen(
+        [sys.executable, '-W', 'ignore', '-c', SERVER, *map(str, (
+            port, args.threads, args.users, args.days, args.seed,
+            args.supabase_latency, args.gemini_latency, args.jitter, args.gemini_failure_rate))],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        server.stdout.readline()  # seeded and about to serve
+        base_url = f'http://127.0.0.1:{port}'
+        wait_ready(f'{base_url}/cache/stats')
+        mix = MIXES[args.mix]
+        if args.warmup:
+            asyncio.run(load(base_url, mix, min(args.concurrency, 8), args.warmup, args.users, args.seed + 1))
+        idle = memory(server.pid)
+        result = asyncio.run(load(base_url, mix, args.concurrency, args.duration, args.users, args.seed))
+        result['memory'] = {'after_warmup': idle, 'after_run': memory(server.pid)}
+        result['server_stats'] = httpx.get(f'{base_url}/cache/stats', timeout=10).json()
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=2, help='seconds of light load before measuring')
+    parser.add_argument('--threads', type=int, default=32, help='server request threads')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--days', type=int, default=60, help='days of seeded logs per user')
+    parser.add_argument('--supabase-latency', type=float, default=0.02, help='seconds per Supabase call')
+    parser.add_argument('--gemini-latency', type=float, default=1.5, help='seconds per Gemini reply')
+    parser.add_argument('--gemini-failure-rate', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.25, help='latency spread, as a fraction')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='backend setting for this run; repeatable')
+    parser.add_argument('--output', help='write the JSON result here as well as to stdout')
+    parser.add_argument('--baseline', help='earlier result to compare against')
+    args = parser.parse_args(argv)
+
+    result = {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': vars(args),
+        },
+        **run(args),
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    print(text)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            print('\n'.join(compare(result, json.load(baseline))), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Measure backend cold start: import, create_app() and the first request.
+
+Each run uses a fresh interpreter, like a new worker or serverless instance.
+Placeholder credentials are used when none are set; the measured route
+must not need the network.
+
+    python -m bench.startup --runs 5 --route /cache/stats
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PLACEHOLDER_ENV = {
+    'GEMINI_API_KEY': 'placeholder',
+    'EXPO_PUBLIC_SUPABASE_URL': 'http://localhost:54321',
+    'EXPO_PUBLIC_SUPABASE_ANON_KEY': 'placeholder.placeholder.placeholder',
+}
+
+CHILD = '''
+import json, logging, sys, time
+started = time.perf_counter()
+import app as backend
+imported = time.perf_counter()
+flask_app = backend.create_app(warm=False)
+created = time.perf_counter()
+logging.disable(logging.CRITICAL)
+response = flask_app.test_client().get(sys.argv[1])
+finished = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - started,
+    'create_app_s': created - imported,
+    'first_request_s': finished - created,
+    'time_to_first_response_s': finished - started,
+    'status': response.status_code,
+}))
+'''
+
+
+def run_once(route):
+    env = {**PLACEHOLDER_ENV, **os.environ}
+    out = subprocess.run([sys.executable, '-W', 'ignore', '-c', CHILD, route], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--route', default='/cache/stats')
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.route) for _ in range(args.runs)]
+    summary = {key: statistics.median(run[key] for run in runs)
+               for key in ('import_s', 'create_app_s', 'first_request_s', 'time_to_first_response_s')}
+    print(json.dumps({'route': args.route, 'runs': len(runs), 'median': summary}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""Compare sync (Flask) and async (Quart) serving throughput side by side.
+
+Both modes run against the same fake Supabase REST endpoint, which answers
+after a fixed delay, so the numbers reflect how many slow upstream calls a
+single worker keeps in flight. The sync app runs with a fixed pool of
+request threads, like gunicorn's gthread worker; the async app runs on
+hypercorn. Gemini is not exercised.
+
+    python -m bench.throughput --concurrency 128 --duration 10 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+UPSTREAM = '''
+import asyncio, json, sys
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+
+LATENCY = float(sys.argv[2])
+ROWS = [{"id": str(i), "user_id": "u", "date": f"2024-01-{i % 28 + 1:02d}", "value": i} for i in range(30)]
+
+async def app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    await asyncio.sleep(LATENCY)
+    if scope["method"] == "GET":
+        payload = ROWS
+    else:
+        row = json.loads(body or b"{}")
+        payload = [dict(row, id="1")] if isinstance(row, dict) else row
+    data = json.dumps(payload).encode()
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())]})
+    await send({"type": "http.response.body", "body": data})
+
+config = Config()
+config.bind = [f"127.0.0.1:{sys.argv[1]}"]
+config.accesslog = None
+config.backlog = 2048
+asyncio.run(serve(app, config))
+'''
+
+SYNC_SERVER = '''
+import logging, sys
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer
+import app as backend
+
+class PooledServer(BaseWSGIServer):
+    # A fixed number of request threads, like gunicorn's gthread worker
+    pool = ThreadPoolExecutor(int(sys.argv[2]))
+    request_queue_size = 2048
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+flask_app = backend.create_app(warm=True)
+logging.disable(logging.CRITICAL)
+PooledServer("127.0.0.1", int(sys.argv[1]), flask_app).serve_forever()
+'''
+
+ASYNC_SERVER = '''
+import asyncio, logging, sys
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+import asgi
+
+quart_app = asgi.create_app()
+logging.disable(logging.CRITICAL)
+config = Config()
+config.bind = [f"127.0.0.1:{sys.argv[1]}"]
+config.accesslog = None
+config.backlog = 2048
+asyncio.run(serve(quart_app, config))
+'''
+
+# (weight, method, path, json body); {user} is replaced per request
+MIX = [
+    (70, 'GET', '/weight-logs?user_id={user}&limit=30', None),
+    (20, 'GET', '/dashboard?user_id={user}&sections=weight_logs,step_logs,water_logs', None),
+    (10, 'POST', '/water-logs', {'user_id': '{user}', 'date': '2024-01-01', 'amount': 250}),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start(script, *args, env=None):
+    return subprocess.Popen([sys.executable, '-W', 'ignore', '-c', script, *map(str, args)], cwd=BACKEND_DIR,
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f'{url} did not come up')
+
+
+def pick(rng):
+    total = sum(weight for weight, *_ in MIX)
+    point = rng.uniform(0, total)
+    for weight, method, path, body in MIX:
+        point -= weight
+        if point <= 0:
+            break
+    user = f'user-{rng.randrange(1000)}'
+    if body is not None:
+        body = {k: v.format(user=user) if isinstance(v, str) else v for k, v in body.items()}
+    return method, path.format(user=user), body
+
+
+async def load(base_url, concurrency, duration, seed=1):
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        nonlocal errors
+        # One keep-alive connection per simulated client; a shared pool would be the bottleneck
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            while time.monotonic() < deadline:
+                method, path, body = pick(rng)
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_s': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(quantiles[49] * 1000, 1),
+        'p95_ms': round(quantiles[94] * 1000, 1),
+        'p99_ms': round(quantiles[98] * 1000, 1),
+    }
+
+
+def run_mode(script, extra_args, env, args):
+    port = free_port()
+    server = start(script, port, *extra_args, env=env)
+    try:
+        wait_ready(f'http://127.0.0.1:{port}/cache/stats')
+        # Warm connections and lazily built clients before measuring
+        asyncio.run(load(f'http://127.0.0.1:{port}', min(args.concurrency, 8), 1))
+        return asyncio.run(load(f'http://127.0.0.1:{port}', args.concurrency, args.duration))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=128)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--latency', type=float, default=0.05, help='fake Supabase delay in seconds')
+    parser.add_argument('--sync-threads', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    upstream_port = free_port()
+    upstream = start(UPSTREAM, upstream_port, args.latency)
+    env = {
+        **os.environ,
+        'GEMINI_API_KEY': os.getenv('GEMINI_API_KEY', 'placeholder'),
+        'EXPO_PUBLIC_SUPABASE_URL': f'http://127.0.0.1:{upstream_port}',
+        'EXPO_PUBLIC_SUPABASE_ANON_KEY': 'placeholder.placeholder.placeholder',
+        'SUPABASE_H2C': '1',
+    }
+    try:
+        wait_ready(f'http://127.0.0.1:{upstream_port}/')
+        results = {
+            'sync': run_mode(SYNC_SERVER, [args.sync_threads], env, args),
+            'async': run_mode(ASYNC_SERVER, [], env, args),
+        }
+    finally:
+        upstream.terminate()
+        upstream.wait()
+    print(json.dumps({
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'upstream_latency_s': args.latency,
+        'sync_threads': args.sync_threads,
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import json
+
+from schemas import InvalidRow
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+class EntryError(Exception):
+    # A single entry of a bulk upload that was rejected before reaching Supabase
+    status = 400
+
+
+def parse_ndjson(text):
+    """Parse newline-delimited JSON; lines that fail to parse become EntryErrors."""
+    entries = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            entries.append(json.loads(line))
+        except ValueError as e:
+            entries.append(EntryError(f'line {number}: {e}'))
+    return entries
+
+
+def log_row(entry, default_user_id, schema=None):
+    # A log table row from one entry; entries without a user_id fall back to the request's
+    if not isinstance(entry, dict):
+        raise EntryError('entry must be an object')
+    user_id = entry.get('user_id') or default_user_id
+    if not user_id or not entry.get('date'):
+        raise EntryError('user_id and date required')
+    row = {k: v for k, v in entry.items() if k != 'user_id'}
+    row['user_id'] = user_id
+    if schema is not None:
+        try:
+            row = schema.row(row)
+        except InvalidRow as e:
+            raise EntryError(str(e))
+    return row
+
+
+def prepare(entries, default_user_id, schema=None):
+    """Validate entries locally, against the table's TableSchema if given.
+
+    Returns (outcomes, rows, positions): outcomes has an EntryError for each
+    rejected entry and None elsewhere; rows are the valid entries' rows and
+    positions their indexes in entries.
+    """
+    outcomes = [None] * len(entries)
+    rows, positions = [], []
+    for index, entry in enumerate(entries):
+        try:
+            if isinstance(entry, EntryError):
+                raise entry
+            rows.append(log_row(entry, default_user_id, schema))
+            positions.append(index)
+        except EntryError as e:
+            outcomes[index] = e
+    return outcomes, rows, positions
+
+
+def summarize(outcomes, key):
+    # Response body and status for a bulk upload: 201 if every entry was stored, else 207
+    results = []
+    for index, outcome in enumerate(outcomes):
+        if isinstance(outcome, Exception):
+            status = getattr(outcome, 'status', 500)
+            results.append({'index': index, 'status': status, 'error': str(outcome)})
+        else:
+            results.append({'index': index, 'status': 201, key: outcome})
+    failed = sum(1 for result in results if result['status'] != 201)
+    return {
+        'message': f'{len(results) - failed} of {len(results)} entries added',
+        'inserted': len(results) - failed,
+        'failed': failed,
+        'results': results
+    }, 207 if failed else 201
+
+
+def _is_row_error(error):
+    # Postgres data exceptions (22xxx) and constraint violations (23xxx) are down to a row's
+    # values; timeouts, connection errors and 5xx responses fail every row alike
+    return str(getattr(error, 'code', '') or '').startswith(('22', '23'))
+
+
+def _chunk_inserts(rows, chunk_size):
+    # The inserts to make, shared by the sync and async drivers: yields the rows for each
+    # insert and is sent back (stored rows, None) or (None, exception); returns the outcomes
+    outcomes = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        stored, error = yield chunk
+        if error is None:
+            # Row-level security can hide inserted rows from the response; echo what was sent
+            outcomes.extend(stored if len(stored) == len(chunk) else chunk)
+        elif len(chunk) == 1 or not _is_row_error(error):
+            outcomes.extend([error] * len(chunk))
+        else:
+            for row in chunk:
+                stored, error = yield [row]
+                outcomes.append(error if error is not None else stored[0] if stored else row)
+    return outcomes
+
+
+def insert_in_chunks(insert_many, rows, chunk_size=100):
+    """Insert rows with one multi-row insert per chunk.
+
+    Returns one outcome per row, in order: the stored row or the exception
+    that rejected it. Postgres fails a multi-row insert as a whole, so a
+    chunk rejected for a row's data is retried row by row to pin the error
+    on the bad entries; any other failure is recorded against the whole
+    chunk without retrying.
+    """
+    inserts = _chunk_inserts(rows, chunk_size)
+    try:
+        batch = next(inserts)
+        while True:
+            try:
+                result = (insert_many(batch), None)
+            except Exception as e:
+                result = (None, e)
+            batch = inserts.send(result)
+    except StopIteration as done:
+        return done.value
+
+
+async def insert_in_chunks_async(insert_many, rows, chunk_size=100):
+    # insert_in_chunks() for an async insert_many
+    inserts = _chunk_inserts(rows, chunk_size)
+    try:
+        batch = next(inserts)
+        while True:
+            try:
+                result = (await insert_many(batch), None)
+            except Exception as e:
+                result = (None, e)
+            batch = inserts.send(result)
+    except StopIteration as done:
+        return done.value
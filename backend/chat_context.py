@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = 'Summary of our conversation so far:'
+SUMMARY_ACK = "Thanks, I'll keep that in mind."
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and their GLP-1 health coach.\n"
+    "Update the summary with the new messages below. Keep what matters for future coaching: the "
+    "user's goals, medication and doses, side effects, habits, preferences, progress and the advice "
+    "already given. Write plain prose of at most {words} words.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New messages:\n{messages}"
+)
+
+
+def estimate_tokens(text):
+    # About four characters per token for English; close enough for budgeting
+    return (len(text) + 3) // 4
+
+
+def content_role_text(content):
+    # Role and text of a history entry, whether a plain dict or a Content returned by the SDK
+    if isinstance(content, dict):
+        role, parts = content.get('role'), content.get('parts', [])
+    else:
+        role, parts = getattr(content, 'role', None), getattr(content, 'parts', [])
+    text = ''.join(part if isinstance(part, str) else getattr(part, 'text', '') or '' for part in parts)
+    return role, text
+
+
+class Conversation:
+    """One user's coach conversation: a rolling summary plus the recent turns verbatim."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.summary = ''
+        self.turns = []  # (role, text, tokens), oldest first
+        self.tokens = 0
+        self.folding = 0  # leading turns handed to the summarizer and not yet folded
+
+    def size(self):
+        return len(self.summary) + sum(len(text) for _, text, _ in self.turns)
+
+
+class ChatContext:
+    """Builds Gemini chat history for a conversation within a token budget.
+
+    The most recent turns are sent verbatim. Once they outgrow the space the
+    summary leaves free, the oldest are folded into the rolling summary by a
+    background summarize call, down to half that space so folds happen every
+    few turns rather than every turn. Until a fold lands, or if it fails, the
+    history is trimmed from the front so it never exceeds the budget.
+    """
+
+    def __init__(self, summarize, executor, budget=3000, summary_tokens=500):
+        self._summarize = summarize
+        self._executor = executor
+        self._budget = budget
+        self._summary_tokens = summary_tokens
+        self._recent_budget = max(budget - summary_tokens, 1)
+        self._lock = threading.Lock()
+        self.folds = 0
+        self.fold_errors = 0
+        self.fold_seconds = 0.0
+        self.trimmed = 0
+
+    def extend(self, conversation, history):
+        """Append history entries (dicts or Contents) and fold old turns if over budget."""
+        with conversation.lock:
+            for content in history:
+                role, text = content_role_text(content)
+                if not text:
+                    continue
+                tokens = estimate_tokens(text)
+                conversation.turns.append((role, text, tokens))
+                conversation.tokens += tokens
+            if conversation.folding or conversation.tokens <= self._recent_budget:
+                return
+            cut = self._cut(conversation.turns, self._recent_budget // 2)
+            if not cut:
+                return
+            conversation.folding = cut
+            summary, batch = conversation.summary, conversation.turns[:cut]
+        self._executor.submit(self._fold, conversation, summary, batch)
+
+    def _cut(self, turns, keep_tokens):
+        # Index of the first turn to keep: a user turn, with what follows within keep_tokens
+        cut, used = None, 0
+        for index in range(len(turns) - 1, -1, -1):
+            used += turns[index][2]
+            if used > keep_tokens and cut is not None:
+                break
+            if turns[index][0] == 'user':
+                cut = index
+        return cut or 0
+
+    def _fold(self, conversation, summary, batch):
+        messages = '\n'.join(f"{'User' if role == 'user' else 'Coach'}: {text}" for role, text, _ in batch)
+        prompt = SUMMARY_PROMPT.format(words=int(self._summary_tokens * 0.75),
+                                       summary=summary or '(none yet)', messages=messages)
+        started = time.perf_counter()
+        try:
+            folded = (self._summarize(prompt) or '').strip()
+            if not folded:
+                raise ValueError('empty summary')
+        except Exception as e:
+            logger.error(f"Error summarizing chat history: {str(e)}")
+            with self._lock:
+                self.fold_errors += 1
+            with conversation.lock:
+                conversation.folding = 0
+            return
+        with conversation.lock:
+            # Only extend() appends and only folds remove, so the batch is still at the front
+            del conversation.turns[:conversation.folding]
+            conversation.tokens = sum(tokens for _, _, tokens in conversation.turns)
+            conversation.summary = folded
+            conversation.folding = 0
+        with self._lock:
+            self.folds += 1
+            self.fold_seconds += time.perf_counter() - started
+
+    def history(self, conversation):
+        """Chat history to send: the summary as an opening exchange, then the turns that fit."""
+        with conversation.lock:
+            summary, turns = conversation.summary, list(conversation.turns)
+        history = []
+        available = self._budget
+        if summary:
+            history = [{'role': 'user', 'parts': [f'{SUMMARY_PREFIX}\n{summary}']},
+                       {'role': 'model', 'parts': [SUMMARY_ACK]}]
+            available -= estimate_tokens(summary) + estimate_tokens(SUMMARY_PREFIX + SUMMARY_ACK)
+        # Gemini expects history to open with a user turn, so only cut in front of one
+        start, used = len(turns), 0
+        for index in range(len(turns) - 1, -1, -1):
+            used += turns[index][2]
+            if used > available:
+                break
+            if turns[index][0] == 'user':
+                start = index
+        if start:
+            with self._lock:
+                self.trimmed += start
+        history.extend({'role': role, 'parts': [text]} for role, text, _ in turns[start:])
+        return history
+
+    def stats(self):
+        with self._lock:
+            return {
+                'budget': self._budget,
+                'folds': self.folds,
+                'fold_errors': self.fold_errors,
+                'avg_fold_seconds': round(self.fold_seconds / self.folds, 3) if self.folds else 0.0,
+                'trimmed_turns': self.trimmed,
+            }
@@ -0,0 +1,172 @@
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from chat_context import Conversation
+
+logger = logging.getLogger(__name__)
+
+
+def history_from_rows(rows):
+    # Convert chat_history rows into Gemini chat history, oldest first
+    history = []
+    for row in rows or []:
+        message = row.get('message')
+        if not message:
+            continue
+        history.append({'role': 'user' if row.get('is_user') else 'model', 'parts': [message]})
+    # Gemini expects a conversation to open with a user turn
+    while history and history[0]['role'] != 'user':
+        history.pop(0)
+    return history
+
+
+def history_size(history):
+    # Rough memory footprint of a chat history: total characters of its text parts
+    size = 0
+    for content in history or []:
+        parts = content.get('parts', []) if isinstance(content, dict) else getattr(content, 'parts', [])
+        for part in parts:
+            text = part if isinstance(part, str) else getattr(part, 'text', '')
+            size += len(text or '')
+    return size
+
+
+class _Entry:
+    __slots__ = ('lock', 'chat', 'size', 'conversation', 'users')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.chat = None
+        self.size = 0
+        self.conversation = None
+        self.users = 0  # turns holding or waiting for the lock
+
+
+class ChatSessionPool:
+    """Bounded pool of per-user Gemini chat sessions with LRU eviction.
+
+    Sessions are created lazily on first use and hydrated from the user's
+    stored chat history. The pool is bounded both by session count and by
+    the total size of the cached histories; sessions with a turn running or
+    waiting are never evicted. With a ChatContext, each session's
+    history is rebuilt from the user's conversation within its token budget
+    before every turn instead of growing without bound.
+    """
+
+    def __init__(self, model, loader=None, max_sessions=500, max_bytes=32 * 1024 * 1024, context=None):
+        self._model = model
+        self._loader = loader
+        self._context = context
+        self._max_sessions = max_sessions
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = _Entry()
+                self._entries[user_id] = entry
+            else:
+                self._entries.move_to_end(user_id)
+            entry.users += 1
+            return entry
+
+    def _hydrate(self, user_id):
+        if self._loader is None:
+            return []
+        try:
+            return history_from_rows(self._loader(user_id))
+        except Exception as e:
+            logger.error(f"Error hydrating chat session for {user_id}: {str(e)}")
+            return []
+
+    def _account(self, user_id, entry, size, hit):
+        with self._lock:
+            entry.users -= 1
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            if self._entries.get(user_id) is not entry:
+                # Discarded while in use
+                return
+            self._total_bytes += size - entry.size
+            entry.size = size
+            self._evict()
+
+    def _evict(self):
+        # Least recently used first, skipping sessions in use so a user's turns never get a
+        # second lock; the pool may run over its bounds until those turns finish
+        while len(self._entries) > self._max_sessions or \
+                (self._total_bytes > self._max_bytes and len(self._entries) > 1):
+            idle = next((user_id for user_id, entry in self._entries.items() if not entry.users), None)
+            if idle is None:
+                return
+            self._total_bytes -= self._entries.pop(idle).size
+            self.evictions += 1
+
+    @contextmanager
+    def session(self, user_id):
+        """Yield the chat session for user_id, held exclusively for the duration."""
+        entry = self._entry(user_id)
+        hit, size = False, entry.size
+        try:
+            with entry.lock:
+                hit = entry.chat is not None
+                if self._context is None:
+                    if not hit:
+                        entry.chat = self._model.start_chat(history=self._hydrate(user_id))
+                    sent = None
+                else:
+                    if not hit:
+                        entry.conversation = Conversation()
+                        self._context.extend(entry.conversation, self._hydrate(user_id))
+                        entry.chat = self._model.start_chat(history=[])
+                    history = self._context.history(entry.conversation)
+                    entry.chat.history = history
+                    sent = len(history)
+                try:
+                    yield entry.chat
+                finally:
+                    try:
+                        if sent is None:
+                            size = history_size(entry.chat.history)
+                        else:
+                            # Whatever the turn added to the session goes back into the conversation
+                            self._context.extend(entry.conversation, entry.chat.history[sent:])
+                            size = entry.conversation.size()
+                    except Exception as e:
+                        # A broken stream leaves the history unusable; rebuild it from chat_history next time
+                        logger.warning(f"Resetting chat session for {user_id}: {str(e)}")
+                        entry.chat = None
+                        entry.conversation = None
+                        size = 0
+        finally:
+            self._account(user_id, entry, size, hit)
+
+    def discard(self, user_id):
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            if entry is not None:
+                self._total_bytes -= entry.size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._entries),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
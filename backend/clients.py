@@ -0,0 +1,46 @@
+import threading
+from urllib.parse import urlparse
+
+
+class LazyClient:
+    """Stand-in for a client that is only built on first use.
+
+    Attribute access is forwarded to the real client, which factory builds
+    once per process. A process that never touches Gemini never imports or
+    configures it, and forked workers each build their own connections.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    @property
+    def ready(self):
+        return self._client is not None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def validate_config(env):
+    """Return a list of problems with the backend settings in env; no network calls."""
+    problems = []
+    for name in ('GEMINI_API_KEY', 'EXPO_PUBLIC_SUPABASE_URL', 'EXPO_PUBLIC_SUPABASE_ANON_KEY'):
+        if not env.get(name):
+            problems.append(f'{name} not found in environment variables')
+    url = env.get('EXPO_PUBLIC_SUPABASE_URL')
+    if url:
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+            problems.append('EXPO_PUBLIC_SUPABASE_URL must be an http(s) URL')
+    return problems
@@ -0,0 +1,14 @@
+import pytest
+
+import app as backend
+from bench.fakes import FakeSupabase
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Flask test client over a local Supabase stand-in
+    for name, value in (('GEMINI_API_KEY', 'key'), ('EXPO_PUBLIC_SUPABASE_URL', 'http://localhost'),
+                        ('EXPO_PUBLIC_SUPABASE_ANON_KEY', 'anon')):
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(backend.supabase, '_client', FakeSupabase())
+    return backend.create_app(warm=False).test_client()
@@ -0,0 +1,86 @@
+import gzip
+
+from flask.json.provider import DefaultJSONProvider
+
+# orjson and brotli are optional; without them we fall back to the stdlib json encoder and gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/plain')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes with orjson when it is installed.
+
+    Response bodies match the default provider (sorted keys, compact
+    separators, dates as HTTP dates, Decimals as strings), so clients and
+    ETags see the same body whichever encoder produced it. The one
+    difference is that non-ASCII text is written as UTF-8, not \\u escapes.
+    """
+
+    def _orjson_options(self):
+        # Dates go through self.default like everything orjson can't encode itself
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._orjson_options()).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._orjson_options() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(body, encoding, level=6):
+    if encoding == 'br':
+        return brotli.compress(body, quality=min(level, 11))
+    return gzip.compress(body, compresslevel=level)
+
+
+def compress_response(response, accept_encodings, min_size=1024, level=6):
+    """Compress a buffered response in place with the client's preferred encoding."""
+    if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accept_encodings.best_match(available_encodings())
+    if not encoding:
+        return response
+    if response.status_code != 200 or response.content_length is None or response.content_length < min_size:
+        return response
+    response.set_data(compress(response.get_data(), encoding, level))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        # A differently encoded body is a different representation and needs its own strong ETag
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+
+def etag_variants(etag):
+    # The ETags a client may hold for one cached body, one per content encoding
+    return [etag] + [f'{etag}-{encoding}' for encoding in ('br', 'gzip')]
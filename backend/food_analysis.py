@@ -0,0 +1,278 @@
+"""Meal photo analysis: photos are shrunk before they reach Gemini and results
+are cached by what the photo looks like.
+
+Phones send photos several megapixels in size, but Gemini bills an image of
+up to 768 pixels on its long side as a single tile, and portion estimates
+don't improve with more detail. prepare_image decodes the photo (JPEG draft
+mode scales it down while decoding), applies the EXIF rotation and
+re-encodes it at that size.
+
+The cache key is a 64-bit difference hash of the downscaled photo, so the
+same photo re-sent, re-compressed or resized finds the earlier result.
+Entries whose hashes differ in at most max_distance bits count as the same
+photo; the hash is split into max_distance + 1 bands, and any such entry
+shares at least one band exactly with the lookup.
+
+Pillow is optional. Without it photos are sent as received and only byte
+for byte repeats hit the cache.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import json
+import math
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Pillow is optional; without it images are sent unchanged and keyed by their bytes
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Same prompt as the analyze-food edge function, so results keep their shape
+PROMPT = """
+Analyze this food image and provide detailed nutritional information. Please be as accurate as possible based on visual estimation.
+
+Respond with ONLY a valid JSON object in this exact format (no additional text):
+{
+  "name": "Name of the dish/food item",
+  "description": "Brief description of what you see",
+  "calories": estimated_total_calories_as_number,
+  "protein": estimated_protein_in_grams_as_number,
+  "carbs": estimated_carbohydrates_in_grams_as_number,
+  "fat": estimated_fat_in_grams_as_number,
+  "fruitsVeggies": estimated_fruits_vegetables_servings_as_number,
+  "confidence": confidence_level_0_to_100_as_number
+}
+
+Guidelines:
+- Estimate portion sizes carefully
+- Consider all visible ingredients
+- Fruits/vegetables servings: 1 serving ≈ 1/2 cup chopped or 1 medium piece
+- Be conservative with estimates if unsure
+- Confidence should reflect how certain you are about the analysis
+- All numbers should be integers (no decimals)
+"""
+
+AMOUNT_FIELDS = ('calories', 'protein', 'carbs', 'fat', 'fruitsVeggies')
+
+MAX_SIDE = 768
+JPEG_QUALITY = 85
+HASH_BITS = 64
+
+_DATA_URL = re.compile(r'^data:image/[\w.+-]+;base64,')
+_JSON_OBJECT = re.compile(r'\{[\s\S]*\}')
+
+# Magic numbers of the formats Gemini accepts, for when Pillow isn't there to decode them
+_SIGNATURES = ((b'\xff\xd8\xff', 'image/jpeg'), (b'\x89PNG\r\n\x1a\n', 'image/png'))
+
+# Pillow format names of the types Gemini accepts; these are sent unchanged when that is smaller
+_FORMATS = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}
+
+# data: bytes sent to Gemini; key: perceptual hash (int), or sha256 hex digest without Pillow
+PreparedImage = namedtuple('PreparedImage', ['data', 'mime_type', 'key'])
+
+
+def decode_image(image_base64):
+    """Bytes of a base64 image, with or without a data: URL prefix; ValueError if it isn't base64."""
+    if not isinstance(image_base64, str):
+        raise ValueError('Image data must be a base64 string')
+    try:
+        data = base64.b64decode(_DATA_URL.sub('', image_base64, count=1), validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError('Image data is not valid base64')
+    if not data:
+        raise ValueError('Image data is required')
+    return data
+
+
+def _mime_type(data):
+    for signature, mime_type in _SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[4:8] == b'ftyp' and data[8:12] in (b'heic', b'heix', b'mif1'):
+        return 'image/heic'
+    return 'image/jpeg'
+
+
+def dhash(image):
+    """64-bit difference hash: whether each pixel of a 9x8 grayscale thumbnail is brighter than its right neighbour."""
+    pixels = image.convert('L').resize((9, 8), Image.BILINEAR).tobytes()
+    bits = 0
+    for row in range(0, 72, 9):
+        for col in range(row, row + 8):
+            bits = bits << 1 | (pixels[col] > pixels[col + 1])
+    return bits
+
+
+def prepare_image(data, max_side=MAX_SIDE, quality=JPEG_QUALITY):
+    """Downscale and re-encode data for the model; ValueError if it can't be decoded."""
+    if Image is None:
+        return PreparedImage(data, _mime_type(data), hashlib.sha256(data).hexdigest())
+    try:
+        image = Image.open(io.BytesIO(data))
+        original_type = _FORMATS.get(image.format)
+        image.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    except Exception:
+        # Pillow raises OSError for most bad input, but others (e.g. DecompressionBombError) too
+        raise ValueError('Image could not be decoded')
+    key = dhash(image)
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=quality, optimize=True)
+    encoded = out.getvalue()
+    if original_type is not None and len(data) <= len(encoded):
+        # Already small; re-encoding would only lose quality
+        return PreparedImage(data, original_type, key)
+    return PreparedImage(encoded, 'image/jpeg', key)
+
+
+def _whole(value, upper=None):
+    # Rounded half up like Math.round; anything non-numeric counts as 0
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0
+    if math.isnan(number):
+        return 0
+    number = max(0, math.floor(number + 0.5)) if math.isfinite(number) else 0
+    return min(upper, number) if upper is not None else number
+
+
+def parse_analysis(text):
+    """FoodAnalysis dict from the model's reply; ValueError if the reply doesn't hold one."""
+    match = _JSON_OBJECT.search(text or '')
+    try:
+        analysis = json.loads(match.group(0) if match else text)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid AI response format')
+    if not isinstance(analysis, dict) or not analysis.get('name') \
+            or not isinstance(analysis.get('calories'), (int, float)) or isinstance(analysis['calories'], bool):
+        raise ValueError('Invalid AI response format')
+    result = {'name': str(analysis['name']), 'description': str(analysis.get('description') or '')}
+    for field in AMOUNT_FIELDS:
+        result[field] = _whole(analysis.get(field))
+    result['confidence'] = _whole(analysis.get('confidence'), 100)
+    return result
+
+
+class FoodAnalysisCache:
+    """Analyses by photo, per user, matched on perceptual hash.
+
+    A lookup finds an entry of the same scope (user) whose key is equal or,
+    for integer hashes, within max_distance bits. Entries expire after ttl
+    seconds and the least recently used are evicted past max_entries. The
+    cache also counts photo bytes received and uploaded and the model's
+    latency, for stats().
+    """
+
+    def __init__(self, max_entries=2000, ttl=7 * 24 * 3600, max_distance=4):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._max_distance = max_distance
+        bands = max_distance + 1
+        self._bands = [(HASH_BITS * band // bands, HASH_BITS * (band + 1) // bands) for band in range(bands)]
+        self._entries = OrderedDict()  # (scope, key) -> (analysis, expires)
+        self._index = {}  # (scope, band, band bits) -> set of keys
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+        self.received_bytes = 0
+        self.uploaded_bytes = 0
+        self.model_calls = 0
+        self.model_seconds = 0.0
+        self._avg_latency = None
+
+    def _band_keys(self, scope, key):
+        return [(scope, band, (key >> low) & ((1 << (high - low)) - 1)) for band, (low, high) in enumerate(self._bands)]
+
+    def _find(self, scope, key):
+        if (scope, key) in self._entries:
+            return scope, key
+        if not isinstance(key, int):
+            return None
+        best, best_distance = None, self._max_distance + 1
+        for band_key in self._band_keys(scope, key):
+            for candidate in self._index.get(band_key, ()):
+                distance = bin(candidate ^ key).count('1')
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+        return (scope, best) if best is not None else None
+
+    def get(self, scope, key):
+        """Cached analysis of the photo with key, or one like it, else None."""
+        now = time.monotonic()
+        with self._lock:
+            found = self._find(scope, key)
+            entry = self._entries.get(found) if found is not None else None
+            if entry is not None and entry[1] <= now:
+                self._remove(found)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(found)
+            self.hits += 1
+            if self._avg_latency is not None:
+                self.saved_seconds += self._avg_latency
+            return dict(entry[0])
+
+    def put(self, scope, key, analysis):
+        with self._lock:
+            self._remove((scope, key))
+            self._entries[(scope, key)] = (dict(analysis), time.monotonic() + self._ttl)
+            if isinstance(key, int):
+                for band_key in self._band_keys(scope, key):
+                    self._index.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self._max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_key):
+        if self._entries.pop(entry_key, None) is None:
+            return
+        scope, key = entry_key
+        if isinstance(key, int):
+            for band_key in self._band_keys(scope, key):
+                bucket = self._index.get(band_key)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._index[band_key]
+
+    def observe_upload(self, received, uploaded):
+        with self._lock:
+            self.received_bytes += received
+            self.uploaded_bytes += uploaded
+
+    def observe_latency(self, seconds):
+        # Running average of model calls, credited to saved_seconds on every hit
+        with self._lock:
+            self.model_calls += 1
+            self.model_seconds += seconds
+            self._avg_latency = seconds if self._avg_latency is None else 0.9 * self._avg_latency + 0.1 * seconds
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'saved_seconds': round(self.saved_seconds, 3),
+                'received_bytes': self.received_bytes,
+                'uploaded_bytes': self.uploaded_bytes,
+                'model_calls': self.model_calls,
+                'model_seconds_avg': round(self.model_seconds / self.model_calls, 3) if self.model_calls else 0.0,
+            }
@@ -0,0 +1,431 @@
+"""Streaks and achievement unlocks, kept up to date as logs are written.
+
+Each user has a small state document in the gamification_state table:
+per-activity streaks (current run, best run, first and last day of the
+current run), log counters, starting and latest weight, and the codes of
+the achievements already unlocked. apply() folds one written row into it
+in constant time and checks only the rules that row's table can affect,
+so nothing rescans a user's history. Days are the logs' own dates.
+
+A row dated inside or right next to the current run extends it; an older
+backfill can't be placed without the history, so it only counts toward
+totals. rebuild_state() replays a user's logs in date order to repair that.
+"""
+import copy
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+
+from weekly_scores import WEEKLY_TARGETS
+
+logger = logging.getLogger(__name__)
+
+# Same codes and wording as the app's built-in achievement list
+ACHIEVEMENTS = {
+    'first-weight-log': {'title': 'First Step', 'description': 'Log your weight for the first time',
+                         'icon': 'scale', 'category': 'weight', 'points': 10},
+    'weight-streak-7': {'title': 'Weight Watcher', 'description': 'Log your weight for 7 consecutive days',
+                        'icon': 'trending-up', 'category': 'streak', 'points': 25},
+    'protein-goal-5': {'title': 'Protein Pro', 'description': 'Meet your protein goal for 5 days',
+                       'icon': 'egg', 'category': 'nutrition', 'points': 20},
+    'steps-10k': {'title': 'Step Master', 'description': 'Hit 10,000 steps in a day',
+                  'icon': 'footprints', 'category': 'activity', 'points': 20},
+    'first-shot': {'title': 'First Shot', 'description': 'Log your first medication shot',
+                   'icon': 'syringe', 'category': 'medication', 'points': 10},
+    'dedicated-tracker': {'title': 'Dedicated Tracker', 'description': 'Log any data 7 days in a row',
+                          'icon': 'calendar-check', 'category': 'streak', 'points': 25},
+    'progress-milestone': {'title': 'Progress Milestone', 'description': 'Lose your first 5 lbs',
+                           'icon': 'star', 'category': 'weight', 'points': 20},
+    'major-progress': {'title': 'Major Progress', 'description': 'Lose 10% of your starting weight',
+                       'icon': 'award', 'category': 'weight', 'points': 30},
+}
+
+# Streaks each table's rows count toward; 'any' is logging anything at all
+TABLE_STREAKS = {
+    'weight_logs': ('weight', 'any'),
+    'step_logs': ('steps', 'any'),
+    'water_logs': ('water', 'any'),
+    'shots': ('shots', 'any'),
+    'daily_logs': ('any',),
+}
+# Streaks mirrored to the user's streaks row, which the app reads
+STREAK_COLUMNS = ('weight', 'steps', 'water', 'shots')
+
+PROTEIN_GOAL = WEEKLY_TARGETS['protein'] / 7
+PROTEIN_DAYS = 5
+STEP_GOAL = 10000
+
+
+def _number(row, *fields):
+    for field in fields:
+        try:
+            return float(row[field])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+def _best(state, name):
+    return state['streaks'].get(name, {}).get('best', 0)
+
+
+def _lost(state):
+    weight = state['weight']
+    if weight.get('start') is None or weight.get('latest') is None:
+        return 0.0
+    return weight['start'] - weight['latest']
+
+
+# (achievement code, tables whose rows can unlock it, test on the state)
+RULES = (
+    ('first-weight-log', ('weight_logs',), lambda state: state['counts'].get('weight_logs', 0) >= 1),
+    ('weight-streak-7', ('weight_logs',), lambda state: _best(state, 'weight') >= 7),
+    ('first-shot', ('shots',), lambda state: state['counts'].get('shots', 0) >= 1),
+    ('steps-10k', ('step_logs', 'daily_logs'), lambda state: state['best_day_steps'] >= STEP_GOAL),
+    ('protein-goal-5', ('daily_logs',), lambda state: len(state['protein_days']) >= PROTEIN_DAYS),
+    ('dedicated-tracker', tuple(TABLE_STREAKS), lambda state: _best(state, 'any') >= 7),
+    ('progress-milestone', ('weight_logs',), lambda state: _lost(state) >= 5),
+    ('major-progress', ('weight_logs',),
+     lambda state: bool(state['weight'].get('start')) and _lost(state) >= 0.1 * state['weight']['start']),
+)
+RULES_BY_TABLE = {table: [rule for rule in RULES if table in rule[1]] for table in TABLE_STREAKS}
+
+
+def new_state(start_weight=None, unlocked=()):
+    """Empty state; start_weight and unlocked come from the user's profile and achievements rows."""
+    return {
+        'streaks': {},
+        'counts': {},
+        'weight': {'start': start_weight, 'start_date': None, 'fixed_start': start_weight is not None,
+                   'latest': None, 'latest_date': None},
+        'steps_day': [None, 0.0],
+        'best_day_steps': 0.0,
+        'protein_days': [],
+        'unlocked': sorted(set(unlocked)),
+    }
+
+
+def _extend(streak, day):
+    """Count day toward streak in place; returns whether the current run changed."""
+    if not streak:
+        streak.update(current=1, best=1, start=day.isoformat(), last=day.isoformat())
+        return True
+    start, last = date.fromisoformat(streak['start']), date.fromisoformat(streak['last'])
+    if start <= day <= last:
+        return False
+    if day == last + timedelta(days=1):
+        streak['current'] += 1
+        streak['last'] = day.isoformat()
+    elif day > last:
+        streak.update(current=1, start=day.isoformat(), last=day.isoformat())
+    elif day == start - timedelta(days=1):
+        streak['current'] += 1
+        streak['start'] = day.isoformat()
+    else:
+        return False
+    streak['best'] = max(streak['best'], streak['current'])
+    return True
+
+
+def _record_steps(state, day, steps):
+    # Step logs add up over the latest day logged; a log for an older day counts on its own
+    current, total = state['steps_day']
+    if current == day:
+        total += steps
+        state['steps_day'] = [day, total]
+    else:
+        total = steps
+        if current is None or day > current:
+            state['steps_day'] = [day, steps]
+    state['best_day_steps'] = max(state['best_day_steps'], total)
+
+
+def _record_weight(state, day, weight):
+    tracked = state['weight']
+    if not tracked['fixed_start'] and (tracked['start_date'] is None or day < tracked['start_date']):
+        tracked.update(start=weight, start_date=day)
+    if tracked['latest_date'] is None or day >= tracked['latest_date']:
+        tracked.update(latest=weight, latest_date=day)
+
+
+def apply(state, table, row):
+    """Fold one row written to table into state, in place.
+
+    Returns (streaks whose current run changed, achievement codes newly unlocked).
+    """
+    if table not in TABLE_STREAKS or not row.get('date'):
+        return [], []
+    try:
+        day = date.fromisoformat(str(row['date'])[:10])
+    except ValueError:
+        return [], []
+    iso = day.isoformat()
+    state['counts'][table] = state['counts'].get(table, 0) + 1
+    names = list(TABLE_STREAKS[table])
+
+    if table == 'weight_logs':
+        weight = _number(row, 'weight')
+        if weight is not None:
+            _record_weight(state, iso, weight)
+    steps = _number(row, 'count') if table == 'step_logs' else _number(row, 'steps')
+    if table in ('step_logs', 'daily_logs') and steps:
+        _record_steps(state, iso, steps)
+        if table == 'daily_logs':
+            names.append('steps')
+    if table == 'daily_logs':
+        protein = _number(row, 'proteinGrams', 'protein_grams')
+        days = state['protein_days']
+        if protein is not None and protein >= PROTEIN_GOAL and iso not in days and len(days) < PROTEIN_DAYS:
+            days.append(iso)
+
+    changed = [name for name in names if _extend(state['streaks'].setdefault(name, {}), day)]
+    unlocked = [code for code, _, test in RULES_BY_TABLE[table]
+                if code not in state['unlocked'] and test(state)]
+    state['unlocked'] = sorted(state['unlocked'] + unlocked)
+    return changed, unlocked
+
+
+def apply_rows(state, table, rows):
+    changed, unlocked = set(), []
+    for row in rows:
+        streaks, codes = apply(state, table, row)
+        changed.update(streaks)
+        unlocked.extend(codes)
+    return changed, unlocked
+
+
+def streak_values(state):
+    # The streaks row the app reads: current run length per activity
+    return {name: state['streaks'].get(name, {}).get('current', 0) for name in STREAK_COLUMNS}
+
+
+def achievement_rows(user_id, codes, unlocked_at=None):
+    unlocked_at = unlocked_at or datetime.now(timezone.utc).isoformat()
+    return [{'user_id': user_id, 'achievement_code': code, **ACHIEVEMENTS[code],
+             'is_unlocked': True, 'unlocked_at': unlocked_at} for code in codes]
+
+
+def rebuild_state(rows_by_table, start_weight=None, unlocked=()):
+    """State recomputed from all of a user's rows in each TABLE_STREAKS table, in date order.
+
+    Returns (state, codes unlocked by the replay that weren't already).
+    """
+    state = new_state(start_weight, unlocked)
+    entries = sorted(((str(row['date'])[:10], table, row) for table, rows in rows_by_table.items()
+                      for row in rows or [] if row.get('date')), key=lambda entry: entry[0])
+    newly = []
+    for _, table, row in entries:
+        newly.extend(apply(state, table, row)[1])
+    return state, newly
+
+
+def user_rows(rows):
+    # Rows grouped by user, in write order
+    grouped = OrderedDict()
+    for row in rows:
+        if row.get('user_id'):
+            grouped.setdefault(row['user_id'], []).append(row)
+    return grouped
+
+
+class _Engine:
+    # State cache and bookkeeping shared by the thread and asyncio engines
+
+    def __init__(self, client, on_change=None, max_users=10000, retries=3):
+        self._client = client
+        self._on_change = on_change or (lambda table, user_id: None)
+        self._max_users = max_users
+        self._retries = retries
+        self._states = OrderedDict()  # user_id -> (state, version) as last saved
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.conflicts = 0
+        self.unlocked = 0
+
+    def _cached(self, user_id):
+        with self._lock:
+            cached = self._states.get(user_id)
+            if cached is None:
+                return None
+            self._states.move_to_end(user_id)
+            # The caller changes its copy; the cached one stays as saved until the save succeeds
+            return copy.deepcopy(cached[0]), cached[1]
+
+    def _remember(self, user_id, state, version):
+        with self._lock:
+            self._states[user_id] = (state, version)
+            self._states.move_to_end(user_id)
+            while len(self._states) > self._max_users:
+                self._states.popitem(last=False)
+
+    def _conflict(self, user_id):
+        # Another worker saved first: reload its state and apply the rows again
+        with self._lock:
+            self._states.pop(user_id, None)
+            self.conflicts += 1
+
+    def _saved(self, user_id, state, version, unlocked):
+        self._remember(user_id, state, version)
+        with self._lock:
+            self.writes += 1
+            self.unlocked += len(unlocked)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users_cached': len(self._states),
+                'writes': self.writes,
+                'conflicts': self.conflicts,
+                'unlocked': self.unlocked,
+            }
+
+
+class ProgressEngine(_Engine):
+    """Applies written rows to each user's state and saves it, with what changed.
+
+    A save is one update guarded by the state's version, so workers
+    writing the same user concurrently don't lose each other's rows: the
+    loser reloads and applies again. Recently used states are cached, so
+    a write normally costs that one update, plus an insert into
+    achievements when something unlocks and an update of the streaks row
+    when a current run changes.
+    """
+
+    def record(self, table, rows):
+        for user_id, group in user_rows(rows).items():
+            for _ in range(self._retries):
+                state, version = self._cached(user_id) or self._load(user_id)
+                changed, unlocked = apply_rows(state, table, group)
+                if self._save(user_id, state, version):
+                    self._saved(user_id, state, version + 1, unlocked)
+                    self._publish(user_id, state, changed, unlocked)
+                    break
+                self._conflict(user_id)
+            else:
+                logger.error(f"Gave up updating gamification state for {user_id} after {self._retries} conflicts")
+
+    def _load(self, user_id):
+        res = self._client.table('gamification_state').select('state,version').eq('user_id', user_id).execute()
+        if res.data:
+            return res.data[0]['state'], res.data[0]['version']
+        return self._initial(user_id), 0
+
+    def _initial(self, user_id):
+        # Seeded once per user from the profile and anything the app already unlocked
+        user = self._client.table('users').select('start_weight').eq('id', user_id).execute().data
+        unlocked = self._client.table('achievements').select('achievement_code').eq('user_id', user_id) \
+            .eq('is_unlocked', True).execute().data
+        return new_state(user[0].get('start_weight') if user else None,
+                         [row['achievement_code'] for row in unlocked if row.get('achievement_code')])
+
+    def _save(self, user_id, state, version):
+        row = {'state': state, 'version': version + 1, 'updated_at': datetime.now(timezone.utc).isoformat()}
+        if version == 0:
+            try:
+                self._client.table('gamification_state').insert({'user_id': user_id, **row}).execute()
+                return True
+            except Exception as e:
+                # Most likely another worker created the row first
+                logger.warning("Could not create gamification state: %s", e, extra={'user_id': user_id})
+                return False
+        res = self._client.table('gamification_state').update(row).eq('user_id', user_id) \
+            .eq('version', version).execute()
+        return bool(res.data)
+
+    def _publish(self, user_id, state, changed, unlocked):
+        if unlocked:
+            self._client.table('achievements').insert(achievement_rows(user_id, unlocked)).execute()
+            self._on_change('achievements', user_id)
+        if changed & set(STREAK_COLUMNS):
+            values = streak_values(state)
+            res = self._client.table('streaks').update(values).eq('user_id', user_id).execute()
+            if not res.data:
+                self._client.table('streaks').insert({'user_id': user_id, **values}).execute()
+            self._on_change('streaks', user_id)
+
+    def rebuild(self, user_id):
+        """Recompute a user's state from their logs, replacing what is stored; returns new unlocks."""
+        rows_by_table = {table: self._client.table(table).select('*').eq('user_id', user_id).execute().data
+                         for table in TABLE_STREAKS}
+        seed = self._initial(user_id)
+        state, unlocked = rebuild_state(rows_by_table, seed['weight']['start'], seed['unlocked'])
+        for _ in range(self._retries):
+            # The stored version, not the cached one, so any worker still holding the old state has to reload
+            _, version = self._load(user_id)
+            if self._save(user_id, state, version):
+                self._saved(user_id, state, version + 1, unlocked)
+                self._publish(user_id, state, set(STREAK_COLUMNS), unlocked)
+                return unlocked
+            self._conflict(user_id)
+        raise RuntimeError('gamification state kept changing during the rebuild')
+
+
+class AsyncProgressEngine(_Engine):
+    # ProgressEngine for the async Supabase client
+
+    async def record(self, table, rows):
+        for user_id, group in user_rows(rows).items():
+            for _ in range(self._retries):
+                state, version = self._cached(user_id) or await self._load(user_id)
+                changed, unlocked = apply_rows(state, table, group)
+                if await self._save(user_id, state, version):
+                    self._saved(user_id, state, version + 1, unlocked)
+                    await self._publish(user_id, state, changed, unlocked)
+                    break
+                self._conflict(user_id)
+            else:
+                logger.error(f"Gave up updating gamification state for {user_id} after {self._retries} conflicts")
+
+    async def _load(self, user_id):
+        res = await self._client.table('gamification_state').select('state,version').eq('user_id', user_id) \
+            .execute()
+        if res.data:
+            return res.data[0]['state'], res.data[0]['version']
+        return await self._initial(user_id), 0
+
+    async def _initial(self, user_id):
+        user = (await self._client.table('users').select('start_weight').eq('id', user_id).execute()).data
+        unlocked = (await self._client.table('achievements').select('achievement_code').eq('user_id', user_id)
+                    .eq('is_unlocked', True).execute()).data
+        return new_state(user[0].get('start_weight') if user else None,
+                         [row['achievement_code'] for row in unlocked if row.get('achievement_code')])
+
+    async def _save(self, user_id, state, version):
+        row = {'state': state, 'version': version + 1, 'updated_at': datetime.now(timezone.utc).isoformat()}
+        if version == 0:
+            try:
+                await self._client.table('gamification_state').insert({'user_id': user_id, **row}).execute()
+                return True
+            except Exception as e:
+                logger.warning("Could not create gamification state: %s", e, extra={'user_id': user_id})
+                return False
+        res = await self._client.table('gamification_state').update(row).eq('user_id', user_id) \
+            .eq('version', version).execute()
+        return bool(res.data)
+
+    async def _publish(self, user_id, state, changed, unlocked):
+        if unlocked:
+            await self._client.table('achievements').insert(achievement_rows(user_id, unlocked)).execute()
+            self._on_change('achievements', user_id)
+        if changed & set(STREAK_COLUMNS):
+            values = streak_values(state)
+            res = await self._client.table('streaks').update(values).eq('user_id', user_id).execute()
+            if not res.data:
+                await self._client.table('streaks').insert({'user_id': user_id, **values}).execute()
+            self._on_change('streaks', user_id)
+
+    async def rebuild(self, user_id):
+        tables = list(TABLE_STREAKS)
+        results = [await self._client.table(table).select('*').eq('user_id', user_id).execute() for table in tables]
+        seed = await self._initial(user_id)
+        state, unlocked = rebuild_state({table: res.data for table, res in zip(tables, results)},
+                                        seed['weight']['start'], seed['unlocked'])
+        for _ in range(self._retries):
+            _, version = await self._load(user_id)
+            if await self._save(user_id, state, version):
+                self._saved(user_id, state, version + 1, unlocked)
+                await self._publish(user_id, state, set(STREAK_COLUMNS), unlocked)
+                return unlocked
+            self._conflict(user_id)
+        raise RuntimeError('gamification state kept changing during the rebuild')
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+StoredResponse = namedtuple('StoredResponse', ['status', 'headers', 'body'])
+
+MAX_KEY_LENGTH = 255
+
+
+def should_store(status):
+    # Server errors and rate limiting are worth retrying, so those keys are released instead
+    return status < 500 and status != 429
+
+
+def fingerprint(method, full_path, body):
+    return hashlib.sha256(method.encode() + b' ' + full_path.encode() + b'\n' + body).hexdigest()
+
+
+class KeyReused(Exception):
+    # The key was already used for a request with a different method, path or body
+    pass
+
+
+class InProgress(Exception):
+    # The request holding the key was still running when the wait ran out
+    pass
+
+
+class _Entry:
+    __slots__ = ('fingerprint', 'response', 'expires', 'done')
+
+    def __init__(self, fingerprint, done):
+        self.fingerprint = fingerprint
+        self.response = None
+        self.expires = float('inf')
+        self.done = done
+
+
+class _Store:
+    # Bookkeeping shared by the thread and asyncio stores
+
+    def __init__(self, max_entries=5000, ttl=86400.0, max_wait=60.0):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._max_wait = max_wait
+        self._entries = OrderedDict()  # completed, in completion order
+        self._running = {}  # in flight, until completed or released
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.replayed = 0
+        self.waited = 0
+        self.released = 0
+        self.conflicts = 0
+
+    def _claim(self, key, fingerprint, new_event):
+        # (entry, True) if the caller now holds key, (entry, False) if someone else does or did
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._running.get(key) or self._entries.get(key)
+            if entry is None:
+                entry = self._running[key] = _Entry(fingerprint, new_event())
+                return entry, True
+            if entry.fingerprint != fingerprint:
+                self.conflicts += 1
+                raise KeyReused(key)
+            return entry, False
+
+    def _expire(self, now):
+        # Completed entries are kept in completion order, so expired ones are at the front;
+        # in-flight entries are kept apart and never hold expiry up
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if entry.expires > now:
+                break
+            self._entries.popitem(last=False)
+
+    def _replay(self, entry):
+        with self._lock:
+            self.replayed += 1
+        return entry.response
+
+    def complete(self, key, status, headers, body):
+        """Store the response for key, which the caller holds, and wake anyone waiting on it."""
+        with self._lock:
+            entry = self._running.pop(key, None)
+            if entry is None:
+                return
+            entry.response = StoredResponse(status, headers, body)
+            entry.expires = time.monotonic() + self._ttl
+            self._entries[key] = entry
+            self.stored += 1
+            # Oldest first; in-flight entries have waiters, so only other completed ones are evicted
+            excess = len(self._entries) + len(self._running) - self._max_entries
+            while excess > 0 and len(self._entries) > 1:
+                self._entries.popitem(last=False)
+                excess -= 1
+        entry.done.set()
+
+    def release(self, key):
+        """Give up key without a response; a waiting duplicate takes it over and runs."""
+        with self._lock:
+            entry = self._running.pop(key, None)
+            if entry is None:
+                return
+            self.released += 1
+        entry.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'keys': len(self._entries) + len(self._running),
+                'in_flight': len(self._running),
+                'stored': self.stored,
+                'replayed': self.replayed,
+                'waited': self.waited,
+                'released': self.released,
+                'conflicts': self.conflicts,
+            }
+
+
+class IdempotencyStore(_Store):
+    """Responses of write requests, by idempotency key, so a retry replays them.
+
+    begin(key, fingerprint) returns None when the caller should handle the
+    request; it must then complete() or release() the key. A later request
+    with the key gets the stored response back. A duplicate that arrives
+    while the first is running waits up to max_wait seconds for it, then
+    raises InProgress. The fingerprint ties a key to one request: reusing
+    the key for different content raises KeyReused. Completed responses
+    are kept for ttl seconds, at most max_entries of them. The store is per
+    process, so a retry that reaches another worker is not deduplicated.
+    """
+
+    def begin(self, key, fingerprint):
+        deadline = time.monotonic() + self._max_wait
+        while True:
+            entry, leader = self._claim(key, fingerprint, threading.Event)
+            if leader:
+                return None
+            if entry.response is not None:
+                return self._replay(entry)
+            with self._lock:
+                self.waited += 1
+            if not entry.done.wait(max(0.0, deadline - time.monotonic())):
+                raise InProgress(key)
+            if entry.response is not None:
+                return self._replay(entry)
+            # Released without a response: try to take the key over
+
+
+class AsyncIdempotencyStore(_Store):
+    # IdempotencyStore for coroutines on one event loop
+
+    async def begin(self, key, fingerprint):
+        deadline = time.monotonic() + self._max_wait
+        while True:
+            entry, leader = self._claim(key, fingerprint, asyncio.Event)
+            if leader:
+                return None
+            if entry.response is not None:
+                return self._replay(entry)
+            with self._lock:
+                self.waited += 1
+            try:
+                await asyncio.wait_for(entry.done.wait(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise InProgress(key)
+            if entry.response is not None:
+                return self._replay(entry)
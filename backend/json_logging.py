@@ -0,0 +1,163 @@
+"""Structured JSON logging written by a background thread.
+
+configure_logging() replaces the root logger's handlers with one that only
+appends each record to a bounded in-memory queue; a writer thread formats
+the queued records and writes them in batches, so request threads pay for
+building the record and nothing else. Messages use %-style arguments,
+which are only interpolated by the writer, and only for records that pass
+the level. Each record becomes one JSON object per line; fields passed
+with extra= become keys of their own. Long strings are truncated and DEBUG
+records are sampled, so chat payloads can't flood the output.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+# orjson is optional, as for response bodies
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+
+def truncate(value, limit):
+    if isinstance(value, str) and len(value) > limit:
+        return f'{value[:limit]}... (+{len(value) - limit} chars)'
+    return value
+
+
+def _dumps(entry):
+    if orjson is not None:
+        return orjson.dumps(entry, default=str).decode()
+    return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with string fields cut to max_chars."""
+
+    def __init__(self, max_chars=256):
+        super().__init__()
+        self._max_chars = max_chars
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': truncate(record.getMessage(), self._max_chars),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = truncate(value, self._max_chars)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return _dumps(entry)
+
+
+class DebugSampler(logging.Filter):
+    # Passes every record above DEBUG and about rate of the DEBUG ones
+    def __init__(self, rate):
+        super().__init__()
+        self._rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self._rate
+
+
+class QueueingHandler(logging.Handler):
+    """Queues records for a writer thread that formats and writes them in batches.
+
+    Logging a record appends it to a deque, without taking the handler
+    lock; once max_queue records are waiting, further ones are dropped and
+    counted rather than blocking the caller. The writer wakes every
+    interval seconds and writes everything queued with a single write and
+    flush. Records are formatted in the writer, so their arguments should
+    not be mutated after the call.
+    """
+
+    def __init__(self, stream, max_queue=10000, interval=0.05):
+        super().__init__()
+        self._stream = stream
+        self._max_queue = max_queue
+        self._interval = interval
+        self._records = deque()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.dropped = 0
+        self._writer = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._writer.start()
+
+    def handle(self, record):
+        if not self.filter(record):
+            return False
+        if len(self._records) >= self._max_queue:
+            with self._lock:
+                self.dropped += 1
+            return False
+        self._records.append(record)
+        return True
+
+    def emit(self, record):
+        self.handle(record)
+
+    def _run(self):
+        while not self._stopping.wait(self._interval):
+            self._drain()
+
+    def _drain(self):
+        lines = []
+        while self._records:
+            record = self._records.popleft()
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if lines:
+            self._stream.write('\n'.join(lines) + '\n')
+            self._stream.flush()
+
+    def close(self):
+        # Called by logging.shutdown() at exit: write whatever is still queued
+        self._stopping.set()
+        if self._writer.is_alive() and self._writer is not threading.current_thread():
+            self._writer.join()
+        self._drain()
+        super().close()
+
+
+_handler = None
+
+
+def configure_logging(level=None, max_chars=None, debug_sample_rate=None, max_queue=None, stream=None):
+    """Install the queued JSON handler on the root logger; later calls do nothing.
+
+    Defaults come from LOG_LEVEL (INFO), LOG_MAX_CHARS (256),
+    LOG_DEBUG_SAMPLE_RATE (0.1) and LOG_QUEUE_SIZE (10000).
+    """
+    global _handler
+    if _handler is not None:
+        return
+    if debug_sample_rate is None:
+        debug_sample_rate = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '0.1'))
+    max_queue = max_queue or int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    _handler = QueueingHandler(stream or sys.stderr, max_queue=max_queue)
+    _handler.setFormatter(JsonFormatter(max_chars or int(os.getenv('LOG_MAX_CHARS', '256'))))
+    _handler.addFilter(DebugSampler(debug_sample_rate))
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel((level or os.getenv('LOG_LEVEL', 'INFO')).upper())
+
+
+def dropped():
+    # Records lost because the queue was full
+    return _handler.dropped if _handler is not None else 0
@@ -0,0 +1,304 @@
+"""Request and upstream timing, exposed as Prometheus text and Server-Timing.
+
+The app times each request by route, and TracedSupabase / TracedModel time
+every Supabase execute() and Gemini call. Upstream calls made while a
+request is being handled are also collected as spans for that request's
+Server-Timing header; work submitted to executors is included when it runs
+in a copy of the request's context.
+"""
+import inspect
+import threading
+import time
+from contextvars import ContextVar
+
+from chat_context import content_role_text
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self._labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, value=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in values:
+            yield f'{self.name}{_labels(self._labels, labels)} {_number(value)}'
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self._labels = labels
+        self._buckets = buckets
+        self._series = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self._buckets) + 2)
+            for index, bound in enumerate(self._buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            else:
+                series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip((*self._buckets, '+Inf'), values):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(bound)
+                yield f'{self.name}_bucket{_labels(self._labels, labels, [("le", le)])} {cumulative}'
+            yield f'{self.name}_sum{_labels(self._labels, labels)} {_number(round(values[-1], 6))}'
+            yield f'{self.name}_count{_labels(self._labels, labels)} {cumulative}'
+
+
+class Gauge:
+    # Read when rendered: read() returns {label values tuple: value}
+    def __init__(self, name, help, labels, read):
+        self.name = name
+        self.help = help
+        self._labels = labels
+        self._read = read
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} gauge'
+        for labels, value in sorted(self._read().items()):
+            yield f'{self.name}{_labels(self._labels, labels)} {_number(value)}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def add(self, metric):
+        # A metric added under a name already in use replaces the earlier one
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        return '\n'.join(line for metric in self._metrics.values() for line in metric.render()) + '\n'
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.add(Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by route.', ('method', 'route', 'status')))
+REQUEST_BYTES = registry.add(Histogram(
+    'http_request_size_bytes', 'Request body size, by route.', ('method', 'route'), SIZE_BUCKETS))
+RESPONSE_BYTES = registry.add(Histogram(
+    'http_response_size_bytes', 'Response body size as sent, by route.', ('method', 'route'), SIZE_BUCKETS))
+UPSTREAM_SECONDS = registry.add(Histogram(
+    'upstream_request_duration_seconds', 'Time spent in each Supabase or Gemini call.',
+    ('service', 'operation', 'outcome')))
+SUPABASE_ROWS = registry.add(Counter(
+    'supabase_rows_total', 'Rows returned by Supabase calls.', ('operation',)))
+GEMINI_BYTES = registry.add(Counter(
+    'gemini_text_bytes_total', 'Characters of text sent to and received from Gemini.', ('direction',)))
+FOOD_IMAGE_BYTES = registry.add(Counter(
+    'food_image_bytes_total', 'Meal photo bytes received from clients and uploaded to Gemini.', ('stage',)))
+FOOD_ANALYSES = registry.add(Counter(
+    'food_analyses_total', 'Meal photo analyses, by whether the result came from the cache.', ('source',)))
+FOOD_MODEL_SECONDS = registry.add(Histogram(
+    'food_analysis_model_seconds', 'Time Gemini took to analyze a meal photo.'))
+
+# --- per-request spans for Server-Timing ---
+_spans = ContextVar('spans', default=None)
+
+
+def start_request():
+    """Start collecting spans for the request handled in the current context."""
+    _spans.set([])
+    return time.perf_counter()
+
+
+def _record_span(service, seconds):
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((service, seconds))
+
+
+def observe_request(method, route, status, started, request_bytes=None, response_bytes=None):
+    """Record a finished request; returns its Server-Timing header value."""
+    elapsed = time.perf_counter() - started
+    REQUEST_SECONDS.observe(elapsed, method, route, str(status))
+    if request_bytes is not None:
+        REQUEST_BYTES.observe(request_bytes, method, route)
+    if response_bytes is not None:
+        RESPONSE_BYTES.observe(response_bytes, method, route)
+    totals = {}
+    for service, seconds in _spans.get() or ():
+        count, total = totals.get(service, (0, 0.0))
+        totals[service] = (count + 1, total + seconds)
+    timings = [f'{service};dur={total * 1000:.1f};desc="{count} call{"s" if count > 1 else ""}"'
+               for service, (count, total) in totals.items()]
+    timings.append(f'app;dur={elapsed * 1000:.1f}')
+    return ', '.join(timings)
+
+
+def _observe_upstream(service, operation, started, error=None):
+    elapsed = time.perf_counter() - started
+    UPSTREAM_SECONDS.observe(elapsed, service, operation, 'error' if error is not None else 'ok')
+    _record_span(service, elapsed)
+
+
+# --- traced clients ---
+_ACTIONS = {'select', 'insert', 'upsert', 'update', 'delete'}
+
+
+class _TracedQuery:
+    # Wraps a postgrest builder chain; execute() is timed, sync or async
+    def __init__(self, builder, table, action='select'):
+        self._builder = builder
+        self._table = table
+        self._action = action
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+        action = name if name in _ACTIONS else self._action
+
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return _TracedQuery(result, self._table, action) if hasattr(result, 'execute') else result
+        return chained
+
+    def execute(self, *args, **kwargs):
+        operation = f'{self._table}.{self._action}'
+        started = time.perf_counter()
+        try:
+            result = self._builder.execute(*args, **kwargs)
+        except Exception as e:
+            _observe_upstream('supabase', operation, started, e)
+            raise
+        if inspect.isawaitable(result):
+            return self._finish(result, operation, started)
+        self._done(result, operation, started)
+        return result
+
+    async def _finish(self, pending, operation, started):
+        try:
+            result = await pending
+        except Exception as e:
+            _observe_upstream('supabase', operation, started, e)
+            raise
+        self._done(result, operation, started)
+        return result
+
+    def _done(self, result, operation, started):
+        _observe_upstream('supabase', operation, started)
+        data = getattr(result, 'data', None)
+        SUPABASE_ROWS.inc(operation, value=len(data) if isinstance(data, list) else int(data is not None))
+
+
+class TracedSupabase:
+    """Supabase client (sync or async) whose queries and rpc calls are timed."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def table(self, name):
+        return _TracedQuery(self._client.table(name), name)
+
+    def rpc(self, name, params=None, **kwargs):
+        return _TracedQuery(self._client.rpc(name, params, **kwargs), f'rpc:{name}', 'call')
+
+
+def _prompt_bytes(contents):
+    if isinstance(contents, str):
+        return len(contents)
+    if isinstance(contents, (list, tuple)):
+        return sum(_prompt_bytes(content) for content in contents)
+    return len(content_role_text(contents)[1])
+
+
+def _reply_bytes(response):
+    try:
+        return len(response.text)
+    except Exception:
+        # Blocked or empty candidates have no text
+        return 0
+
+
+class TracedModel:
+    """Gemini GenerativeModel whose generate_content calls are timed.
+
+    Streamed calls are timed until the response object is returned, which
+    is roughly the time to the first chunk.
+    """
+
+    def __init__(self, model):
+        self._model = model
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        operation = 'stream' if stream else 'generate'
+        started = time.perf_counter()
+        try:
+            response = self._model.generate_content(contents, stream=stream, **kwargs)
+        except Exception as e:
+            _observe_upstream('gemini', operation, started, e)
+            raise
+        self._done(contents, None if stream else response, operation, started)
+        return response
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        operation = 'stream' if stream else 'generate'
+        started = time.perf_counter()
+        try:
+            response = await self._model.generate_content_async(contents, stream=stream, **kwargs)
+        except Exception as e:
+            _observe_upstream('gemini', operation, started, e)
+            raise
+        self._done(contents, None if stream else response, operation, started)
+        return response
+
+    def _done(self, contents, response, operation, started):
+        _observe_upstream('gemini', operation, started)
+        GEMINI_BYTES.inc('prompt', value=_prompt_bytes(contents))
+        if response is not None:
+            GEMINI_BYTES.inc('reply', value=_reply_bytes(response))
@@ -0,0 +1,181 @@
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class WriteOutbox:
+    """Durable write-behind journal for Supabase inserts.
+
+    Rows are appended to a local SQLite journal and acknowledged right away.
+    A background thread drains the journal in order, batching consecutive rows
+    for the same table into one multi-row insert. A failing batch is retried
+    with backoff and blocks the rows behind it, so writes land in the order
+    they were accepted. Rows get their primary key up front and are written
+    with ``on conflict do nothing`` so a retried batch never duplicates rows.
+    """
+
+    def __init__(self, client, path='outbox.sqlite3', batch_size=100, flush_interval=0.5,
+                 max_attempts=5, max_backoff=30.0):
+        self._client = client
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_attempts = max_attempts
+        self._max_backoff = max_backoff
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('pragma journal_mode=wal')
+        self._db.execute('create table if not exists outbox ('
+                         'seq integer primary key autoincrement, tbl text not null, '
+                         'row text not null, created real not null)')
+        self._db.execute('create table if not exists outbox_dead ('
+                         'seq integer primary key, tbl text not null, row text not null, '
+                         'created real not null, error text)')
+        # Rows still journaled; counted once here so enqueue never has to scan the table
+        self._pending = self._db.execute('select count(*) from outbox').fetchone()[0]
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.flushed = 0
+        self.failures = 0
+        self.dead = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='supabase-outbox', daemon=True)
+            self._thread.start()
+        return self
+
+    def enqueue(self, table, row):
+        """Journal a row for insertion into table and return it with its id assigned."""
+        row = dict(row)
+        row.setdefault('id', str(uuid.uuid4()))
+        with self._lock:
+            self._db.execute('insert into outbox (tbl, row, created) values (?, ?, ?)',
+                             (table, json.dumps(row), time.time()))
+            self._pending += 1
+            full = self._pending >= self._batch_size
+        if full:
+            self._wakeup.set()
+        return row
+
+    def pending(self):
+        return self._pending
+
+    def _next_batch(self):
+        # Oldest run of consecutive rows that share a table
+        with self._lock:
+            rows = self._db.execute('select seq, tbl, row from outbox order by seq limit ?',
+                                    (self._batch_size,)).fetchall()
+        if not rows:
+            return None, []
+        table = rows[0][1]
+        batch = []
+        for seq, tbl, row in rows:
+            if tbl != table:
+                break
+            batch.append((seq, json.loads(row)))
+        return table, batch
+
+    def _insert(self, table, rows):
+        self._client.table(table).upsert(rows, on_conflict='id', ignore_duplicates=True,
+                                         default_to_null=False).execute()
+
+    def _delete(self, seqs):
+        with self._lock:
+            deleted = self._db.executemany('delete from outbox where seq = ?', [(seq,) for seq in seqs])
+            self._pending -= deleted.rowcount
+
+    def _bury(self, table, seq, row, error):
+        with self._lock:
+            self._db.execute('insert or replace into outbox_dead (seq, tbl, row, created, error) '
+                             'select seq, tbl, row, created, ? from outbox where seq = ?', (error, seq))
+            self._pending -= self._db.execute('delete from outbox where seq = ?', (seq,)).rowcount
+        self.dead += 1
+        logger.error(f"Moved {table} row {row.get('id')} to outbox_dead: {error}")
+
+    def flush_once(self):
+        """Write the next batch; returns the number of rows written."""
+        table, batch = self._next_batch()
+        if not batch:
+            return 0
+        rows = [row for _, row in batch]
+        last_error = None
+        for attempt in range(self._max_attempts):
+            try:
+                self._insert(table, rows)
+                self._delete([seq for seq, _ in batch])
+                self.flushed += len(batch)
+                return len(batch)
+            except Exception as e:
+                last_error = e
+                self.failures += 1
+                logger.warning(f"Outbox insert into {table} failed (attempt {attempt + 1}): {str(e)}")
+                if self._stopping.is_set():
+                    return 0
+                time.sleep(min(self._max_backoff, 0.1 * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+        # Still failing: write rows one at a time so only the offending row is set aside
+        written = 0
+        for seq, row in batch:
+            try:
+                self._insert(table, [row])
+            except Exception as e:
+                if _is_transient(e):
+                    # Leave it journaled; the flusher tries again on its next pass
+                    logger.warning(f"Outbox deferring {table} writes: {str(last_error)}")
+                    return written
+                self._bury(table, seq, row, str(e))
+                continue
+            self._delete([seq])
+            self.flushed += 1
+            written += 1
+        return written
+
+    def flush(self, timeout=None):
+        """Drain the journal synchronously, stopping early once timeout has passed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.flush_once():
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        return self.pending()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            try:
+                while not self._stopping.is_set() and self.flush_once():
+                    pass
+            except Exception as e:
+                logger.error(f"Outbox flusher error: {str(e)}")
+
+    def close(self, timeout=5.0):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._stopping.clear()
+        remaining = self.flush(timeout)
+        if remaining:
+            logger.warning(f"Outbox closed with {remaining} rows still journaled")
+
+    def stats(self):
+        return {
+            'pending': self.pending(),
+            'flushed': self.flushed,
+            'failures': self.failures,
+            'dead': self.dead,
+        }
+
+
+def _is_transient(error):
+    # postgrest raises APIError with a Postgres error code; anything else is network-level
+    code = str(getattr(error, 'code', '') or '')
+    return not code or code.startswith(('08', '5'))
@@ -0,0 +1,150 @@
+import base64
+import json
+import re
+from datetime import date
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+_COLUMN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def encode_cursor(row, sort_column=None):
+    key = [row.get(sort_column), row.get('id')] if sort_column else [row.get('id')]
+    raw = json.dumps(key, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor, sort_column=None):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('invalid cursor')
+    if not isinstance(key, list) or len(key) != (2 if sort_column else 1) or key[-1] is None:
+        raise ValueError('invalid cursor')
+    return key
+
+
+def page_args(args, sort_column=None, default_limit=DEFAULT_LIMIT, max_limit=MAX_LIMIT):
+    """Read limit and cursor from request args; raises ValueError on bad input.
+
+    Returns (limit, after) where after is the decoded cursor key or None.
+    """
+    limit = args.get('limit', default_limit)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    cursor = args.get('cursor')
+    return min(limit, max_limit), decode_cursor(cursor, sort_column) if cursor else None
+
+
+def date_range_args(args):
+    """Read the inclusive from and to dates (YYYY-MM-DD) from request args; raises ValueError on bad input.
+
+    Returns (first, last) as ISO strings, either of them None when absent.
+    """
+    try:
+        first = date.fromisoformat(args['from']).isoformat() if args.get('from') else None
+        last = date.fromisoformat(args['to']).isoformat() if args.get('to') else None
+    except ValueError:
+        raise ValueError('dates must be YYYY-MM-DD')
+    if first and last and last < first:
+        raise ValueError('from must not be after to')
+    return first, last
+
+
+def order_arg(args):
+    # True for newest first; a cursor must be used with the order it was issued for
+    order = args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+    return order == 'desc'
+
+
+def date_range(query, column, first=None, last=None):
+    # Bounds are applied in the query, so an index on (user_id, column) serves them
+    if first:
+        query = query.gte(column, first)
+    if last:
+        query = query.lte(column, last)
+    return query
+
+
+def _quote(value):
+    # PostgREST filter values containing , . : ( ) must be double-quoted
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{text}"'
+
+
+def page_query(query, limit, after=None, sort_column=None, desc=False):
+    """Order query by (sort_column, id) and start it after the cursor key.
+
+    The id tiebreaker keeps the order total, so rows sharing a date are never
+    skipped or repeated between pages. Nulls in sort_column sort as Postgres
+    sorts them, above every value (last ascending, first descending), which
+    keeps (user_id, sort_column, id) indexes usable both ways. One extra row
+    is requested so page_rows() can tell whether another page exists.
+    """
+    op = 'lt' if desc else 'gt'
+    if after:
+        last_id = _quote(after[-1])
+        if sort_column and after[0] is None:
+            # Among the nulls: the rest of them, then (descending) every non-null row
+            rest = f'and({sort_column}.is.null,id.{op}.{last_id})'
+            query = query.or_(f'{sort_column}.not.is.null,{rest}') if desc else query.or_(rest)
+        elif sort_column:
+            value = _quote(after[0])
+            nulls = '' if desc else f'{sort_column}.is.null,'
+            query = query.or_(f'{sort_column}.{op}.{value},{nulls}'
+                              f'and({sort_column}.eq.{value},id.{op}.{last_id})')
+        else:
+            query = getattr(query, op)('id', after[0])
+    if sort_column:
+        query = query.order(sort_column, desc=desc)
+    return query.order('id', desc=desc).limit(limit + 1)
+
+
+def page_rows(rows, limit, sort_column=None):
+    # (rows, next_cursor) from the result of page_query(); next_cursor is None on the last page
+    rows = rows or []
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1], sort_column)
+
+
+def fetch_page(query, limit, after=None, sort_column=None, desc=False):
+    """Run query ordered by (sort_column, id) starting after the cursor key.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    rows = page_query(query, limit, after, sort_column, desc).execute().data
+    return page_rows(rows, limit, sort_column)
+
+
+def select_columns(args, *required, known=None):
+    """Column list for select() from the fields= arg, or '*' when absent.
+
+    Columns in required (the id and sort key a cursor needs) are always kept.
+    When known (the table's column names) is given, other names are rejected
+    here rather than by PostgREST.
+    """
+    fields = args.get('fields')
+    if not fields:
+        return '*'
+    columns = []
+    for name in list(required) + fields.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if not _COLUMN.match(name):
+            raise ValueError(f'invalid field: {name}')
+        if known is not None and name not in known and name not in required:
+            raise ValueError(f'unknown field: {name}')
+        if name not in columns:
+            columns.append(name)
+    return ','.join(columns)
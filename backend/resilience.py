@@ -0,0 +1,346 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from contextvars import copy_context
+
+# HTTP statuses worth another attempt; google.api_core errors carry theirs as .code
+TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_transient(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return getattr(error, 'code', None) in TRANSIENT_CODES
+
+
+class CircuitOpen(Exception):
+    # Raised instead of calling an upstream the breaker considers down
+    def __init__(self, retry_after):
+        super().__init__('circuit open')
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing.
+
+    After failure_threshold consecutive failures the breaker opens and calls
+    fail fast with CircuitOpen for reset_timeout seconds. Then one trial call
+    is let through (half-open): success closes the breaker, failure opens it
+    again. Callers pair before_call() with record(ok), or with abandon() if
+    the call ended without telling either way.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self.opened = 0
+        self.short_circuited = 0
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self._reset_timeout - time.monotonic()
+                if remaining > 0:
+                    self.short_circuited += 1
+                    raise CircuitOpen(remaining)
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._trial:
+                    self.short_circuited += 1
+                    raise CircuitOpen(1)
+                self._trial = True
+
+    def record(self, ok):
+        with self._lock:
+            self._trial = False
+            if ok:
+                self.failures = 0
+                self.state = self.CLOSED
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self._failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def abandon(self):
+        with self._lock:
+            self._trial = False
+
+    def stats(self):
+        with self._lock:
+            retry_after = 0.0
+            if self.state == self.OPEN:
+                retry_after = max(0.0, self._opened_at + self._reset_timeout - time.monotonic())
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'opened': self.opened,
+                'short_circuited': self.short_circuited,
+                'retry_after_seconds': round(retry_after, 1),
+            }
+
+
+class LatencyWindow:
+    # The most recent size latencies, for percentiles
+    def __init__(self, size=500):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+    def stats(self):
+        return {f'p{q}_ms': round((self.percentile(q) or 0.0) * 1000, 1) for q in (50, 95, 99)}
+
+
+class _Guard:
+    # Retry, hedging and breaker bookkeeping shared by the thread and asyncio guards
+
+    def __init__(self, breaker, timeout=30.0, retries=2, backoff=0.5, max_backoff=4.0,
+                 hedge_percentile=None, hedge_min_samples=20, window=500):
+        self.breaker = breaker
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._hedge_percentile = hedge_percentile
+        self._hedge_min_samples = hedge_min_samples
+        self.latency = LatencyWindow(window)
+        self.first_chunk = LatencyWindow(window)
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(('calls', 'retries', 'timeouts', 'failures', 'hedged', 'hedge_wins'), 0)
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _hedge_delay(self):
+        # None until there are enough samples for the percentile to mean something
+        if self._hedge_percentile is None or len(self.latency) < self._hedge_min_samples:
+            return None
+        delay = self.latency.percentile(self._hedge_percentile)
+        return delay if delay < self._timeout else None
+
+    def _pause(self, attempt):
+        # Full jitter, so clients that failed together don't retry together
+        return random.uniform(0, min(self._max_backoff, self._backoff * 2 ** attempt))
+
+    def _should_retry(self, error, can_retry):
+        # Counts the failure; settles the breaker unless another attempt follows
+        transient = is_transient(error)
+        if isinstance(error, TimeoutError):
+            self._count('timeouts')
+        if transient and can_retry:
+            self._count('retries')
+            return True
+        self._count('failures')
+        # Anything else (a bad request, say) means the upstream answered
+        self.breaker.record(not transient)
+        return False
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        return {
+            'breaker': self.breaker.stats(),
+            **counts,
+            'timeout_seconds': self._timeout,
+            'hedge_percentile': self._hedge_percentile,
+            'hedge_after_ms': round((self._hedge_delay() or 0.0) * 1000, 1),
+            'latency': self.latency.stats(),
+            'first_chunk_latency': self.first_chunk.stats(),
+        }
+
+
+class CallGuard(_Guard):
+    """Deadline, jittered retries, hedging and a circuit breaker around a blocking call.
+
+    call(fn) runs fn(timeout) on the executor and waits at most timeout
+    seconds for it; fn should pass the timeout on to its client as well, as
+    a thread can't be cancelled. Transient errors are retried up to retries
+    times after a jittered exponential pause. With hedge_percentile set, a
+    second fn is started once the first has taken longer than that
+    percentile of recent calls, and whichever succeeds first wins. The
+    executor needs two workers per concurrent caller when hedging.
+    """
+
+    def __init__(self, breaker, executor, **options):
+        super().__init__(breaker, **options)
+        self._executor = executor
+
+    def call(self, fn):
+        self.breaker.before_call()
+        self._count('calls')
+        attempt = 0
+        while True:
+            try:
+                result = self._attempt(fn)
+            except Exception as e:
+                if not self._should_retry(e, attempt < self._retries):
+                    raise
+                time.sleep(self._pause(attempt))
+                attempt += 1
+                continue
+            self.breaker.record(True)
+            return result
+
+    def _attempt(self, fn):
+        started = time.monotonic()
+        # Attempts run in the caller's context, so request-scoped state follows them
+        futures = [self._executor.submit(copy_context().run, fn, self._timeout)]
+        delay = self._hedge_delay()
+        if delay is not None and not wait(futures, timeout=delay).done:
+            self._count('hedged')
+            futures.append(self._executor.submit(copy_context().run, fn, self._timeout - delay))
+        pending, error = set(futures), None
+        while pending:
+            remaining = started + self._timeout - time.monotonic()
+            done, pending = wait(pending, timeout=max(remaining, 0), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    if future is not futures[0]:
+                        self._count('hedge_wins')
+                    self.latency.add(time.monotonic() - started)
+                    return future.result()
+        if pending or error is None:
+            self.latency.add(self._timeout)
+            raise TimeoutError(f'no response within {self._timeout}s')
+        raise error
+
+    def stream(self, fn):
+        """Yield from fn(timeout), retrying only until the first item arrives; never hedged."""
+        self.breaker.before_call()
+        self._count('calls')
+        settled = False
+        try:
+            attempt = 0
+            while True:
+                started, first = time.monotonic(), True
+                try:
+                    for item in fn(self._timeout):
+                        if first:
+                            self.first_chunk.add(time.monotonic() - started)
+                            first = False
+                        yield item
+                except Exception as e:
+                    if not self._should_retry(e, first and attempt < self._retries):
+                        settled = True
+                        raise
+                    time.sleep(self._pause(attempt))
+                    attempt += 1
+                    continue
+                self.breaker.record(True)
+                settled = True
+                return
+        finally:
+            if not settled:
+                # The consumer went away mid-stream
+                self.breaker.abandon()
+
+
+class AsyncCallGuard(_Guard):
+    # CallGuard for coroutines: fn(timeout) returns an awaitable, and losing hedges are cancelled
+
+    async def call(self, fn):
+        self.breaker.before_call()
+        self._count('calls')
+        attempt = 0
+        while True:
+            try:
+                result = await self._attempt(fn)
+            except Exception as e:
+                if not self._should_retry(e, attempt < self._retries):
+                    raise
+                await asyncio.sleep(self._pause(attempt))
+                attempt += 1
+                continue
+            self.breaker.record(True)
+            return result
+
+    async def _attempt(self, fn):
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(fn(self._timeout))]
+        pending = set(tasks)
+        try:
+            delay = self._hedge_delay()
+            if delay is not None and not (await asyncio.wait(tasks, timeout=delay))[0]:
+                self._count('hedged')
+                tasks.append(asyncio.ensure_future(fn(self._timeout - delay)))
+                pending.add(tasks[-1])
+            error = None
+            while pending:
+                remaining = started + self._timeout - time.monotonic()
+                done, pending = await asyncio.wait(pending, timeout=max(remaining, 0),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if task is not tasks[0]:
+                            self._count('hedge_wins')
+                        self.latency.add(time.monotonic() - started)
+                        return task.result()
+            if pending or error is None:
+                self.latency.add(self._timeout)
+                raise TimeoutError(f'no response within {self._timeout}s')
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, fn):
+        # fn(timeout) returns an awaitable resolving to an async iterable
+        self.breaker.before_call()
+        self._count('calls')
+        settled = False
+        try:
+            attempt = 0
+            while True:
+                started, first = time.monotonic(), True
+                try:
+                    async for item in await asyncio.wait_for(fn(self._timeout), self._timeout):
+                        if first:
+                            self.first_chunk.add(time.monotonic() - started)
+                            first = False
+                        yield item
+                except Exception as e:
+                    if not self._should_retry(e, first and attempt < self._retries):
+                        settled = True
+                        raise
+                    await asyncio.sleep(self._pause(attempt))
+                    attempt += 1
+                    continue
+                self.breaker.record(True)
+                settled = True
+                return
+        finally:
+            if not settled:
+                self.breaker.abandon()
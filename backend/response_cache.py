@@ -0,0 +1,92 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag', 'expires'])
+
+
+def make_etag(body):
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+class ResponseCache:
+    """In-process TTL + LRU cache of serialized GET responses.
+
+    Entries are keyed by (table, user_id, query params) and indexed per
+    (table, user_id) so a write drops exactly the entries it can affect.
+    Each (table, user_id) carries a generation number that invalidation
+    bumps; a read that started before a write won't store its result.
+    The cache is per process, so other workers may serve data up to ttl old.
+    """
+
+    def __init__(self, max_entries=2048, ttl=30.0):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._index = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def generation(self, table, user_id):
+        with self._lock:
+            return self._generations.get((table, user_id), 0)
+
+    def get(self, table, user_id, params):
+        key = (table, user_id, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, table, user_id, params, body, generation):
+        """Cache body unless (table, user_id) was invalidated since generation was read."""
+        entry = CachedResponse(body, make_etag(body), time.monotonic() + self._ttl)
+        key = (table, user_id, params)
+        with self._lock:
+            if self._generations.get((table, user_id), 0) != generation:
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._index.setdefault((table, user_id), set()).add(key)
+            while len(self._entries) > self._max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, table, user_id):
+        with self._lock:
+            scope = (table, user_id)
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+            for key in self._index.pop(scope, ()):
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._index.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._index[key[:2]]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,337 @@
+"""Request validation generated from the column definitions in supabase_schema.sql.
+
+load_schemas reads the create table and alter table ... add column
+statements once at startup and compiles a coercer for every column, so a
+write is checked against the table before it is sent to Supabase:
+
+- columns the table doesn't have are dropped;
+- values are coerced to the column type (numeric strings to numbers,
+  'true'/'false' to booleans, timestamps to their date for date columns)
+  and anything that can't be is rejected, along with integers out of range;
+- text is limited to text_max_chars characters, or n for varchar(n);
+- on insert, not null columns without a default must be given.
+
+Columns named in trusted (user_id: the route checks it against the
+caller) are taken as given on insert and can't be changed by an update;
+neither can the primary key. Tables the schema file doesn't describe have
+no TableSchema and are written as before.
+"""
+import math
+import re
+import uuid
+from datetime import date, datetime
+
+TEXT_MAX_CHARS = 5000
+
+_INTEGER_BITS = {'smallint': 16, 'int2': 16, 'integer': 32, 'int': 32, 'int4': 32, 'bigint': 64, 'int8': 64}
+_FLOATS = {'float', 'float4', 'float8', 'real', 'double precision', 'numeric', 'decimal'}
+_TEXTS = {'text', 'varchar', 'character varying', 'char', 'character', 'citext'}
+_TIMESTAMPS = {'timestamp', 'timestamptz', 'timestamp with time zone', 'timestamp without time zone'}
+_BOOLEANS = {'true': True, 't': True, 'yes': True, 'on': True, '1': True,
+             'false': False, 'f': False, 'no': False, 'off': False, '0': False}
+
+_COMMENT = re.compile(r'--[^\n]*')
+_CREATE = re.compile(r'create\s+table\s+(?:if\s+not\s+exists\s+)?([\w."]+)\s*\((.*?)\)\s*;', re.I | re.S)
+_ALTER = re.compile(r'alter\s+table\s+(?:if\s+exists\s+)?(?:only\s+)?([\w."]+)\s+(.*?);', re.I | re.S)
+_ADD_COLUMN = re.compile(r'add\s+(?:column\s+)?(?:if\s+not\s+exists\s+)?(.*)', re.I | re.S)
+_DROP_COLUMN = re.compile(r'drop\s+(?:column\s+)?(?:if\s+exists\s+)?("[^"]+"|\w+)', re.I)
+_COLUMN = re.compile(r'\s*("[^"]+"|\w+)\s+(.*)', re.S)
+# Words that end a column's type and start its constraints
+_CONSTRAINT_WORDS = re.compile(r'\s(?:not|null|default|primary|references|unique|check|constraint|'
+                               r'generated|collate)\b', re.I)
+_TABLE_CONSTRAINT = re.compile(r'(?:constraint\s+\w+\s+)?(primary\s+key|unique|foreign\s+key|check|exclude)\b',
+                               re.I)
+_PRIMARY_KEY_COLUMNS = re.compile(r'primary\s+key\s*\(([^)]*)\)', re.I)
+_TIME = re.compile(r'(\d{1,2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?')
+
+
+class InvalidRow(ValueError):
+    # A write rejected against the table schema; errors maps column -> problem
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(f'{column} {problem}' for column, problem in errors.items()))
+
+
+class Column:
+    __slots__ = ('name', 'type', 'length', 'not_null', 'has_default', 'primary_key')
+
+    def __init__(self, name, type, length=None, not_null=False, has_default=False, primary_key=False):
+        self.name = name
+        self.type = type
+        self.length = length
+        self.not_null = not_null
+        self.has_default = has_default
+        self.primary_key = primary_key
+
+
+# --- parsing ---
+def _identifier(name):
+    return name[1:-1] if name.startswith('"') else name.lower()
+
+
+def _split(body):
+    # Split on commas that aren't inside parentheses or quotes
+    items, depth, quoted, start = [], 0, False, 0
+    for index, char in enumerate(body):
+        if char in '"\'':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            items.append(body[start:index])
+            start = index + 1
+    items.append(body[start:])
+    return [item.strip() for item in items if item.strip()]
+
+
+def parse_column(definition):
+    """Column from a definition like 'weight float not null'; None for a table constraint."""
+    if _TABLE_CONSTRAINT.match(definition):
+        return None
+    match = _COLUMN.match(definition)
+    if match is None:
+        return None
+    name, rest = _identifier(match.group(1)), ' ' + match.group(2)
+    end = _CONSTRAINT_WORDS.search(rest)
+    type_text, constraints = (rest[:end.start()], rest[end.start():]) if end else (rest, '')
+    type_text = ' '.join(type_text.lower().split())
+    length = None
+    sized = re.match(r'(.*?)\s*\((\d+)(?:\s*,\s*\d+)?\)\s*(.*)', type_text)
+    if sized:
+        type_text = ' '.join(part for part in (sized.group(1), sized.group(3)) if part)
+        length = int(sized.group(2))
+    constraints = ' '.join(constraints.lower().split())
+    primary_key = 'primary key' in constraints
+    return Column(name, type_text, length,
+                  not_null='not null' in constraints or primary_key,
+                  has_default=re.search(r'\bdefault\b', constraints) is not None or type_text in ('serial',
+                                                                                                 'bigserial'),
+                  primary_key=primary_key)
+
+
+def parse_schema(sql):
+    """{table: {column name: Column}} from create table and alter table statements, in order."""
+    sql = _COMMENT.sub('', sql)
+    statements = sorted([(m.start(), 'create', m) for m in _CREATE.finditer(sql)] +
+                        [(m.start(), 'alter', m) for m in _ALTER.finditer(sql)], key=lambda item: item[0])
+    tables = {}
+    for _, kind, match in statements:
+        table = _identifier(match.group(1).split('.')[-1])
+        if kind == 'create':
+            columns = tables.setdefault(table, {})
+            for item in _split(match.group(2)):
+                column = parse_column(item)
+                if column is not None:
+                    columns[column.name] = column
+                    continue
+                keys = _PRIMARY_KEY_COLUMNS.match(item)
+                for name in (keys.group(1).split(',') if keys else ()):
+                    key = columns.get(_identifier(name.strip()))
+                    if key is not None:
+                        key.primary_key = key.not_null = True
+            continue
+        columns = tables.get(table)
+        if columns is None:
+            continue
+        for action in _split(match.group(2)):
+            added = _ADD_COLUMN.match(action)
+            if added:
+                column = parse_column(added.group(1))
+                if column is not None:
+                    columns.setdefault(column.name, column)
+                continue
+            dropped = _DROP_COLUMN.match(action)
+            if dropped:
+                columns.pop(_identifier(dropped.group(1)), None)
+    return tables
+
+
+# --- coercion ---
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _float(value):
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError('must be a number')
+    if not _is_number(value) or not math.isfinite(value):
+        raise ValueError('must be a number')
+    return value
+
+
+def _integer(bits):
+    low, high = -(1 << bits - 1), (1 << bits - 1) - 1
+
+    def coerce(value):
+        if isinstance(value, str):
+            try:
+                value = int(value.strip())
+            except ValueError:
+                raise ValueError('must be an integer')
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError('must be an integer')
+        if not low <= value <= high:
+            raise ValueError(f'must be between {low} and {high}')
+        return value
+    return coerce
+
+
+def _text(max_chars):
+    def coerce(value):
+        if _is_number(value):
+            value = str(value)
+        if not isinstance(value, str):
+            raise ValueError('must be a string')
+        if len(value) > max_chars:
+            raise ValueError(f'must be at most {max_chars} characters')
+        return value
+    return coerce
+
+
+def _boolean(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in _BOOLEANS:
+        return _BOOLEANS[value.strip().lower()]
+    if value in (0, 1) and not isinstance(value, float):
+        return bool(value)
+    raise ValueError('must be true or false')
+
+
+def _uuid(value):
+    if isinstance(value, str):
+        try:
+            return str(uuid.UUID(value))
+        except ValueError:
+            pass
+    raise ValueError('must be a UUID')
+
+
+def _date(value):
+    # A timestamp is cut to its date, as Postgres does when casting it
+    if isinstance(value, str) and (len(value) == 10 or len(value) > 10 and value[10] in 'T '):
+        try:
+            date.fromisoformat(value[:10])
+            return value[:10]
+        except ValueError:
+            pass
+    raise ValueError('must be a date (YYYY-MM-DD)')
+
+
+def _time(value):
+    match = _TIME.fullmatch(value.strip()) if isinstance(value, str) else None
+    if match and int(match.group(1)) < 24 and int(match.group(2)) < 60 and int(match.group(3) or 0) < 60:
+        return value.strip()
+    raise ValueError('must be a time (HH:MM or HH:MM:SS)')
+
+
+def _timestamp(value):
+    if isinstance(value, str):
+        try:
+            datetime.fromisoformat(value.replace('Z', '+00:00'))
+            return value
+        except ValueError:
+            pass
+    raise ValueError('must be an ISO 8601 timestamp')
+
+
+def _any(value):
+    return value
+
+
+def coercer(column, text_max_chars=TEXT_MAX_CHARS):
+    """Function that returns value as the column's type or raises ValueError; unknown types pass through."""
+    kind = column.type
+    if kind in _INTEGER_BITS:
+        return _integer(_INTEGER_BITS[kind])
+    if kind in _FLOATS:
+        return _float
+    if kind in _TEXTS:
+        return _text(min(column.length, text_max_chars) if column.length else text_max_chars)
+    if kind in ('boolean', 'bool'):
+        return _boolean
+    if kind == 'uuid':
+        return _uuid
+    if kind == 'date':
+        return _date
+    if kind in ('time', 'time without time zone'):
+        return _time
+    if kind in _TIMESTAMPS:
+        return _timestamp
+    return _any
+
+
+class TableSchema:
+    """Validator for writes to one table, compiled from its columns."""
+
+    def __init__(self, table, columns, trusted=('user_id',), text_max_chars=TEXT_MAX_CHARS):
+        self.table = table
+        self.columns = frozenset(columns)
+        self._trusted = frozenset(trusted)
+        # column -> (coerce, nullable)
+        self._columns = {name: (coercer(column, text_max_chars), not column.not_null)
+                         for name, column in columns.items() if name not in self._trusted}
+        self._required = tuple(name for name, column in columns.items()
+                               if column.not_null and not column.has_default and name not in self._trusted)
+        self._immutable = frozenset(name for name, column in columns.items() if column.primary_key) | self._trusted
+
+    def _coerce(self, data, skip, errors):
+        row = {}
+        for name, value in data.items():
+            spec = self._columns.get(name)
+            if spec is None or name in skip:
+                continue
+            if value is None:
+                if not spec[1]:
+                    errors[name] = 'must not be null'
+                row[name] = None
+                continue
+            try:
+                row[name] = spec[0](value)
+            except ValueError as e:
+                errors[name] = str(e)
+        return row
+
+    def row(self, data):
+        """Row to insert from data: known columns coerced, others dropped, trusted ones kept as given."""
+        if not isinstance(data, dict):
+            raise InvalidRow({'row': 'must be an object'})
+        errors = {}
+        row = self._coerce(data, (), errors)
+        for name in self._required:
+            if row.get(name) is None and name not in errors:
+                errors[name] = 'is required'
+        if errors:
+            raise InvalidRow(errors)
+        for name in self._trusted:
+            if name in data:
+                row[name] = data[name]
+        return row
+
+    def changes(self, data):
+        """Columns to update from data; the primary key and trusted columns are never changed."""
+        if not isinstance(data, dict):
+            raise InvalidRow({'row': 'must be an object'})
+        errors = {}
+        changes = self._coerce(data, self._immutable, errors)
+        if errors:
+            raise InvalidRow(errors)
+        if not changes:
+            raise InvalidRow({'row': 'has no columns to update'})
+        return changes
+
+
+def load_schemas(path, text_max_chars=TEXT_MAX_CHARS, trusted=('user_id',)):
+    """{table: TableSchema} for the tables defined in the SQL file at path."""
+    with open(path, encoding='utf-8') as f:
+        tables = parse_schema(f.read())
+    return {table: TableSchema(table, columns, trusted, text_max_chars) for table, columns in tables.items()}
@@ -0,0 +1,212 @@
+"""Chart series for weight and step logs: bucketed, then downsampled.
+
+Rows are grouped into day, week or month buckets (mean, min, max, sum and
+count of each), and when there are more buckets than the chart asked for,
+Largest-Triangle-Three-Buckets picks the ones that keep the line's shape:
+peaks and dips survive where plain averaging would flatten them. The
+response stays a fixed size however long the history is.
+
+The arithmetic runs on numpy arrays when numpy is installed and on plain
+lists otherwise; both give the same points.
+"""
+from datetime import date
+
+from pagination import date_range_args
+from weekly_scores import week_start
+
+# numpy is optional; without it the same arithmetic runs on lists
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BUCKETS = ('day', 'week', 'month')
+DEFAULT_POINTS = 300
+MAX_POINTS = 1000
+
+# Below this many points per range, a numpy call per range costs more than it saves
+ARRAY_RANGE_MIN = 32
+
+# metric -> (table, value column, the aggregate charted and downsampled on)
+METRICS = {
+    'weight': ('weight_logs', 'weight', 'mean'),
+    'steps': ('step_logs', 'count', 'sum'),
+}
+
+
+def series_args(args, default_points=DEFAULT_POINTS, max_points=MAX_POINTS):
+    """Read from, to, bucket and points from request args; raises ValueError on bad input."""
+    first, last = date_range_args(args)
+    bucket = args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    try:
+        points = int(args.get('points', default_points))
+    except ValueError:
+        raise ValueError('points must be an integer')
+    if points < 3:
+        raise ValueError('points must be at least 3')
+    return first, last, bucket, min(points, max_points)
+
+
+def _bucket_start(day, bucket):
+    day = date.fromisoformat(day)
+    if bucket == 'week':
+        return week_start(day)
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _samples(rows, column):
+    # (dates, values) for every dated row with a numeric value
+    dates, values = [], []
+    for row in rows:
+        try:
+            value = float(row[column])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if row.get('date'):
+            dates.append(row['date'][:10])
+            values.append(value)
+    return dates, values
+
+
+# date.toordinal() of numpy's day 0, 1970-01-01 (a Thursday)
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _aggregate_arrays(dates, values, bucket):
+    days = np.array(dates, dtype='datetime64[D]')
+    if bucket == 'month':
+        days = days.astype('datetime64[M]').astype('datetime64[D]')
+    keys = days.astype(np.int64) + _EPOCH_ORDINAL
+    if bucket == 'week':
+        # Back to Sunday; ordinals are multiples of 7 on Sundays
+        keys -= keys % 7
+    order = np.argsort(keys, kind='stable')
+    keys, values = keys[order], np.asarray(values, dtype=np.float64)[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    sums = np.add.reduceat(values, starts)
+    counts = np.diff(np.r_[starts, len(keys)])
+    return {
+        'x': keys[starts].tolist(),
+        'mean': (sums / counts).tolist(),
+        'min': np.minimum.reduceat(values, starts).tolist(),
+        'max': np.maximum.reduceat(values, starts).tolist(),
+        'sum': sums.tolist(),
+        'count': counts.tolist(),
+    }
+
+
+def _aggregate_lists(dates, values, bucket):
+    samples = sorted(((_bucket_start(day, bucket).toordinal(), value) for day, value in zip(dates, values)),
+                     key=lambda sample: sample[0])
+    result = {name: [] for name in ('x', 'mean', 'min', 'max', 'sum', 'count')}
+    for key, value in samples:
+        if result['x'] and result['x'][-1] == key:
+            result['min'][-1] = min(result['min'][-1], value)
+            result['max'][-1] = max(result['max'][-1], value)
+            result['sum'][-1] += value
+            result['count'][-1] += 1
+        else:
+            result['x'].append(key)
+            result['min'].append(value)
+            result['max'].append(value)
+            result['sum'].append(value)
+            result['count'].append(1)
+    result['mean'] = [total / count for total, count in zip(result['sum'], result['count'])]
+    return result
+
+
+def aggregate(rows, column, bucket='day'):
+    """Per-bucket statistics of row[column]: a dict of equal-length lists.
+
+    Keys are x (bucket start as a date ordinal), mean, min, max, sum and
+    count, in bucket order.
+    """
+    dates, values = _samples(rows, column)
+    if not dates:
+        return {name: [] for name in ('x', 'mean', 'min', 'max', 'sum', 'count')}
+    if np is not None:
+        return _aggregate_arrays(dates, values, bucket)
+    return _aggregate_lists(dates, values, bucket)
+
+
+def _ranges(n, threshold):
+    # [start, end) of each of the threshold - 2 ranges between the first and last point
+    every = (n - 2) / (threshold - 2)
+    bounds = [int(i * every) + 1 for i in range(threshold - 2)] + [n - 1]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _lttb_arrays(xs, ys, ranges):
+    xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    # The average of every range (and of the last point) at once, from running sums
+    bounds = np.array([start for start, _ in ranges] + [len(xs) - 1, len(xs)])
+    widths = np.diff(bounds)
+    avg_x = (np.add.reduceat(xs, bounds[:-1]) / widths)[1:].tolist()
+    avg_y = (np.add.reduceat(ys, bounds[:-1]) / widths)[1:].tolist()
+    x_values, y_values = xs.tolist(), ys.tolist()
+    selected = [0]
+    for (start, end), next_x, next_y in zip(ranges, avg_x, avg_y):
+        ax, ay = x_values[selected[-1]], y_values[selected[-1]]
+        # Twice the triangle areas, up to sign: a linear function of each candidate's x and y
+        areas = (ax - next_x) * ys[start:end] + (next_y - ay) * xs[start:end]
+        areas -= (ax - next_x) * ay + (next_y - ay) * ax
+        selected.append(start + int(np.abs(areas, out=areas).argmax()))
+    return selected
+
+
+def _lttb_lists(xs, ys, ranges):
+    bounds = ranges[1:] + [(len(xs) - 1, len(xs))]
+    selected = [0]
+    for (start, end), (next_start, next_end) in zip(ranges, bounds):
+        count = next_end - next_start
+        next_x = sum(xs[next_start:next_end]) / count
+        next_y = sum(ys[next_start:next_end]) / count
+        ax, ay = xs[selected[-1]], ys[selected[-1]]
+        selected.append(max(range(start, end),
+                            key=lambda j: abs((ax - next_x) * (ys[j] - ay) - (ax - xs[j]) * (next_y - ay))))
+    return selected
+
+
+def lttb(xs, ys, threshold):
+    """Indices of threshold points chosen by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept; the rest are split into
+    threshold - 2 equal ranges and one point is taken from each, the one
+    making the largest triangle with the point kept before it and the
+    average of the next range.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    ranges = _ranges(n, threshold)
+    if np is not None and n >= ARRAY_RANGE_MIN * threshold:
+        selected = _lttb_arrays(xs, ys, ranges)
+    else:
+        selected = _lttb_lists(xs, ys, ranges)
+    return selected + [n - 1]
+
+
+def _plain(value):
+    # 8000.0 -> 8000, so step counts read as counts
+    return int(value) if float(value).is_integer() else value
+
+
+def series(rows, column, bucket='day', points=DEFAULT_POINTS, value='mean'):
+    """Chart points for rows: aggregate() by bucket, then lttb() on the value aggregate.
+
+    Returns (points, bucket count before downsampling).
+    """
+    stats = aggregate(rows, column, bucket)
+    keep = lttb(stats['x'], stats[value], points)
+    return [{
+        'date': date.fromordinal(stats['x'][i]).isoformat(),
+        'mean': _plain(round(stats['mean'][i], 2)),
+        'min': _plain(stats['min'][i]),
+        'max': _plain(stats['max'][i]),
+        'sum': _plain(round(stats['sum'][i], 2)),
+        'count': stats['count'][i],
+    } for i in keep], len(stats['x'])
@@ -0,0 +1,76 @@
+import threading
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers that arrive while
+    it is running wait and receive the same result, or the same exception.
+    Nothing is kept once the call returns, so this is not a cache. Keys are
+    tuples whose first item is a scope (the user id); forget(scope) makes
+    later callers start a fresh call, so a read issued after a write never
+    joins a read that started before it.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def forget(self, scope=None):
+        """Detach in-flight calls for scope (all of them if None) from new callers."""
+        with self._lock:
+            if scope is None:
+                self._flights.clear()
+                return
+            for key in [key for key in self._flights if key[0] == scope]:
+                del self._flights[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+            }
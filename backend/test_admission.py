@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import admission
+import app as backend
+from admission import AdmissionGate, AsyncAdmissionGate, Rejected, TokenBuckets
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, 'monotonic', clock)
+    return clock
+
+
+def test_buckets_refill_over_time(clock):
+    buckets = TokenBuckets(rate=0.5, burst=2)
+    assert buckets.take('u1') == 0 and buckets.take('u1') == 0
+    assert buckets.take('u1') == pytest.approx(2.0)
+    assert buckets.take('u2') == 0
+    clock.now += 1
+    assert buckets.take('u1') == pytest.approx(1.0)
+    clock.now += 1
+    assert buckets.take('u1') == 0
+    clock.now += 60
+    # Refilling stops at burst
+    assert [buckets.take('u1') > 0 for _ in range(3)] == [False, False, True]
+    assert buckets.stats() == {'keys': 2, 'limited': 3}
+
+
+def test_a_full_queue_is_rejected_with_a_retry_after():
+    gate = AdmissionGate(max_concurrent=1, max_queue=0, max_wait=2)
+    ticket = gate.acquire()
+    with pytest.raises(Rejected, match='queue full') as rejected:
+        gate.acquire()
+    assert rejected.value.retry_after == 2
+    gate.release(ticket)
+    gate.release(gate.acquire())
+    assert gate.stats()['admitted'] == 2 and gate.stats()['rejected'] == 1
+
+
+def test_a_queued_caller_times_out_or_takes_the_freed_slot():
+    gate = AdmissionGate(max_concurrent=1, max_queue=1, max_wait=0.05)
+    ticket = gate.acquire()
+    started = time.monotonic()
+    with pytest.raises(Rejected, match='timed out'):
+        gate.acquire()
+    assert time.monotonic() - started >= 0.05 and gate.stats()['waiting'] == 0
+
+    gate = AdmissionGate(max_concurrent=1, max_queue=1, max_wait=5)
+    ticket = gate.acquire()
+    threading.Timer(0.05, gate.release, args=(ticket,)).start()
+    gate.release(gate.acquire())
+    assert gate.stats()['active'] == 0 and gate.stats()['rejected'] == 0
+
+
+def test_async_gate_rejects_overflow_and_times_out():
+    async def scenario():
+        gate = AsyncAdmissionGate(max_concurrent=1, max_queue=1, max_wait=0.05)
+        ticket = await gate.acquire()
+        waiter = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected, match='queue full'):
+            await gate.acquire()
+        with pytest.raises(Rejected, match='timed out'):
+            await waiter
+        await gate.release(ticket)
+        return gate.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['rejected'] == 2 and stats['active'] == 0 and stats['waiting'] == 0
+
+
+def test_chat_is_refused_with_429_and_retry_after(client, monkeypatch):
+    monkeypatch.setattr(backend, 'chat_gate', AdmissionGate(max_concurrent=1, max_queue=0))
+    monkeypatch.setattr(backend, 'chat_buckets', TokenBuckets(rate=1, burst=10))
+    ticket = backend.chat_gate.acquire()
+    response = client.post('/gemini-chat', json={'message': 'Hi', 'user_id': 'u1'})
+    assert response.status_code == 429 and response.headers['Retry-After'] == '2'
+    assert response.get_json()['retry_after'] == 2
+    backend.chat_gate.release(ticket)
+
+    monkeypatch.setattr(backend, 'chat_buckets', TokenBuckets(rate=0.1, burst=1))
+    backend.chat_buckets.take('u1')
+    response = client.post('/gemini-chat', json={'message': 'Hi', 'user_id': 'u1'})
+    assert response.status_code == 429 and response.headers['Retry-After'] == '10'
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('quart')
+import asgi
+from admission import AsyncAdmissionGate
+from answer_cache import AnswerCache
+
+
+def test_conversations_in_use_are_not_evicted(monkeypatch):
+    async def load(user_id):
+        return []
+    monkeypatch.setattr(asgi, '_load_chat_history', load)
+    conversations = asgi.Conversations(max_users=1)
+    order = []
+
+    async def turn(user_id, name, release=None):
+        async with conversations.hold(user_id):
+            order.append(f'{name} start')
+            if release is not None:
+                await release.wait()
+            order.append(f'{name} end')
+
+    async def main():
+        release = asyncio.Event()
+        first = asyncio.create_task(turn('u1', 'first', release))
+        await asyncio.sleep(0)
+        await turn('u2', 'other')  # over max_users while u1 is mid-turn
+        second = asyncio.create_task(turn('u1', 'second'))
+        await asyncio.sleep(0.01)
+        assert order == ['first start', 'other start', 'other end']
+        release.set()
+        await asyncio.gather(first, second)
+        assert order[3:] == ['first end', 'second start', 'second end']
+        assert len(conversations) == 1
+
+    asyncio.run(main())
+
+
+class StreamingModel:
+    def __init__(self, pieces):
+        self.pieces = pieces
+
+    async def generate_content_async(self, contents, stream=False, request_options=None):
+        async def chunks():
+            for piece in self.pieces:
+                yield type('Chunk', (), {'text': piece})()
+        return chunks()
+
+
+def test_streamed_reply_framing_and_slot_release_on_disconnect(monkeypatch):
+    monkeypatch.setattr(asgi.model, '_client', StreamingModel(['Drink ', 'more ', 'water.']))
+    monkeypatch.setattr(asgi, 'answer_cache', AnswerCache())
+    gate = AsyncAdmissionGate(max_concurrent=1, max_queue=0)
+    monkeypatch.setattr(asgi, 'chat_gate', gate)
+
+    async def main():
+        events = [event async for event in asgi._stream_chat_reply(None, 'Tips?', await gate.acquire())]
+        assert events == ['data: {"delta": "Drink "}\n\n', 'data: {"delta": "more "}\n\n',
+                          'data: {"delta": "water."}\n\n', 'event: done\ndata: {"content": "Drink more water."}\n\n']
+        assert gate.active == 0
+
+        # The server closes the body when the client goes away mid-stream
+        stream = asgi._stream_chat_reply(None, 'Tips?', await gate.acquire())
+        assert (await stream.__anext__()).startswith('data: ')
+        assert gate.active == 1
+        await stream.aclose()
+        assert gate.active == 0
+
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from bulk import EntryError, insert_in_chunks, insert_in_chunks_async, parse_ndjson, prepare, summarize
+
+
+class FakeError(Exception):
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class Table:
+    # insert_many stand-in: rows with 'bad' set fail the insert with a check violation
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+
+    def insert_many(self, rows):
+        self.calls.append(len(rows))
+        if self.error is not None:
+            raise self.error
+        if any(row.get('bad') for row in rows):
+            raise FakeError('violates check constraint', code='23514')
+        return [dict(row, id=str(row['n'])) for row in rows]
+
+    async def insert_many_async(self, rows):
+        return self.insert_many(rows)
+
+
+ROWS = [{'n': n, 'bad': n == 3} for n in range(5)]
+
+
+def test_data_errors_are_pinned_on_their_rows():
+    table = Table()
+    outcomes = insert_in_chunks(table.insert_many, ROWS, chunk_size=2)
+    assert [outcome['id'] for outcome in outcomes if isinstance(outcome, dict)] == ['0', '1', '2', '4']
+    assert isinstance(outcomes[3], FakeError)
+    # The chunk holding the bad row is retried a row at a time
+    assert table.calls == [2, 2, 1, 1, 1]
+
+
+@pytest.mark.parametrize('error', [FakeError('timed out'), FakeError('bad gateway', code='502'),
+                                   FakeError('connection refused', code='08006')])
+def test_transient_errors_are_not_retried_row_by_row(error):
+    table = Table(error)
+    assert insert_in_chunks(table.insert_many, ROWS, chunk_size=2) == [error] * 5
+    assert table.calls == [2, 2, 1]
+
+
+def test_async_inserts_match_sync():
+    table = Table()
+    outcomes = asyncio.run(insert_in_chunks_async(table.insert_many_async, ROWS, chunk_size=2))
+    assert outcomes[:3] == insert_in_chunks(Table().insert_many, ROWS, chunk_size=2)[:3]
+    assert isinstance(outcomes[3], FakeError) and table.calls == [2, 2, 1, 1, 1]
+
+
+def test_entries_are_checked_and_summarized():
+    entries = parse_ndjson('{"date": "2024-03-01"}\nnot json\n\n{"user_id": "u2"}\n')
+    outcomes, rows, positions = prepare(entries, 'u1')
+    assert rows == [{'date': '2024-03-01', 'user_id': 'u1'}] and positions == [0]
+    assert isinstance(outcomes[1], EntryError) and str(outcomes[1]).startswith('line 2:')
+    outcomes[0] = rows[0]
+    body, status = summarize(outcomes, 'log')
+    assert status == 207 and body['inserted'] == 1 and body['failed'] == 2
+    assert [result['status'] for result in body['results']] == [201, 400, 400]
@@ -0,0 +1,122 @@
+import json
+
+import pytest
+
+import app as backend
+from admission import AdmissionGate
+from answer_cache import AnswerCache
+
+QUESTION = 'What are GLP-1 medications?'
+
+
+class FakeChat:
+    def __init__(self, history):
+        self.history = list(history or [])
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = 0
+
+    def start_chat(self, history=None):
+        return FakeChat(history)
+
+    def generate_content(self, contents, stream=False, request_options=None):
+        self.calls += 1
+        response = type('Response', (), {'text': f'reply {self.calls}'})()
+        return [response] if stream else response
+
+
+@pytest.fixture
+def client(client, monkeypatch):
+    monkeypatch.setattr(backend.model, '_client', FakeModel())
+    monkeypatch.setattr(backend, 'answer_cache', AnswerCache())
+    return client
+
+
+def test_cached_answers_are_only_used_for_a_first_turn(client):
+    backend.supabase.load('chat_history', [
+        {'user_id': 'cache-u2', 'message': 'I started a GLP-1 last week', 'is_user': True,
+         'timestamp': '2024-03-01T08:00:00'},
+        {'user_id': 'cache-u2', 'message': 'How is it going?', 'is_user': False, 'timestamp': '2024-03-01T08:00:01'},
+    ])
+    first = client.post('/gemini-chat', json={'message': QUESTION, 'user_id': 'cache-u1'}).get_json()
+    again = client.post('/gemini-chat', json={'message': QUESTION, 'user_id': 'cache-u3'}).get_json()
+    assert first == again == {'content': 'reply 1'}
+
+    follow_up = client.post('/gemini-chat', json={'message': QUESTION, 'user_id': 'cache-u2'}).get_json()
+    assert follow_up == {'content': 'reply 2'}
+    streamed = client.post('/gemini-chat?stream=1', json={'message': QUESTION, 'user_id': 'cache-u1'}).get_data(True)
+    assert 'reply 1' not in streamed and backend.model.calls == 3
+
+
+def test_history_reads_oldest_first_unless_desc_is_asked_for(client):
+    backend.supabase.load('chat_history', [
+        {'id': f'h{i}', 'user_id': 'hist-u1', 'message': f'message {i}', 'is_user': i % 2 == 0,
+         'timestamp': f'2024-03-01T08:00:0{i}'} for i in range(3)])
+    for query, expected in (('', ['h0', 'h1', 'h2']), ('&order=desc', ['h2', 'h1', 'h0'])):
+        body = client.get(f'/gemini-chat/history?user_id=hist-u1{query}').get_json()
+        assert [row['id'] for row in body['history']] == expected
+
+
+class StreamingModel(FakeModel):
+    # Streams the reply in pieces, or fails with error before the first one
+    def __init__(self, pieces, error=None):
+        super().__init__()
+        self.pieces = pieces
+        self.error = error
+
+    def generate_content(self, contents, stream=False, request_options=None):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return iter([type('Chunk', (), {'text': piece})() for piece in self.pieces])
+
+
+def sse_events(body):
+    # (event, data) pairs from a text/event-stream body
+    events = []
+    for block in body.split('\n\n'):
+        if block:
+            fields = dict(line.split(': ', 1) for line in block.split('\n'))
+            events.append((fields.get('event', 'message'), json.loads(fields['data'])))
+    return events
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    gate = AdmissionGate(max_concurrent=1, max_queue=0)
+    monkeypatch.setattr(backend, 'chat_gate', gate)
+    return gate
+
+
+def test_streamed_replies_are_framed_as_deltas_then_done(client, gate, monkeypatch):
+    monkeypatch.setattr(backend.model, '_client', StreamingModel(['Drink ', 'more ', 'water.']))
+    response = client.post('/gemini-chat', json={'message': 'Tips?', 'user_id': 'sse-u1'},
+                           headers={'Accept': 'text/event-stream'}, buffered=True)
+    assert response.mimetype == 'text/event-stream'
+    assert sse_events(response.get_data(True)) == [
+        ('message', {'delta': 'Drink '}), ('message', {'delta': 'more '}), ('message', {'delta': 'water.'}),
+        ('done', {'content': 'Drink more water.'})]
+    stored = backend.supabase.table('chat_history').select('*').eq('user_id', 'sse-u1').execute().data
+    assert [row['message'] for row in stored] == ['Tips?', 'Drink more water.']
+    assert gate.stats()['active'] == 0
+
+
+def test_a_failed_stream_ends_with_an_error_event(client, gate, monkeypatch):
+    monkeypatch.setattr(backend.model, '_client', StreamingModel([], error=ValueError('prompt blocked')))
+    body = client.post('/gemini-chat?stream=1', json={'message': 'Tips?'}, buffered=True).get_data(True)
+    assert sse_events(body) == [('error', {'error': 'prompt blocked'})]
+    assert gate.stats()['active'] == 0
+
+
+def test_a_client_leaving_mid_stream_frees_its_slot(client, gate, monkeypatch):
+    monkeypatch.setattr(backend.model, '_client', StreamingModel(['Drink ', 'more ', 'water.']))
+    response = client.post('/gemini-chat?stream=1', json={'message': 'Tips?', 'user_id': 'sse-u2'}, buffered=False)
+    assert next(iter(response.response)).startswith(b'data: ')
+    assert gate.stats()['active'] == 1
+    response.close()
+    assert gate.stats()['active'] == 0
+    # Nothing was held over: the same user can chat again straight away
+    again = client.post('/gemini-chat?stream=1', json={'message': 'And?', 'user_id': 'sse-u2'}).get_data(True)
+    assert sse_events(again)[-1][0] == 'done'
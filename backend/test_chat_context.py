@@ -0,0 +1,66 @@
+from chat_context import SUMMARY_PREFIX, ChatContext, Conversation
+
+
+class InlineExecutor:
+    # Runs summarize calls straight away so folds land before extend() returns
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+def turns(count, user_chars=40, model_chars=40):
+    return [{'role': 'user' if i % 2 == 0 else 'model', 'parts': [f'{i:02d}'.ljust(user_chars if i % 2 == 0
+                                                                                else model_chars, '.')]}
+            for i in range(count)]
+
+
+def texts(history):
+    return [entry['parts'][0][:2] for entry in history]
+
+
+def roles(history):
+    return [entry['role'] for entry in history]
+
+
+def test_history_under_budget_is_sent_whole():
+    prompts = []
+    context = ChatContext(prompts.append, InlineExecutor(), budget=100, summary_tokens=20)
+    conversation = Conversation()
+    context.extend(conversation, turns(8))
+    assert context.history(conversation) == turns(8) and prompts == []
+
+
+def test_oldest_turns_are_folded_into_the_summary():
+    prompts = []
+    context = ChatContext(lambda prompt: prompts.append(prompt) or 'Wants to walk daily.', InlineExecutor(),
+                          budget=100, summary_tokens=20)
+    conversation = Conversation()
+    context.extend(conversation, turns(10))
+    history = context.history(conversation)
+    assert history[0]['parts'][0] == f'{SUMMARY_PREFIX}\nWants to walk daily.'
+    assert texts(history[2:]) == ['06', '07', '08', '09']
+    assert len(prompts) == 1 and 'User: 00' in prompts[0] and 'Coach: 05' in prompts[0] and '06' not in prompts[0]
+    assert context.stats()['folds'] == 1
+
+
+def test_turns_stay_paired_when_user_and_model_turns_differ_in_size():
+    context = ChatContext(lambda prompt: 'Summary.', InlineExecutor(), budget=100, summary_tokens=20)
+    conversation = Conversation()
+    for _ in range(6):
+        context.extend(conversation, turns(2, user_chars=12, model_chars=60))
+        history = context.history(conversation)
+        body = history[2:] if conversation.summary else history
+        assert body and roles(body) == ['user', 'model'] * (len(body) // 2)
+    assert context.stats()['folds'] >= 1
+
+
+def test_a_failed_fold_trims_from_a_user_turn_within_budget():
+    def fail(prompt):
+        raise RuntimeError('model unavailable')
+
+    context = ChatContext(fail, InlineExecutor(), budget=100, summary_tokens=20)
+    conversation = Conversation()
+    context.extend(conversation, turns(12))
+    history = context.history(conversation)
+    assert not conversation.summary and context.stats()['fold_errors'] == 1
+    assert history[0]['role'] == 'user' and sum(len(entry['parts'][0]) for entry in history) <= 400
+    assert texts(history) == [f'{i:02d}' for i in range(2, 12)]
@@ -0,0 +1,51 @@
+import threading
+import time
+
+from chat_sessions import ChatSessionPool, history_from_rows
+
+
+class FakeChat:
+    def __init__(self, history):
+        self.history = list(history or [])
+
+
+class FakeModel:
+    def start_chat(self, history=None):
+        return FakeChat(history)
+
+
+def turn(pool, user_id, name, order, release=None):
+    with pool.session(user_id) as chat:
+        order.append(f'{name} start')
+        if release is not None:
+            release.wait(1)
+        chat.history = [*chat.history, {'role': 'user', 'parts': [name]}]
+        order.append(f'{name} end')
+
+
+def test_sessions_in_use_are_not_evicted():
+    pool = ChatSessionPool(FakeModel(), max_sessions=1)
+    order, release = [], threading.Event()
+    first = threading.Thread(target=turn, args=(pool, 'u1', 'first', order, release))
+    first.start()
+    time.sleep(0.02)
+    for user_id in ('u2', 'u3'):
+        turn(pool, user_id, user_id, order)  # past max_sessions while u1 is mid-turn
+    second = threading.Thread(target=turn, args=(pool, 'u1', 'second', order))
+    second.start()
+    time.sleep(0.02)
+    assert order == ['first start', 'u2 start', 'u2 end', 'u3 start', 'u3 end']
+    release.set()
+    first.join(1)
+    second.join(1)
+    assert order[5:] == ['first end', 'second start', 'second end']
+    # Both of u1's turns went into the one session, and the idle ones were evicted
+    with pool.session('u1') as chat:
+        assert [content['parts'][0] for content in chat.history] == ['first', 'second']
+    assert len(pool) == 1 and pool.stats()['evictions'] == 2
+
+
+def test_history_from_rows_starts_with_a_user_turn():
+    rows = [{'message': 'hello', 'is_user': False}, {'message': 'hi', 'is_user': True}, {'message': ''},
+            {'message': 'welcome', 'is_user': False}]
+    assert history_from_rows(rows) == [{'role': 'user', 'parts': ['hi']}, {'role': 'model', 'parts': ['welcome']}]
@@ -0,0 +1,23 @@
+from datetime import date, timedelta
+
+import app as backend
+
+USER = '6a1f3c1e-2b9d-4c6e-9a57-0d2b8e1f4c3a'
+
+
+def test_days_is_bounded(client):
+    for days, error in (('10000000', 'days must be at most 365'), ('soon', 'days must be an integer')):
+        response = client.get(f'/dashboard?user_id={USER}&days={days}')
+        assert response.status_code == 400 and response.get_json() == {'error': error}
+    response = client.get(f'/dashboard?user_id={USER}&days=365&sections=user')
+    assert response.status_code == 200
+    assert response.get_json()['since'] == (date.today() - timedelta(days=364)).isoformat()
+
+
+def test_recent_rows_keep_the_newest(client, monkeypatch):
+    monkeypatch.setattr(backend, 'DASHBOARD_MAX_ROWS', 3)
+    today = date.today()
+    backend.supabase.load('step_logs', [{'id': f's{i}', 'user_id': USER, 'count': i,
+                                         'date': (today - timedelta(days=i)).isoformat()} for i in range(6)])
+    rows = client.get(f'/dashboard?user_id={USER}&sections=step_logs').get_json()['dashboard']['step_logs']
+    assert [row['id'] for row in rows] == ['s2', 's1', 's0']
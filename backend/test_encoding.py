@@ -0,0 +1,79 @@
+import gzip
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+from flask import Flask, Response
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import parse_accept_header
+
+import app as backend
+import encoding
+from encoding import FastJSONProvider, compress_response
+from pagination import select_columns
+
+BODY = json.dumps([{'id': n, 'title': 'Walk 10,000 steps'} for n in range(100)]).encode()
+
+
+def accept(header):
+    return parse_accept_header(header)
+
+
+def json_response(body, etag='abc'):
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+
+def test_orjson_bodies_match_the_default_provider():
+    pytest.importorskip('orjson')
+    app = Flask(__name__)
+    payload = {'logged': date(2024, 3, 1), 'at': datetime(2024, 3, 1, 8, 30, tzinfo=timezone.utc),
+               'dose': Decimal('2.50'), 'rows': [{'b': 1, 'a': None}], 'done': True}
+    with app.app_context():
+        fast = FastJSONProvider(app).response(payload).get_data()
+        default = DefaultJSONProvider(app).response(payload).get_data()
+    assert fast == default
+    assert json.loads(fast)['logged'] == 'Fri, 01 Mar 2024 00:00:00 GMT' and json.loads(fast)['dose'] == '2.50'
+
+
+def test_gzip_is_used_unless_brotli_is_available_and_accepted(monkeypatch):
+    response = compress_response(json_response(BODY), accept('gzip, deflate'))
+    assert response.headers['Content-Encoding'] == 'gzip' and gzip.decompress(response.get_data()) == BODY
+    assert response.get_etag() == ('abc-gzip', False) and 'Accept-Encoding' in response.vary
+
+    monkeypatch.setattr(encoding, 'brotli', None)
+    assert compress_response(json_response(BODY), accept('br, gzip')).headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Encoding' not in compress_response(json_response(BODY), accept('br')).headers
+
+
+def test_brotli_is_preferred_when_the_client_accepts_it():
+    brotli = pytest.importorskip('brotli')
+    response = compress_response(json_response(BODY), accept('gzip;q=0.8, br'))
+    assert response.headers['Content-Encoding'] == 'br' and brotli.decompress(response.get_data()) == BODY
+    assert compress_response(json_response(BODY), accept('gzip, br;q=0.5')).headers['Content-Encoding'] == 'gzip'
+
+
+def test_bodies_under_the_minimum_size_are_sent_as_is():
+    response = compress_response(json_response(BODY), accept('gzip'), min_size=len(BODY) + 1)
+    assert 'Content-Encoding' not in response.headers and response.get_data() == BODY
+    assert 'Accept-Encoding' in response.vary and response.get_etag() == ('abc', False)
+    assert compress_response(json_response(BODY), accept('gzip'), min_size=len(BODY)).headers['Content-Encoding'] == 'gzip'
+
+
+def test_fields_must_name_columns_of_the_table():
+    known = {'id', 'created', 'title', 'user_id'}
+    assert select_columns({'fields': 'title, title'}, 'id', 'created', known=known) == 'id,created,title'
+    assert select_columns({'fields': 'title'}, known=None) == 'title'
+    with pytest.raises(ValueError, match='unknown field: calories'):
+        select_columns({'fields': 'title,calories'}, 'id', known=known)
+
+
+def test_list_routes_reject_unknown_fields(client):
+    backend.supabase.load('goals', [{'id': 'g1', 'user_id': 'u1', 'title': 'Walk', 'description': 'Daily',
+                                     'created': '2024-03-01T08:00:00'}])
+    response = client.get('/goals?user_id=u1&fields=title,secret')
+    assert response.status_code == 400 and response.get_json() == {'error': 'unknown field: secret'}
+    goals = client.get('/goals?user_id=u1&fields=title').get_json()['goals']
+    assert goals == [{'id': 'g1', 'created': '2024-03-01T08:00:00', 'title': 'Walk'}]
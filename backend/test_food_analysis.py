@@ -0,0 +1,76 @@
+import base64
+import io
+
+import pytest
+
+import food_analysis
+from food_analysis import FoodAnalysisCache, decode_image, parse_analysis, prepare_image
+
+SALAD = {'name': 'Salad', 'description': '', 'calories': 320, 'protein': 12, 'carbs': 20, 'fat': 0,
+         'fruitsVeggies': 2, 'confidence': 100}
+
+
+def test_parse_analysis_cleans_up_the_reply():
+    reply = 'Here you go:\n```json\n{"name": "Salad", "calories": 319.5, "protein": "12", "carbs": 20.4, ' \
+            '"fat": null, "fruitsVeggies": 2, "confidence": 140, "extra": true}\n```'
+    assert parse_analysis(reply) == SALAD
+    for reply in ('no json here', '{"name": "Salad"}', '{"name": "", "calories": 1}', '{"name": "x", "calories": "1"}'):
+        with pytest.raises(ValueError):
+            parse_analysis(reply)
+
+
+def test_decode_image_accepts_data_urls():
+    data = b'\xff\xd8\xff\xe0 jpeg bytes'
+    encoded = base64.b64encode(data).decode()
+    assert decode_image(encoded) == data
+    assert decode_image('data:image/jpeg;base64,' + encoded) == data
+    for bad in ('not base64!', '', None):
+        with pytest.raises(ValueError):
+            decode_image(bad)
+
+
+def test_near_duplicate_hashes_share_a_result_per_user():
+    cache = FoodAnalysisCache(max_distance=4)
+    key = 0x0F0F_F0F0_1234_ABCD
+    cache.put('u1', key, SALAD)
+    assert cache.get('u1', key ^ 0b1011 << 20) == SALAD  # 3 bits differ
+    assert cache.get('u1', key ^ 0b11111) is None  # 5 bits differ
+    assert cache.get('u2', key) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_cache_is_bounded_and_expires():
+    cache = FoodAnalysisCache(max_entries=2, ttl=60)
+    for key in (0xFFFF, 0xFFFF << 20, 0xFFFF << 40):
+        cache.put('u', key, SALAD)
+    assert cache.get('u', 0xFFFF) is None
+    assert cache.stats()['entries'] == 2 and cache.stats()['evictions'] == 1
+    expired = FoodAnalysisCache(ttl=0)
+    expired.put('u', 'digest', SALAD)
+    assert expired.get('u', 'digest') is None
+
+
+def test_without_pillow_images_pass_through(monkeypatch):
+    monkeypatch.setattr(food_analysis, 'Image', None)
+    png = b'\x89PNG\r\n\x1a\n' + b'\0' * 20
+    image = prepare_image(png)
+    assert image.data == png and image.mime_type == 'image/png'
+    assert image.key == prepare_image(png).key
+
+
+def test_photos_are_downscaled_and_hash_alike():
+    Image = pytest.importorskip('PIL.Image')
+    photo = Image.new('RGB', (4000, 3000), (200, 220, 180))
+    photo.paste((120, 60, 30), (500, 500, 2500, 2000))
+    original = io.BytesIO()
+    photo.save(original, 'JPEG', quality=95)
+    resent = io.BytesIO()
+    photo.resize((1200, 900)).save(resent, 'JPEG', quality=60)
+
+    image = prepare_image(original.getvalue())
+    assert image.mime_type == 'image/jpeg'
+    assert Image.open(io.BytesIO(image.data)).size == (768, 576)
+    assert len(image.data) < len(original.getvalue())
+    assert bin(image.key ^ prepare_image(resent.getvalue()).key).count('1') <= 4
+    with pytest.raises(ValueError):
+        prepare_image(b'not an image')
@@ -0,0 +1,61 @@
+import json
+from datetime import date, timedelta
+
+from gamification import apply, apply_rows, new_state, rebuild_state, streak_values
+
+
+def day(offset):
+    return (date(2024, 3, 1) + timedelta(days=offset)).isoformat()
+
+
+def test_streaks_extend_break_and_take_adjacent_backfill():
+    state = new_state()
+    for offset in (1, 2, 3):
+        apply(state, 'weight_logs', {'date': day(offset), 'weight': 90})
+    assert state['streaks']['weight']['current'] == 3
+    # Same day again changes nothing; the day before the run extends it
+    assert apply(state, 'weight_logs', {'date': day(2), 'weight': 90})[0] == []
+    assert apply(state, 'weight_logs', {'date': day(0), 'weight': 90})[0] == ['weight', 'any']
+    assert state['streaks']['weight']['current'] == 4
+    apply(state, 'weight_logs', {'date': day(10), 'weight': 90})
+    assert state['streaks']['weight'] == {'current': 1, 'best': 4, 'start': day(10), 'last': day(10)}
+    assert streak_values(state) == {'weight': 1, 'steps': 0, 'water': 0, 'shots': 0}
+
+
+def test_only_rules_for_the_written_table_unlock():
+    state = new_state(start_weight=200, unlocked=['first-shot'])
+    assert apply(state, 'water_logs', {'date': day(0), 'amount': 250})[1] == []
+    assert apply(state, 'shots', {'date': day(0)})[1] == []
+    assert apply(state, 'weight_logs', {'date': day(0), 'weight': 194})[1] == ['first-weight-log', 'progress-milestone']
+    assert apply(state, 'weight_logs', {'date': day(1), 'weight': 179})[1] == ['major-progress']
+
+
+def test_steps_add_up_within_a_day_and_protein_days_are_distinct():
+    state = new_state()
+    assert apply(state, 'step_logs', {'date': day(0), 'count': 6000})[1] == []
+    assert apply(state, 'step_logs', {'date': day(0), 'count': 4000})[1] == ['steps-10k']
+    unlocked = []
+    for offset in (0, 0, 1, 2, 3):
+        unlocked += apply(state, 'daily_logs', {'date': day(offset), 'proteinGrams': 85})[1]
+    assert 'protein-goal-5' not in unlocked
+    assert apply(state, 'daily_logs', {'date': day(4), 'protein_grams': 81})[1] == ['protein-goal-5']
+
+
+def test_state_stays_small_however_much_is_logged():
+    state = new_state()
+    apply_rows(state, 'step_logs', [{'date': day(offset), 'count': 3000} for offset in range(2000)])
+    assert state['counts'] == {'step_logs': 2000}
+    assert state['streaks']['steps']['current'] == 2000
+    assert len(json.dumps(state)) < 1000
+
+
+def test_rebuild_matches_writes_in_date_order():
+    rows = {
+        'weight_logs': [{'date': day(offset), 'weight': 100 - offset} for offset in (5, 1, 3, 2, 4)],
+        'water_logs': [{'date': day(offset), 'amount': 250} for offset in (0, 6)],
+        'daily_logs': [{'date': day(7)}],
+    }
+    rebuilt, unlocked = rebuild_state(rows)
+    assert rebuilt['streaks']['any'] == {'current': 8, 'best': 8, 'start': day(0), 'last': day(7)}
+    assert rebuilt['weight']['start'] == 99 and rebuilt['weight']['latest'] == 95
+    assert set(unlocked) == {'first-weight-log', 'dedicated-tracker'}
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from idempotency import AsyncIdempotencyStore, IdempotencyStore, InProgress, KeyReused
+
+
+def test_completed_response_is_replayed():
+    store = IdempotencyStore()
+    assert store.begin('k', 'a') is None
+    store.complete('k', 201, [('Content-Type', 'application/json')], b'{"id": 1}')
+    assert store.begin('k', 'a') == (201, [('Content-Type', 'application/json')], b'{"id": 1}')
+    with pytest.raises(KeyReused):
+        store.begin('k', 'b')
+    assert store.stats()['replayed'] == 1 and store.stats()['conflicts'] == 1
+
+
+def test_concurrent_duplicate_waits_for_the_first():
+    store = IdempotencyStore()
+    assert store.begin('k', 'a') is None
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(store.begin('k', 'a')))
+    waiter.start()
+    time.sleep(0.05)
+    assert not results
+    store.complete('k', 200, [], b'done')
+    waiter.join(1)
+    assert results == [(200, [], b'done')]
+
+
+def test_released_key_is_taken_over_by_a_waiter():
+    store = IdempotencyStore()
+    assert store.begin('k', 'a') is None
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(store.begin('k', 'a')))
+    waiter.start()
+    time.sleep(0.05)
+    store.release('k')
+    waiter.join(1)
+    # The waiter now holds the key and runs the request itself
+    assert results == [None]
+    assert store.stats()['in_flight'] == 1
+
+
+def test_wait_is_bounded():
+    store = IdempotencyStore(max_wait=0.05)
+    assert store.begin('k', 'a') is None
+    with pytest.raises(InProgress):
+        store.begin('k', 'a')
+
+
+def test_expiry_and_size_bound_keep_in_flight_keys():
+    store = IdempotencyStore(max_entries=2, ttl=0.05)
+    assert store.begin('running', 'a') is None
+    for key in ('one', 'two', 'three'):
+        assert store.begin(key, 'a') is None
+        store.complete(key, 200, [], key.encode())
+    assert store.stats()['keys'] == 2
+    assert store.begin('one', 'a') is None
+    time.sleep(0.06)
+    assert store.begin('three', 'a') is None
+    store.complete('running', 200, [], b'late')
+    assert store.begin('running', 'a') == (200, [], b'late')
+
+
+def test_a_request_left_running_does_not_hold_up_expiry():
+    store = IdempotencyStore(ttl=0.05)
+    assert store.begin('abandoned', 'a') is None
+    for key in ('one', 'two'):
+        assert store.begin(key, 'a') is None
+        store.complete(key, 200, [], b'')
+    time.sleep(0.06)
+    assert store.begin('three', 'a') is None
+    assert store.stats()['keys'] == 2 and store.stats()['in_flight'] == 2
+
+
+def test_async_duplicates_share_one_response():
+    async def main():
+        store = AsyncIdempotencyStore()
+        assert await store.begin('k', 'a') is None
+        waiters = [asyncio.ensure_future(store.begin('k', 'a')) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        store.complete('k', 200, [], b'ok')
+        return await asyncio.gather(*waiters)
+
+    assert asyncio.run(main()) == [(200, [], b'ok')] * 3
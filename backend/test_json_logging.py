@@ -0,0 +1,44 @@
+import io
+import json
+import logging
+
+from json_logging import DebugSampler, JsonFormatter, QueueingHandler
+
+
+def record(msg, *args, level=logging.INFO, **extra):
+    entry = logging.LogRecord('app', level, __file__, 1, msg, args, None)
+    entry.__dict__.update(extra)
+    return entry
+
+
+def lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_formatter_writes_one_json_object_with_extras_truncated():
+    line = json.loads(JsonFormatter(max_chars=10).format(record('chat from %s', 'someone with a long name',
+                                                               user_id='u1', reply='x' * 25)))
+    assert line['level'] == 'info' and line['logger'] == 'app' and line['ts'].endswith('Z')
+    assert line['msg'] == 'chat from ... (+24 chars)'
+    assert line['reply'] == 'xxxxxxxxxx... (+15 chars)' and line['user_id'] == 'u1'
+
+
+def test_full_queue_drops_and_counts_records():
+    stream = io.StringIO()
+    handler = QueueingHandler(stream, max_queue=2, interval=60)
+    handler.setFormatter(JsonFormatter())
+    for index in range(5):
+        handler.handle(record('line %d', index))
+    assert handler.dropped == 3 and stream.getvalue() == ''
+    # The writer formats what was queued, in order, once it runs
+    handler.close()
+    assert [line['msg'] for line in lines(stream)] == ['line 0', 'line 1']
+
+
+def test_debug_records_are_sampled():
+    for rate, kept in ((0.0, 0), (1.0, 100)):
+        sampler = DebugSampler(rate)
+        assert sum(sampler.filter(record('debug', level=logging.DEBUG)) for _ in range(100)) == kept
+        assert sampler.filter(record('info')) and sampler.filter(record('error', level=logging.ERROR))
+    sampled = sum(DebugSampler(0.5).filter(record('debug', level=logging.DEBUG)) for _ in range(2000))
+    assert 800 < sampled < 1200
@@ -0,0 +1,113 @@
+from outbox import WriteOutbox
+
+
+class FakeError(Exception):
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.rows = None
+
+    def upsert(self, rows, **kwargs):
+        self.rows = rows
+        return self
+
+    def execute(self):
+        if self.client.failures:
+            raise self.client.failures.pop(0)
+        stored = self.client.tables.setdefault(self.table, {})
+        for row in self.rows:
+            stored.setdefault(row['id'], row)
+        self.client.batches.append((self.table, len(self.rows)))
+        return self
+
+
+class FakeClient:
+    # Local stand-in for the Supabase client: keeps rows in memory keyed by id
+    def __init__(self, failures=None):
+        self.tables = {}
+        self.batches = []
+        self.failures = list(failures or [])
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+def test_rows_are_batched_per_table_in_order(tmp_path):
+    client = FakeClient()
+    outbox = WriteOutbox(client, path=str(tmp_path / 'outbox.sqlite3'))
+    first = outbox.enqueue('weight_logs', {'user_id': 'u1', 'weight': 80})
+    outbox.enqueue('weight_logs', {'user_id': 'u1', 'weight': 79})
+    outbox.enqueue('meals', {'user_id': 'u1', 'name': 'Salad'})
+    outbox.enqueue('weight_logs', {'user_id': 'u1', 'weight': 78})
+
+    assert first['id']
+    assert outbox.flush() == 0
+    assert client.batches == [('weight_logs', 2), ('meals', 1), ('weight_logs', 1)]
+    assert first['id'] in client.tables['weight_logs']
+
+
+def test_transient_failure_is_retried_without_losing_rows(tmp_path):
+    client = FakeClient(failures=[FakeError('connection reset')] * 2)
+    outbox = WriteOutbox(client, path=str(tmp_path / 'outbox.sqlite3'), max_attempts=3, max_backoff=0)
+    outbox.enqueue('step_logs', {'user_id': 'u1', 'count': 1000})
+
+    assert outbox.flush() == 0
+    assert len(client.tables['step_logs']) == 1
+    assert outbox.stats()['failures'] == 2
+
+
+def test_rejected_row_is_moved_aside(tmp_path):
+    bad = FakeError('invalid input syntax', code='22P02')
+    client = FakeClient(failures=[bad, bad])
+    outbox = WriteOutbox(client, path=str(tmp_path / 'outbox.sqlite3'), max_attempts=1, max_backoff=0)
+    outbox.enqueue('water_logs', {'user_id': 'u1', 'amount': 'lots'})
+    outbox.enqueue('water_logs', {'user_id': 'u1', 'amount': 250})
+
+    # The batch fails once, then the first row is rejected on its own and the second goes through
+    outbox.flush()
+    assert outbox.stats()['dead'] == 1
+    assert outbox.pending() == 0
+
+
+def test_journal_survives_restart(tmp_path):
+    path = str(tmp_path / 'outbox.sqlite3')
+    WriteOutbox(FakeClient(), path=path).enqueue('meals', {'user_id': 'u1', 'name': 'Soup'})
+
+    client = FakeClient()
+    outbox = WriteOutbox(client, path=path)
+    assert outbox.pending() == 1
+    outbox.start().close(timeout=5)
+    assert len(client.tables['meals']) == 1 and outbox.pending() == 0
+
+
+def test_full_batch_wakes_the_flusher_without_counting_the_journal(tmp_path):
+    outbox = WriteOutbox(FakeClient(), path=str(tmp_path / 'outbox.sqlite3'), batch_size=3)
+    outbox._db = CountingConnection(outbox._db)
+    for n in range(2):
+        outbox.enqueue('meals', {'user_id': 'u1', 'name': f'Meal {n}'})
+    assert not outbox._wakeup.is_set()
+    outbox.enqueue('meals', {'user_id': 'u1', 'name': 'Meal 2'})
+    assert outbox._wakeup.is_set() and outbox.pending() == 3
+    assert outbox.flush() == 0
+    assert not any('count(' in sql for sql in outbox._db.statements)
+
+
+class CountingConnection:
+    # Records the SQL run against the journal
+    def __init__(self, db):
+        self.db = db
+        self.statements = []
+
+    def execute(self, sql, *args):
+        self.statements.append(sql)
+        return self.db.execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        self.statements.append(sql)
+        return self.db.executemany(sql, *args)
@@ -0,0 +1,58 @@
+from datetime import date, timedelta
+
+import pytest
+
+from bench.fakes import FakeSupabase
+from pagination import date_range, date_range_args, decode_cursor, fetch_page, order_arg
+
+
+@pytest.fixture
+def db():
+    client = FakeSupabase()
+    first = date(2024, 3, 1)
+    client.load('water_logs', [{'id': f'w{i:02d}', 'user_id': 'u1' if i % 3 else 'u2', 'amount': i,
+                                'date': (first + timedelta(days=i // 2)).isoformat()} for i in range(20)])
+    return client
+
+
+def test_range_and_order_args():
+    assert date_range_args({}) == (None, None)
+    assert date_range_args({'from': '2024-03-01', 'to': '2024-03-01'}) == ('2024-03-01', '2024-03-01')
+    assert order_arg({}) is False and order_arg({'order': 'desc'}) is True
+    for args, message in (({'from': '03/01/2024'}, 'YYYY-MM-DD'), ({'to': '2024-02-30'}, 'YYYY-MM-DD'),
+                          ({'from': '2024-03-02', 'to': '2024-03-01'}, 'after')):
+        with pytest.raises(ValueError, match=message):
+            date_range_args(args)
+    with pytest.raises(ValueError, match='asc or desc'):
+        order_arg({'order': 'newest'})
+
+
+def test_pages_stay_inside_the_range_in_either_order(db):
+    expected = [row for row in db.table('water_logs').select('*').eq('user_id', 'u1').execute().data
+                if '2024-03-03' <= row['date'] <= '2024-03-07']
+    expected.sort(key=lambda row: (row['date'], row['id']))
+    for desc in (False, True):
+        seen, after = [], None
+        while True:
+            query = date_range(db.table('water_logs').select('*').eq('user_id', 'u1'), 'date', '2024-03-03',
+                               '2024-03-07')
+            rows, cursor = fetch_page(query, 2, after, 'date', desc)
+            seen += rows
+            if cursor is None:
+                break
+            after = decode_cursor(cursor, 'date')
+        assert seen == (expected[::-1] if desc else expected)
+
+
+def test_null_sort_values_page_through_in_either_order(db):
+    db.load('goals', [{'id': f'g{i}', 'user_id': 'u1', 'created': f'2024-03-0{i}T08:00:00+00:00'} for i in (1, 2)])
+    db.load('goals', [{'id': f'g{i}', 'user_id': 'u1', 'created': None} for i in (3, 4, 5)])
+    for desc, expected in ((False, ['g1', 'g2', 'g3', 'g4', 'g5']), (True, ['g5', 'g4', 'g3', 'g2', 'g1'])):
+        seen, after = [], None
+        while True:
+            rows, cursor = fetch_page(db.table('goals').select('*').eq('user_id', 'u1'), 2, after, 'created', desc)
+            seen += [row['id'] for row in rows]
+            if cursor is None:
+                break
+            after = decode_cursor(cursor, 'created')
+        assert seen == expected
@@ -0,0 +1,145 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from resilience import AsyncCallGuard, CallGuard, CircuitBreaker, CircuitOpen
+
+
+class FakeError(Exception):
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    # Local stand-in for a Gemini model: each call takes the next scripted delay and outcome
+    def __init__(self, script=None, latency=0.0):
+        self.script = list(script or [])
+        self.latency = latency
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        return self.script.pop(0) if self.script else (self.latency, None)
+
+    def generate_content(self, contents, stream=False, request_options=None):
+        delay, error = self._next()
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        if stream:
+            return [FakeResponse(word) for word in contents.split()]
+        return FakeResponse(f'reply {self.calls}')
+
+    async def generate_content_async(self, contents, request_options=None):
+        delay, error = self._next()
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return FakeResponse(f'reply {self.calls}')
+
+
+def guard(breaker=None, **options):
+    options.setdefault('backoff', 0.001)
+    return CallGuard(breaker or CircuitBreaker(), ThreadPoolExecutor(max_workers=4), **options)
+
+
+def test_transient_errors_are_retried():
+    model = FakeModel([(0, FakeError('unavailable', 503)), (0, FakeError('unavailable', 503))])
+    calls = guard(retries=2)
+
+    response = calls.call(lambda timeout: model.generate_content('hi', request_options={'timeout': timeout}))
+
+    assert response.text == 'reply 3'
+    assert calls.stats()['retries'] == 2
+    assert calls.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_bad_requests_are_not_retried_and_do_not_trip_the_breaker():
+    model = FakeModel([(0, FakeError('invalid argument', 400))])
+    calls = guard(CircuitBreaker(failure_threshold=1))
+
+    with pytest.raises(FakeError):
+        calls.call(lambda timeout: model.generate_content('hi'))
+
+    assert model.calls == 1
+    assert calls.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_slow_calls_time_out():
+    model = FakeModel(latency=0.5)
+    calls = guard(timeout=0.05, retries=0)
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        calls.call(lambda timeout: model.generate_content('hi'))
+
+    assert time.monotonic() - started < 0.3
+    assert calls.stats()['timeouts'] == 1
+
+
+def test_breaker_opens_then_lets_a_trial_call_through():
+    model = FakeModel([(0, FakeError('unavailable', 503))] * 2)
+    calls = guard(CircuitBreaker(failure_threshold=2, reset_timeout=0.1), retries=0)
+
+    for _ in range(2):
+        with pytest.raises(FakeError):
+            calls.call(lambda timeout: model.generate_content('hi'))
+    with pytest.raises(CircuitOpen):
+        calls.call(lambda timeout: model.generate_content('hi'))
+    assert model.calls == 2
+    assert calls.breaker.stats()['state'] == 'open'
+
+    time.sleep(0.15)
+    assert calls.call(lambda timeout: model.generate_content('hi')).text == 'reply 3'
+    assert calls.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_slow_call_is_hedged_and_the_faster_reply_wins():
+    model = FakeModel(latency=0.01)
+    calls = guard(hedge_percentile=90, hedge_min_samples=5)
+    for _ in range(5):
+        calls.call(lambda timeout: model.generate_content('hi'))
+
+    model.script = [(1.0, None), (0.01, None)]
+    started = time.monotonic()
+    response = calls.call(lambda timeout: model.generate_content('hi'))
+
+    assert time.monotonic() - started < 0.5
+    assert response.text == 'reply 7'
+    assert calls.stats()['hedged'] == 1
+    assert calls.stats()['hedge_wins'] == 1
+
+
+def test_stream_retries_before_the_first_chunk():
+    model = FakeModel([(0, FakeError('deadline exceeded', 504))])
+    calls = guard()
+
+    words = [chunk.text for chunk in calls.stream(lambda timeout: model.generate_content('a b c', stream=True))]
+
+    assert words == ['a', 'b', 'c']
+    assert calls.stats()['retries'] == 1
+
+
+def test_async_guard_hedges_and_cancels_the_loser():
+    async def run():
+        model = FakeModel(latency=0.01)
+        calls = AsyncCallGuard(CircuitBreaker(), hedge_percentile=90, hedge_min_samples=5)
+        for _ in range(5):
+            await calls.call(lambda timeout: model.generate_content_async('hi'))
+        model.script = [(1.0, None), (0.01, None)]
+        started = time.monotonic()
+        response = await calls.call(lambda timeout: model.generate_content_async('hi'))
+        return time.monotonic() - started, response, calls.stats()
+
+    elapsed, response, stats = asyncio.run(run())
+    assert elapsed < 0.5
+    assert response.text == 'reply 7'
+    assert stats['hedge_wins'] == 1
@@ -0,0 +1,46 @@
+import pytest
+
+import app as backend
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def client(client, monkeypatch):
+    monkeypatch.setattr(backend, 'response_cache', ResponseCache())
+    return client
+
+
+def goal_titles(response):
+    return [goal['title'] for goal in response.get_json()['goals']]
+
+
+def test_a_write_invalidates_only_that_users_reads(client):
+    backend.supabase.load('goals', [{'id': 'g1', 'user_id': 'u1', 'title': 'Walk', 'created': '2024-03-01T08:00:00'},
+                                    {'id': 'g2', 'user_id': 'u2', 'title': 'Swim', 'created': '2024-03-01T08:00:00'}])
+    assert goal_titles(client.get('/goals?user_id=u1')) == ['Walk']
+    assert goal_titles(client.get('/goals?user_id=u2')) == ['Swim']
+    client.post('/goals', json={'user_id': 'u1', 'title': 'Run', 'created': '2024-03-02T08:00:00'})
+    assert goal_titles(client.get('/goals?user_id=u1')) == ['Walk', 'Run']
+    assert goal_titles(client.get('/goals?user_id=u2')) == ['Swim']
+    stats = backend.response_cache.stats()
+    assert stats['hits'] == 1 and stats['invalidations'] == 1
+
+
+def test_if_none_match_gets_304_until_the_data_changes(client):
+    first = client.get('/goals?user_id=u1')
+    etag = first.headers['ETag']
+    again = client.get('/goals?user_id=u1', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.headers['ETag'] == etag and not again.get_data()
+    client.post('/goals', json={'user_id': 'u1', 'title': 'Run'})
+    changed = client.get('/goals?user_id=u1', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and goal_titles(changed) == ['Run'] and changed.headers['ETag'] != etag
+
+
+def test_a_read_that_raced_a_write_is_not_stored():
+    cache = ResponseCache()
+    generation = cache.generation('goals', 'u1')
+    cache.invalidate('goals', 'u1')
+    cache.set('goals', 'u1', (), b'[]', generation)
+    assert cache.get('goals', 'u1', ()) is None
+    cache.set('goals', 'u1', (), b'[]', cache.generation('goals', 'u1'))
+    assert cache.get('goals', 'u1', ()).body == b'[]' and cache.get('goals', 'u2', ()) is None
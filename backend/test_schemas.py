@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from bulk import EntryError, log_row
+from schemas import InvalidRow, TableSchema, load_schemas, parse_schema
+
+SQL = """
+create table if not exists logs (
+  id uuid primary key default uuid_generate_v4(),
+  user_id uuid references users(id) on delete cascade, -- owner
+  date date not null,
+  count integer not null,
+  weight float,
+  done boolean default false,
+  code varchar(4),
+  at timestamp with time zone default now()
+);
+alter table logs add column if not exists "camelCase" text, add column if not exists gone text;
+alter table logs drop column if exists gone;
+create table if not exists totals (
+  user_id uuid references users(id),
+  week date not null,
+  primary key (user_id, week)
+);
+"""
+
+
+@pytest.fixture
+def logs():
+    tables = parse_schema(SQL)
+    return TableSchema('logs', tables['logs'])
+
+
+def test_parse_schema_reads_columns_and_alterations():
+    tables = parse_schema(SQL)
+    assert list(tables['logs']) == ['id', 'user_id', 'date', 'count', 'weight', 'done', 'code', 'at', 'camelCase']
+    assert tables['logs']['code'].length == 4
+    assert tables['logs']['at'].type == 'timestamp with time zone' and tables['logs']['at'].has_default
+    assert tables['totals']['week'].primary_key and tables['totals']['user_id'].primary_key
+
+
+def test_row_coerces_strips_and_trusts_user_id(logs):
+    row = logs.row({'user_id': 'bench-user', 'date': '2024-03-01T08:00:00Z', 'count': '12', 'weight': '80.5',
+                    'done': 'true', 'camelCase': 3, 'unknown': 'dropped'})
+    assert row == {'user_id': 'bench-user', 'date': '2024-03-01', 'count': 12, 'weight': 80.5, 'done': True,
+                   'camelCase': '3'}
+    assert logs.row({'date': '2024-03-01', 'count': 2.0, 'weight': None})['count'] == 2
+
+
+def test_row_rejects_bad_values_together(logs):
+    with pytest.raises(InvalidRow) as info:
+        logs.row({'count': 1.5, 'weight': 'heavy', 'code': 'toolong', 'id': 'x', 'at': 'noon', 'done': 'maybe'})
+    assert info.value.errors == {
+        'count': 'must be an integer', 'weight': 'must be a number', 'code': 'must be at most 4 characters',
+        'id': 'must be a UUID', 'at': 'must be an ISO 8601 timestamp', 'done': 'must be true or false',
+        'date': 'is required',
+    }
+    with pytest.raises(InvalidRow, match='count must be between'):
+        logs.row({'date': '2024-03-01', 'count': 2 ** 31})
+    with pytest.raises(InvalidRow, match='date must not be null'):
+        logs.row({'date': None, 'count': 1})
+
+
+def test_changes_leave_keys_alone(logs):
+    assert logs.changes({'id': 'new', 'user_id': 'someone-else', 'weight': 81, 'extra': 1}) == {'weight': 81}
+    with pytest.raises(InvalidRow, match='no columns to update'):
+        logs.changes({'user_id': 'u1', 'extra': 1})
+    with pytest.raises(InvalidRow, match='count must not be null'):
+        logs.changes({'count': None})
+
+
+def test_bulk_entries_are_checked_against_the_schema(logs):
+    assert log_row({'date': '2024-03-01', 'count': '3', 'bogus': 1}, 'u1', logs) == \
+        {'date': '2024-03-01', 'count': 3, 'user_id': 'u1'}
+    with pytest.raises(EntryError, match='count is required'):
+        log_row({'date': '2024-03-01'}, 'u1', logs)
+
+
+def test_repo_schema_loads():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'supabase_schema.sql')
+    schemas = load_schemas(path)
+    assert {'users', 'goals', 'weight_logs', 'shots', 'side_effects', 'meals', 'water_logs', 'step_logs',
+            'achievements'} <= set(schemas)
+    assert schemas['meals'].row({'user_id': 'u1', 'date': '2024-03-01', 'fruitsVeggies': 2})['fruitsVeggies'] == 2
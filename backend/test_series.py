@@ -0,0 +1,69 @@
+import math
+from datetime import date, timedelta
+
+import pytest
+
+import series as chart
+from series import aggregate, lttb, series, series_args
+
+
+def rows(values, first=date(2024, 1, 1), column='weight'):
+    return [{'id': str(i), 'date': (first + timedelta(days=i)).isoformat(), column: value}
+            for i, value in enumerate(values)]
+
+
+@pytest.fixture(params=['numpy', 'lists'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(chart, 'np', None)
+    return request.param
+
+
+def test_buckets_aggregate_by_week_and_month(backend):
+    # 2024-01-07 is a Sunday, so the first three days fall in the week before it
+    data = rows([1, 2, 3, 4, 5, 6, 7, 8, 9, 10]) + [{'date': '2024-01-02', 'weight': None}]
+    weeks = aggregate(data, 'weight', 'week')
+    assert [date.fromordinal(x).isoformat() for x in weeks['x']] == ['2023-12-31', '2024-01-07']
+    assert weeks['count'] == [6, 4]
+    assert weeks['sum'] == [21, 34]
+    assert weeks['min'] == [1, 7] and weeks['max'] == [6, 10]
+    assert weeks['mean'] == [3.5, 8.5]
+    months = aggregate(rows([1.0] * 40), 'weight', 'month')
+    assert months['count'] == [31, 9]
+
+
+def test_lttb_keeps_the_ends_and_the_spikes(backend):
+    ys = [math.sin(i / 10) for i in range(1000)]
+    ys[333], ys[666] = 50.0, -50.0
+    keep = lttb(list(range(1000)), ys, 60)
+    assert len(keep) == 60
+    assert keep[0] == 0 and keep[-1] == 999
+    assert keep == sorted(set(keep))
+    assert 333 in keep and 666 in keep
+    assert lttb([0, 1, 2], [1, 2, 3], 10) == [0, 1, 2]
+
+
+def test_numpy_and_lists_give_the_same_points(monkeypatch):
+    pytest.importorskip('numpy')
+    data = rows([80 + math.sin(i / 7) * 3 + (i % 5) / 10 for i in range(900)])
+    vectorized = series(data, 'weight', 'day', 120)
+    monkeypatch.setattr(chart, 'np', None)
+    assert series(data, 'weight', 'day', 120) == vectorized
+
+
+def test_series_size_does_not_grow_with_history(backend):
+    points, buckets = series(rows(list(range(3000)), column='count'), 'count', 'day', 200, 'sum')
+    assert buckets == 3000 and len(points) == 200
+    assert points[0] == {'date': '2024-01-01', 'mean': 0, 'min': 0, 'max': 0, 'sum': 0, 'count': 1}
+
+
+def test_series_args():
+    assert series_args({}) == (None, None, 'day', 300)
+    assert series_args({'from': '2024-01-01', 'bucket': 'week', 'points': '5000'}) == \
+        ('2024-01-01', None, 'week', 1000)
+    for args in ({'bucket': 'year'}, {'points': '2'}, {'points': 'x'}, {'from': 'jan'},
+                 {'from': '2024-02-01', 'to': '2024-01-01'}):
+        with pytest.raises(ValueError):
+            series_args(args)
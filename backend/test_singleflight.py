@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+CALLERS = 8
+
+
+def run_callers(flights, key, fn):
+    # Start CALLERS threads on one key and return their results (or exceptions) once fn is released
+    release = threading.Event()
+    results = [None] * CALLERS
+
+    def leader_fn():
+        release.wait(5)
+        return fn()
+
+    def call(i):
+        try:
+            results[i] = flights.do(key, leader_fn)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flights.stats()['coalesced'] < CALLERS - 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_concurrent_identical_reads_make_one_call():
+    flights, upstream = SingleFlight(), []
+    results = run_callers(flights, ('u1', '/goals'), lambda: upstream.append(1) or {'goals': []})
+    assert upstream == [1] and results == [{'goals': []}] * CALLERS
+    assert flights.stats() == {'in_flight': 0, 'calls': 1, 'coalesced': CALLERS - 1, 'errors': 0}
+
+
+def test_an_exception_reaches_every_waiter_and_frees_the_key():
+    flights, error = SingleFlight(), RuntimeError('upstream down')
+
+    def fail():
+        raise error
+
+    assert run_callers(flights, ('u1', '/goals'), fail) == [error] * CALLERS
+    assert flights.stats()['in_flight'] == 0 and flights.stats()['errors'] == 1
+    assert flights.do(('u1', '/goals'), lambda: 'fresh') == 'fresh'
+
+
+def test_forget_starts_a_fresh_call_for_that_user_only():
+    flights, started, release = SingleFlight(), threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'before write'
+
+    thread = threading.Thread(target=flights.do, args=(('u1', '/goals'), slow))
+    thread.start()
+    started.wait(5)
+    flights.forget('u2')
+    assert flights.stats()['in_flight'] == 1
+    flights.forget('u1')
+    assert flights.do(('u1', '/goals'), lambda: 'after write') == 'after write'
+    release.set()
+    thread.join(5)
+    with pytest.raises(ValueError):
+        flights.do(('u1', '/goals'), lambda: int('x'))
+    assert flights.stats()['in_flight'] == 0
@@ -0,0 +1,28 @@
+import app as backend
+
+USER = '6a1f3c1e-2b9d-4c6e-9a57-0d2b8e1f4c3a'
+
+
+def weekly_totals():
+    # Let the background updates land first
+    backend.weekly_totals_executor.submit(lambda: None).result()
+    rows = backend.supabase.table('weekly_totals').select('*').eq('user_id', USER).execute().data
+    return {row['week_start']: (row['meal_protein'], row['meal_fruits_veggies']) for row in rows}
+
+
+def test_editing_a_meal_moves_its_weekly_totals(client):
+    meal = client.post('/meals', json={'user_id': USER, 'date': '2024-03-06', 'protein': 30,
+                                       'fruitsVeggies': 2}).get_json()['meal']
+    client.post('/meals', json={'user_id': USER, 'date': '2024-03-07', 'protein': 10, 'fruitsVeggies': 1})
+    assert weekly_totals() == {'2024-03-03': (40, 3)}
+
+    response = client.put(f"/meals/{meal['id']}", json={'user_id': USER, 'protein': 45, 'fruitsVeggies': 0})
+    assert response.status_code == 200
+    assert weekly_totals() == {'2024-03-03': (55, 1)}
+
+    # Moved into the next week, the meal leaves the old one
+    client.put(f"/meals/{meal['id']}", json={'user_id': USER, 'date': '2024-03-11'})
+    assert weekly_totals() == {'2024-03-03': (10, 1), '2024-03-10': (45, 0)}
+
+    client.delete(f"/meals/{meal['id']}?user_id={USER}")
+    assert weekly_totals() == {'2024-03-03': (10, 1), '2024-03-10': (0, 0)}
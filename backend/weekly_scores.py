@@ -0,0 +1,147 @@
+import logging
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Weekly targets from weekly-score-updates.md: 4.5 servings, 80g protein and 8,000 steps a day
+WEEKLY_TARGETS = {
+    'fruitsVeggies': 4.5 * 7,
+    'protein': 80 * 7,
+    'steps': 8000 * 7,
+}
+
+TOTAL_COLUMNS = ('meal_fruits_veggies', 'meal_protein', 'step_count',
+                 'daily_fruits_veggies', 'daily_protein', 'daily_steps')
+
+# Which row fields feed which running total, per source table
+SOURCE_FIELDS = {
+    'meals': {'meal_fruits_veggies': ('fruitsVeggies', 'fruits_veggies'), 'meal_protein': ('protein',)},
+    'step_logs': {'step_count': ('count',)},
+    'daily_logs': {'daily_fruits_veggies': ('fruitsVeggies', 'fruits_veggies'),
+                   'daily_protein': ('proteinGrams', 'protein_grams'),
+                   'daily_steps': ('steps',)},
+}
+
+
+def week_start(day):
+    # Weeks start on Sunday, matching date-fns startOfWeek on the progress screen
+    if isinstance(day, str):
+        day = date.fromisoformat(day[:10])
+    return day - timedelta(days=(day.weekday() + 1) % 7)
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def row_deltas(table, row, sign=1):
+    deltas = {}
+    for column, fields in SOURCE_FIELDS.get(table, {}).items():
+        value = next((_number(row[field]) for field in fields if field in row), 0.0)
+        if value:
+            deltas[column] = sign * value
+    return deltas
+
+
+def _round(value):
+    # Math.round semantics, so scores match what the app used to compute
+    return int(value + 0.5)
+
+
+def score(totals):
+    """Weekly score from a weekly_totals row.
+
+    daily_logs normally roll up the same meals and steps that are logged on
+    their own, so the two sources are combined with max() rather than summed.
+    """
+    achieved = {
+        'fruitsVeggies': max(_number(totals.get('meal_fruits_veggies')), _number(totals.get('daily_fruits_veggies'))),
+        'protein': max(_number(totals.get('meal_protein')), _number(totals.get('daily_protein'))),
+        'steps': max(_number(totals.get('step_count')), _number(totals.get('daily_steps'))),
+    }
+    percentages = {key: min(100.0, achieved[key] / WEEKLY_TARGETS[key] * 100) for key in WEEKLY_TARGETS}
+    result = {key: _round(value) for key, value in percentages.items()}
+    result['overall'] = _round(sum(percentages.values()) / 3)
+    return result
+
+
+def increments(table, rows, sign=1):
+    """increment_weekly_totals parameters for rows written to table, one per user and week."""
+    grouped = {}
+    for row in rows:
+        if not row.get('user_id') or not row.get('date'):
+            continue
+        deltas = row_deltas(table, row, sign)
+        if not deltas:
+            continue
+        key = (row['user_id'], week_start(row['date']).isoformat())
+        bucket = grouped.setdefault(key, {})
+        for column, value in deltas.items():
+            bucket[column] = bucket.get(column, 0) + value
+    return [{'p_user_id': user_id, 'p_week_start': start, 'p_deltas': deltas}
+            for (user_id, start), deltas in grouped.items()]
+
+
+def weekly_scores(first, last, rows):
+    """Scores for every week from first to last (both week starts) given stored weekly_totals rows."""
+    stored = {row['week_start'][:10]: row for row in rows or []}
+    scores = []
+    current = first
+    while current <= last:
+        totals = stored.get(current.isoformat(), {})
+        scores.append({
+            'week_start': current.isoformat(),
+            'week_end': (current + timedelta(days=6)).isoformat(),
+            'totals': {column: _number(totals.get(column)) for column in TOTAL_COLUMNS},
+            **score(totals),
+        })
+        current += timedelta(weeks=1)
+    return scores
+
+
+def rebuilt_totals(user_id, rows_by_table):
+    """weekly_totals rows recomputed from a user's rows in each SOURCE_FIELDS table."""
+    totals = {}
+    for table, rows in rows_by_table.items():
+        for row in rows or []:
+            if not row.get('date'):
+                continue
+            bucket = totals.setdefault(week_start(row['date']).isoformat(), dict.fromkeys(TOTAL_COLUMNS, 0))
+            for column, value in row_deltas(table, row).items():
+                bucket[column] += value
+    return [{'user_id': user_id, 'week_start': start, **columns} for start, columns in totals.items()]
+
+
+class WeeklyTotals:
+    """Per-user, per-week running totals kept in the weekly_totals table.
+
+    Writes apply deltas through the increment_weekly_totals function so
+    concurrent workers add atomically; reads touch one row per week.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def record(self, table, rows, sign=1):
+        for params in increments(table, rows, sign):
+            self._client.rpc('increment_weekly_totals', params).execute()
+
+    def weeks(self, user_id, first, last):
+        """Scores for every week from the one containing first to the one containing last."""
+        first, last = week_start(first), week_start(last)
+        res = self._client.table('weekly_totals').select('*').eq('user_id', user_id) \
+            .gte('week_start', first.isoformat()).lte('week_start', last.isoformat()).execute()
+        return weekly_scores(first, last, res.data)
+
+    def rebuild(self, user_id):
+        """Recompute a user's totals from their logs, replacing what is stored."""
+        rows_by_table = {table: self._client.table(table).select('*').eq('user_id', user_id).execute().data
+                         for table in SOURCE_FIELDS}
+        totals = rebuilt_totals(user_id, rows_by_table)
+        self._client.table('weekly_totals').delete().eq('user_id', user_id).execute()
+        if totals:
+            self._client.table('weekly_totals').insert(totals).execute()
+        return len(totals)
@@ -54,6 +54,9 @@ create table if not exists shots (
   notes text
 );
 
+-- Shot details the app records
+alter table shots add column if not exists location text, add column if not exists medication text;
+
 -- SIDE EFFECTS TABLE
 create table if not exists side_effects (
   id uuid primary key default uuid_generate_v4(),
@@ -79,6 +82,10 @@ create table if not exists meals (
   notes text
 );
 
+-- Meal details the app records; fruitsVeggies counts toward the weekly score
+alter table meals add column if not exists description text, add column if not exists "fruitsVeggies" float,
+  add column if not exists "imageUri" text;
+
 -- WATER LOGS TABLE
 create table if not exists water_logs (
   id uuid primary key default uuid_generate_v4(),
@@ -96,6 +103,15 @@ create table if not exists step_logs (
   count integer not null
 );
 
+-- CHAT HISTORY TABLE (coach conversations)
+create table if not exists chat_history (
+  id uuid primary key default uuid_generate_v4(),
+  user_id uuid references users(id) on delete cascade,
+  message text not null,
+  is_user boolean not null default true,
+  timestamp timestamp with time zone default now()
+);
+
 -- ACHIEVEMENTS TABLE (optional)
 create table if not exists achievements (
   id uuid primary key default uuid_generate_v4(),
@@ -108,3 +124,73 @@ create table if not exists achievements (
   category text,
   points integer
 );
+
+-- The app identifies its built-in achievements by code
+alter table achievements add column if not exists achievement_code text;
+
+-- WEEKLY TOTALS TABLE (running per-week sums behind /scores/weekly, maintained by the backend)
+create table if not exists weekly_totals (
+  user_id uuid references users(id) on delete cascade,
+  week_start date not null,
+  meal_fruits_veggies float not null default 0,
+  meal_protein float not null default 0,
+  step_count float not null default 0,
+  daily_fruits_veggies float not null default 0,
+  daily_protein float not null default 0,
+  daily_steps float not null default 0,
+  updated_at timestamp with time zone default now(),
+  primary key (user_id, week_start)
+);
+
+-- Atomically add deltas to one user's week, creating the row on first write
+create or replace function increment_weekly_totals(p_user_id uuid, p_week_start date, p_deltas jsonb)
+returns void
+language sql
+as $$
+  insert into weekly_totals as t (user_id, week_start, meal_fruits_veggies, meal_protein, step_count,
+                                  daily_fruits_veggies, daily_protein, daily_steps)
+  values (p_user_id, p_week_start,
+          coalesce((p_deltas->>'meal_fruits_veggies')::float, 0),
+          coalesce((p_deltas->>'meal_protein')::float, 0),
+          coalesce((p_deltas->>'step_count')::float, 0),
+          coalesce((p_deltas->>'daily_fruits_veggies')::float, 0),
+          coalesce((p_deltas->>'daily_protein')::float, 0),
+          coalesce((p_deltas->>'daily_steps')::float, 0))
+  on conflict (user_id, week_start) do update set
+    meal_fruits_veggies = t.meal_fruits_veggies + excluded.meal_fruits_veggies,
+    meal_protein = t.meal_protein + excluded.meal_protein,
+    step_count = t.step_count + excluded.step_count,
+    daily_fruits_veggies = t.daily_fruits_veggies + excluded.daily_fruits_veggies,
+    daily_protein = t.daily_protein + excluded.daily_protein,
+    daily_steps = t.daily_steps + excluded.daily_steps,
+    updated_at = now();
+$$;
+
+-- GAMIFICATION STATE TABLE (per-user streaks, counters and unlocks behind /streaks and /achievements,
+-- maintained by the backend; version guards concurrent updates)
+create table if not exists gamification_state (
+  user_id uuid primary key references users(id) on delete cascade,
+  state jsonb not null default '{}',
+  version integer not null default 1,
+  updated_at timestamp with time zone default now()
+);
+
+-- INDEXES for the per-user, date-ranged log queries. The list routes filter on user_id and a
+-- from/to date range and page in (date, id) order, so each index covers the filter and the order.
+create index if not exists weight_logs_user_id_date_idx on weight_logs (user_id, date, id);
+create index if not exists shots_user_id_date_idx on shots (user_id, date, id);
+create index if not exists side_effects_user_id_date_idx on side_effects (user_id, date, id);
+create index if not exists meals_user_id_date_idx on meals (user_id, date, id);
+create index if not exists water_logs_user_id_date_idx on water_logs (user_id, date, id);
+create index if not exists step_logs_user_id_date_idx on step_logs (user_id, date, id);
+
+-- progress and daily_logs are created outside this file; index them where they exist
+do $$
+begin
+  if to_regclass('public.progress') is not null then
+    create index if not exists progress_user_id_date_idx on progress (user_id, date, id);
+  end if;
+  if to_regclass('public.daily_logs') is not null then
+    create index if not exists daily_logs_user_id_date_idx on daily_logs (user_id, date, id);
+  end if;
+end $$;